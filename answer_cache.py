@@ -0,0 +1,141 @@
+# answer_cache.py - 近似问题的语义答案缓存
+"""
+很多用户问的是同一个问题的不同说法，每次都要重新检索、过滤并完整调用一次LLM。
+这里把最近回答过的问题向量放在进程内的小型向量索引中（归一化后组成矩阵，一次矩阵乘法算出余弦相似度），
+新问题与某个已缓存问题的相似度达到阈值时直接复用该答案。
+
+每个条目保存:
+- 答案文本
+- 引用的文档块（chunk_key、file_id 以及文档块本身，用于照常进行奖励结算）
+- RAG决策（是否使用RAG、原因、置信度）
+
+条目有TTL，容量满时淘汰最久未用的条目；引用的文件重新入库时按 file_id 失效，重建知识库时全部清空。
+"""
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """按问题向量检索的答案缓存
+
+    Args:
+        threshold: 命中所需的最低余弦相似度
+        ttl: 条目有效期（秒）
+        max_entries: 最多缓存的答案数
+    """
+
+    def __init__(self, threshold=0.95, ttl=1800, max_entries=1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 条目编号 -> 条目字典
+        self._next_id = 0
+        self._matrix = None            # 与 _matrix_ids 对应的归一化问题向量矩阵，条目变化后重建
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).flatten()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _remove(self, entry_id):
+        self._entries.pop(entry_id, None)
+        self._matrix = None
+
+    def _purge_expired(self, now):
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry['expires_at'] <= now]:
+            self._remove(entry_id)
+
+    def lookup(self, question_embedding):
+        """返回 (条目, 相似度)；未命中时返回 (None, 最高相似度)"""
+        vector = self._normalize(question_embedding)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            if vector is None or not self._entries:
+                self._stats['misses'] += 1
+                return None, 0.0
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[entry_id]['vector'] for entry_id in self._matrix_ids])
+            if self._matrix.shape[1] != vector.shape[0]:
+                self._stats['misses'] += 1
+                return None, 0.0
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats['misses'] += 1
+                return None, similarity
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self._stats['hits'] += 1
+            return self._entries[entry_id], similarity
+
+    def store(self, question, question_embedding, answer, docs, chunk_keys, decision):
+        """缓存一次完整的回答
+
+        Args:
+            question: 原始问题（仅用于日志和排查）
+            question_embedding: 问题向量
+            answer: 答案文本
+            docs: 引用的文档块
+            chunk_keys: 与 docs 对应的 chunk_key
+            decision: (should_use_rag, rag_reason, confidence)
+        """
+        vector = self._normalize(question_embedding)
+        if vector is None:
+            return
+        with self._lock:
+            self._entries[self._next_id] = {
+                'question': question,
+                'vector': vector,
+                'answer': answer,
+                'docs': list(docs),
+                'chunk_keys': list(chunk_keys),
+                'file_ids': {doc.metadata.get('file_id') for doc in docs},
+                'decision': tuple(decision),
+                'expires_at': time.monotonic() + self.ttl
+            }
+            self._next_id += 1
+            self._matrix = None
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate_files(self, file_ids, include_uncited=False):
+        """丢弃引用了这些文件的答案
+
+        include_uncited 为 True 时同时丢弃没有引用任何文档的答案
+        （知识库加入新内容后，这些问题可能改为使用RAG回答）
+        """
+        file_ids = set(file_ids)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items()
+                     if entry['file_ids'] & file_ids or (include_uncited and not entry['file_ids'])]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self._stats['invalidations'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._matrix = None
+            self._stats['invalidations'] += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
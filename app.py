@@ -11,11 +11,13 @@ from flask import Flask, request, jsonify, Response, render_template, session, r
 from flask_socketio import SocketIO, emit
 import chardet
 import time
+import threading
 from langchain_core.documents import Document
 import uuid
 from werkzeug.utils import secure_filename
 import math
 import hashlib
+import functools
 from datetime import datetime
 
 # ==================== 导入必要的库 ====================
@@ -27,11 +29,36 @@ from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_chroma import Chroma
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_community.chat_models import ChatTongyi
+import dashscope
 
 from flask_cors import CORS
 
 # ipfs功能调用
 from upload_ipfs import upload_text_and_get_preview_url
+from transaction_log import TransactionLog
+from transaction_index import TransactionIndex
+import rollups
+from file_store import (FileStore, FILE_COLUMNS, create_indexes as create_file_indexes,
+                        sync_from_json as sync_files_from_json, migrate_content_to_blobs)
+from blob_store import BlobStore
+from user_directory import UserDirectory, sync_from_json as sync_users_from_json
+from settlement import settle_rewards
+from db_pool import ConnectionPool
+from audit_log import AuditLog, page_after
+import search_index
+import community_stats
+import hybrid_retrieval
+from hybrid_retrieval import HybridRetriever
+from embedding_cache import CachedEmbeddings
+from batch_embedder import BatchEmbedder
+from deadline_pool import DeadlinePool
+from listwise_rerank import listwise_relevance_check
+from relevance_cache import RelevanceVerdictCache
+from answer_cache import SemanticAnswerCache
+from confirmation_broker import ConfirmationBroker
+from speculative_generation import SpeculativeAnswer
+from batch_scoring import score_candidates, CONCEPT_KEYWORDS, CONCEPTUAL_MARKERS
+from pagination import InvalidPageRequest, parse_limit, parse_fields, project, keyset_clause, encode_cursor
 
 
 app = Flask(__name__)
@@ -51,11 +78,56 @@ SHARED_FOLDER = 'SHARED_CONTENT'
 USER_DB_FILE = 'users.json'
 FILES_DB_FILE = 'files.json'
 TRANSACTIONS_DB_FILE = 'transactions.json'
+TRANSACTION_LOG_DIR = 'transaction_log'
+AUDIT_LOG_DIR = 'transaction_logs'
+AUDIT_LEGACY_FILE = 'transaction_logs.json'
+BLOB_FOLDER = 'blobs'
 SQLITE_DB_FILE = 'talktoearn.db'
+EMBEDDING_CACHE_DB_FILE = 'embedding_cache.db'
+COMMUNITY_STATS_RECONCILE_INTERVAL = 600  # 社区统计对账间隔（秒）
+STAKE_TIME_SORT = "COALESCE(stake_time, '')"  # 质押记录分页排序列，stake_time 为空的记录排在最后
+
+# ==================== 混合检索配置 ====================
+HYBRID_VECTOR_K = 10   # 向量检索召回数量
+HYBRID_LEXICAL_K = 10  # 关键词检索召回数量
+HYBRID_TOP_K = 6       # RRF融合后交给相关性过滤的候选数量
+
+# ==================== 入库嵌入配置 ====================
+EMBED_BATCH_SIZE = 25      # DashScope 单次请求最多25条文本
+EMBED_MAX_CONCURRENCY = 4  # 同时进行的嵌入请求数
+EMBED_MAX_RETRIES = 5      # 每批临时性错误的最多重试次数
+
+# ==================== 相关性判断配置 ====================
+RELEVANCE_MAX_WORKERS = 4           # 并发进行的LLM相关性判断数
+RELEVANCE_DEADLINE_SECONDS = 8.0    # 一个问题所有LLM相关性判断的总时限
+RELEVANCE_FALLBACK_THRESHOLD = 0.5  # 超时未判断的文档块仅按相似度判断的阈值
+# LLM相关性判断方式: 'per_doc' 每个候选单独调用一次LLM；'listwise' 全部候选一次调用判断
+RELEVANCE_MODE = os.getenv('RELEVANCE_MODE', 'per_doc')
+LISTWISE_MAX_CHARS = 500            # listwise 提示词中每个候选截断后的长度
+RELEVANCE_CACHE_TTL = 3600          # LLM相关性判断结果的缓存有效期（秒）
+RELEVANCE_CACHE_SIZE = 20000        # 最多缓存的判断结果数
+
+# ==================== 答案缓存配置 ====================
+ANSWER_CACHE_THRESHOLD = 0.95  # 新问题与已缓存问题的向量余弦相似度达到该值时复用答案
+ANSWER_CACHE_TTL = 1800        # 答案缓存有效期（秒）
+ANSWER_CACHE_SIZE = 1000       # 最多缓存的答案数
+
+# ==================== 投机生成配置 ====================
+# 为 'true' 时在等待转账确认的同时开始生成回答，确认后立即输出；取消或超时则丢弃并记录开销
+SPECULATIVE_GENERATION = os.getenv('SPECULATIVE_GENERATION', 'false') == 'true'
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(SHARED_FOLDER, exist_ok=True)
 
+# 交易记录追加日志（首次启动时自动导入旧的transactions.json）
+transaction_log = TransactionLog(TRANSACTION_LOG_DIR, legacy_json=TRANSACTIONS_DB_FILE)
+# 交易内存索引：启动时构建一次，之后随交易日志追加增量更新
+transaction_index = TransactionIndex.from_log(transaction_log)
+# 交易审计日志：后台线程追加写入，按日期/大小轮转并压缩旧分段（首次启动时导入旧的transaction_logs.json）
+audit_log = AuditLog(AUDIT_LOG_DIR, legacy_json=AUDIT_LEGACY_FILE)
+# 文档正文按内容哈希存放，元数据中只保留哈希、大小和预览
+blob_store = BlobStore(BLOB_FOLDER)
+
 # ==================== 阿里Qwen API 配置 ====================
 # 从环境变量获取API密钥，支持QWEN_API_KEY和DASHSCOPE_API_KEY
 API_KEY = os.getenv('QWEN_API_KEY', os.getenv('DASHSCOPE_API_KEY', 'your-api-key'))
@@ -65,10 +137,29 @@ print(f"🚨 API_KEY加载结果: {API_KEY[:8]}...{API_KEY[-4:]}" if len(API_KEY
 print(f"🚨 环境变量QWEN_API_KEY是否存在: {'是' if os.getenv('QWEN_API_KEY') else '否'}")
 print(f"🚨 环境变量DASHSCOPE_API_KEY是否存在: {'是' if os.getenv('DASHSCOPE_API_KEY') else '否'}")
 
-# 初始化Qwen嵌入模型
-embeddings = DashScopeEmbeddings(
-    model="text-embedding-v2",
-    dashscope_api_key=API_KEY
+# 设置后所有DashScope请求改发到该地址，例如本地替身服务 mock_dashscope_server.py（离线测试、压测）
+DASHSCOPE_BASE_URL = os.getenv('DASHSCOPE_BASE_URL')
+if DASHSCOPE_BASE_URL:
+    dashscope.base_http_api_url = DASHSCOPE_BASE_URL
+    print(f"🧪 DashScope请求地址: {DASHSCOPE_BASE_URL}")
+
+# 初始化Qwen嵌入模型，外层按文本哈希缓存向量，相同文本只请求一次API
+EMBEDDING_MODEL = "text-embedding-v2"
+embeddings = CachedEmbeddings(
+    DashScopeEmbeddings(
+        model=EMBEDDING_MODEL,
+        dashscope_api_key=API_KEY
+    ),
+    model=EMBEDDING_MODEL,
+    path=EMBEDDING_CACHE_DB_FILE
+)
+
+# 入库时分批并发嵌入文档块
+ingest_embedder = BatchEmbedder(
+    embeddings,
+    batch_size=EMBED_BATCH_SIZE,
+    max_concurrency=EMBED_MAX_CONCURRENCY,
+    max_retries=EMBED_MAX_RETRIES
 )
 
 # 初始化Qwen聊天模型
@@ -165,6 +256,31 @@ def init_db():
     )
     ''')
     
+    # 质押记录按钱包地址/时间倒序分页的索引（stake_time 为空的记录按空字符串排序）
+    cursor.execute('DROP INDEX IF EXISTS idx_stakes_time_id')
+    cursor.execute('DROP INDEX IF EXISTS idx_stakes_wallet_time_id')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_stakes_sort_id ON stakes ({STAKE_TIME_SORT}, id)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_stakes_wallet_sort_id ON stakes (wallet_address, {STAKE_TIME_SORT}, id)')
+    
+    # 按用户查询上传/引用记录的索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_uploaded_files_user_id ON uploaded_files (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_referenced_files_user_id ON referenced_files (user_id)')
+    
+    # files表常用查询列的索引
+    create_file_indexes(cursor)
+    
+    # 创建按日/月的收益汇总表
+    rollups.create_tables(cursor)
+    
+    # 创建文件全文索引表
+    search_index.create_table(cursor)
+    
+    # 创建社区统计计数表
+    community_stats.create_table(cursor)
+    
+    # 创建RAG文档块的关键词索引
+    hybrid_retrieval.create_tables(cursor)
+    
     conn.commit()
     conn.close()
 
@@ -249,6 +365,42 @@ def migrate_from_json_to_db():
                 ))
                 print(f"✅ 已迁移文件: {file_id} - {file_info['filename']}")
     
+    # 切换到SQLite前引用次数、收益等计数只写入了files.json，这里一次性同步（用user_version标记已完成）
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 1:
+        if os.path.exists(FILES_DB_FILE):
+            synced = sync_files_from_json(conn, FILES_DB_FILE)
+            print(f"✅ 已从files.json同步 {synced} 个文件元数据到数据库")
+        cursor.execute('PRAGMA user_version = 1')
+    
+    # 旧版connect_wallet分别写users.json和users表，补录users表中缺失的用户
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 2:
+        if os.path.exists(USER_DB_FILE):
+            synced = sync_users_from_json(conn, USER_DB_FILE)
+            print(f"✅ 已从users.json补录 {synced} 个用户到数据库")
+        cursor.execute('PRAGMA user_version = 2')
+    
+    # 文档正文从files表移入BlobStore，files表只保留content_hash/content_size
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 3:
+        moved = migrate_content_to_blobs(conn, blob_store)
+        print(f"✅ 已将 {moved} 个文档正文迁移到内容寻址存储")
+        cursor.execute('PRAGMA user_version = 3')
+    
+    # 为已有文件建立全文索引
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 4:
+        rows = cursor.execute('SELECT id, filename, user_id, content_hash, content FROM files').fetchall()
+        indexed = search_index.rebuild(conn, (
+            (file_id, filename, owner_id, blob_store.get(content_hash) or content or '')
+            for file_id, filename, owner_id, content_hash, content in rows
+        ))
+        print(f"✅ 已为 {indexed} 个文件建立全文索引")
+        cursor.execute('PRAGMA user_version = 4')
+    
+    # 社区统计计数表首次按files表汇总初始化
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 5:
+        community_stats.reconcile(conn)
+        print("✅ 社区统计计数已初始化")
+        cursor.execute('PRAGMA user_version = 5')
+    
     conn.commit()
     conn.close()
 
@@ -257,13 +409,100 @@ init_db()
 # 从JSON迁移数据到数据库
 migrate_from_json_to_db()
 
+def backfill_rollups_if_needed():
+    """首次升级时从交易日志回填一次汇总表（用user_version标记已完成）"""
+    conn = sqlite3.connect(SQLITE_DB_FILE)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] < 6:
+            # 按文件的汇总表没有读取方，已不再维护
+            conn.execute('DROP TABLE IF EXISTS file_earnings_rollup')
+            total = rollups.backfill(conn, transaction_log.iter_all())
+            print(f"✅ 收益汇总表回填完成，共 {total} 条交易")
+            conn.execute('PRAGMA user_version = 6')
+            conn.commit()
+    finally:
+        conn.close()
+
+backfill_rollups_if_needed()
+
 # ==================== 用户管理系统 ====================
 
+# SQLite连接池：每个线程复用一条WAL模式的连接
+db_pool = ConnectionPool(SQLITE_DB_FILE)
+
 # 数据库连接辅助函数
 def get_db_connection():
-    conn = sqlite3.connect(SQLITE_DB_FILE)
-    conn.row_factory = sqlite3.Row  # 返回字典形式的行
-    return conn
+    # 返回当前线程复用的连接句柄，conn.close()只会回滚未提交事务并归还，不会真正关闭；
+    # 有多个出口的调用方使用 with db_pool.borrow() as conn
+    return db_pool.connection()
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """请求结束时回滚遗留的未提交事务，避免长期占用写锁"""
+    db_pool.release()
+
+# 文件元数据：SQLite files表 + 进程内写穿缓存
+file_store = FileStore(get_db_connection, blob_store)
+
+# 定期按files表对账社区统计计数
+community_stats.start_reconciler(get_db_connection, COMMUNITY_STATS_RECONCILE_INTERVAL)
+
+# RAG混合检索：向量检索与文档块关键词检索并行，RRF融合
+hybrid_retriever = HybridRetriever(
+    lambda: vector_store, get_db_connection, embeddings,
+    vector_k=HYBRID_VECTOR_K, lexical_k=HYBRID_LEXICAL_K, top_k=HYBRID_TOP_K
+)
+
+# LLM相关性判断结果缓存：按 (规范化问题, 文档块) 缓存，文档块重新入库时失效
+relevance_cache = RelevanceVerdictCache(ttl=RELEVANCE_CACHE_TTL, max_entries=RELEVANCE_CACHE_SIZE)
+
+# 语义答案缓存：近似问题直接复用答案，引用的文件重新入库时失效
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE
+)
+
+def index_rag_chunks(docs):
+    """把写入向量库的文档块同步写入关键词索引"""
+    try:
+        conn = get_db_connection()
+        hybrid_retrieval.index_chunks(conn, docs)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"⚠️ 文档块关键词索引写入失败: {e}")
+    file_ids = {doc.metadata.get('file_id') for doc in docs}
+    relevance_cache.invalidate_files(file_ids)
+    answer_cache.invalidate_files(file_ids, include_uncited=True)
+
+def cache_answer(question, question_embedding, answer, relevant_docs, decision):
+    """把一次完整生成的回答写入语义答案缓存"""
+    if question_embedding is None or not answer:
+        return
+    try:
+        answer_cache.store(
+            question, question_embedding, answer, relevant_docs,
+            [hybrid_retrieval.doc_key(doc) for doc in relevant_docs], decision
+        )
+    except Exception as e:
+        print(f"⚠️ 答案缓存写入失败: {e}")
+
+def rebuild_rag_chunk_index():
+    """按当前向量库全量重建文档块关键词索引"""
+    if not vector_store:
+        return
+    try:
+        conn = get_db_connection()
+        total = hybrid_retrieval.rebuild_from_collection(conn, vector_store._collection)
+        conn.commit()
+        conn.close()
+        relevance_cache.clear()
+        answer_cache.clear()
+        print(f"✅ 文档块关键词索引已重建，共 {total} 块")
+    except Exception as e:
+        print(f"⚠️ 文档块关键词索引重建失败: {e}")
+
+# 用户目录：SQLite users表 + 热点钱包LRU缓存
+user_directory = UserDirectory(get_db_connection)
 
 # 替代原来的load_users函数
 def get_user(user_id):
@@ -272,12 +511,6 @@ def get_user(user_id):
     conn.close()
     return user
 
-def load_users():
-    if os.path.exists(USER_DB_FILE):
-        with open(USER_DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
 # 替代原来的save_users函数
 def update_user(user_id, **kwargs):
     conn = get_db_connection()
@@ -291,11 +524,6 @@ def update_user(user_id, **kwargs):
     conn.commit()
     conn.close()
 
-def save_users(users):
-    with open(USER_DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
-    # print("save_user")
-
 def add_user(user_id, password_hash, coin_balance=1.0, total_earned=0.0, total_spent=0.0, registration_time=None, wallet_account=None):
     # print("add_add_user")
     conn = get_db_connection()
@@ -312,22 +540,6 @@ def add_user(user_id, password_hash, coin_balance=1.0, total_earned=0.0, total_s
     conn.commit()
     conn.close()
 
-def add_user_list(user_id):
-    # print("add_user")
-    users = load_users()
-    users[user_id] = {
-        'password_hash': hash_password(123456),
-        'coin_balance': 1.0,
-        'total_earned': 0.0,  # 🎯 确保初始化为0
-        'total_spent': 0.0,   # 🎯 确保初始化为0
-        'registration_time': datetime.now().isoformat(),
-        'uploaded_files': [],
-        'referenced_files': []  # 🎯 确保这个字段存在
-    }
-    # print("load_user ")
-    save_users(users)
-    
-
 # 上传文件相关函数
 def add_uploaded_file(user_id, file_id):
     conn = get_db_connection()
@@ -374,25 +586,20 @@ def get_referenced_files(user_id):
     conn.close()
     return refs
 
-def load_files():
-    if os.path.exists(FILES_DB_FILE):
-        with open(FILES_DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+def get_today_stats(user_id):
+    """从收益汇总表读取用户今日的 (奖励收益, 文件被引用次数)"""
+    conn = get_db_connection()
+    day = rollups.get_user_rollup(conn, user_id, 'day', datetime.now().date().isoformat())
+    conn.close()
+    return day['earned'], day['reference_count']
 
-def save_files(files):
-    with open(FILES_DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(files, f, ensure_ascii=False, indent=2)
+def load_files():
+    # 从files表的读缓存返回全部文件元数据（files.json仅作为可选导出，见file_store.py）
+    return file_store.all()
 
 def load_transactions():
-    if os.path.exists(TRANSACTIONS_DB_FILE):
-        with open(TRANSACTIONS_DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
-
-def save_transactions(transactions):
-    with open(TRANSACTIONS_DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(transactions, f, ensure_ascii=False, indent=2)
+    # 全量读取仅用于离线统计，按用户/文件/时间查询请使用transaction_log的索引接口
+    return list(transaction_log.iter_all())
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -425,31 +632,15 @@ def authenticate_user(user_id, password):
     return True, "登录成功"
 
 def get_user_stats(user_id):
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
-    
-    if not user:
-        conn.close()
-        return None
-    
-    # 获取上传文件数量
-    uploaded_files_count = conn.execute('SELECT COUNT(*) FROM uploaded_files WHERE user_id = ?', (user_id,)).fetchone()[0]
-    conn.close()
-    
-    # 获取交易数据
-    transactions = load_transactions()
-    today = datetime.now().date()
+    with db_pool.borrow() as conn:
+        user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        if not user:
+            return None
+        # 获取上传文件数量
+        uploaded_files_count = conn.execute('SELECT COUNT(*) FROM uploaded_files WHERE user_id = ?', (user_id,)).fetchone()[0]
     
-    today_earned = 0.0
-    today_references = 0
-    
-    for tx in transactions:
-        tx_time = datetime.fromisoformat(tx['timestamp']).date()
-        if tx_time == today:
-            if tx['type'] == 'reward' and tx['to_user'] == user_id:
-                today_earned += tx['amount']
-            elif tx['type'] == 'reference' and tx['file_owner'] == user_id:
-                today_references += 1
+    # 从汇总表获取今日数据
+    today_earned, today_references = get_today_stats(user_id)
     
     return {
         'coin_balance': user['coin_balance'],
@@ -461,24 +652,11 @@ def get_user_stats(user_id):
     }
 
 def get_user_status(user_id):
-    users = load_users()
-    if user_id not in users:
+    user = get_user(user_id)
+    if not user:
         return None
     
-    user = users[user_id]
-    transactions = load_transactions()
-    today = datetime.now().date()
-    
-    today_earned = 0.0
-    today_references = 0
-    
-    for tx in transactions:
-        tx_time = datetime.fromisoformat(tx['timestamp']).date()
-        if tx_time == today:
-            if tx['type'] == 'reward' and tx['to_user'] == user_id:
-                today_earned += tx['amount']
-            elif tx['type'] == 'reference' and tx['file_owner'] == user_id:
-                today_references += 1
+    today_earned, today_references = get_today_stats(user_id)
     
     return {
         'coin_balance': user['coin_balance'],
@@ -486,7 +664,7 @@ def get_user_status(user_id):
         'total_spent': user['total_spent'],
         'today_earned': today_earned,
         'today_references': today_references,
-        'uploaded_files_count': len(user['uploaded_files'])
+        'uploaded_files_count': len(get_uploaded_files(user_id))
     }
 
 
@@ -504,33 +682,11 @@ def connect_wallet():
         return jsonify({'success': False, 'message': '钱包地址不能为空'})
     
 
-    #检查用户是否在列表
-    users = load_users()
-    user_id = wallet_address
-    password = '123456'
-    
-    if user_id in users:
-        print("钱包用户已在列表")
-    else:
-        print("新用户创建")
-        users[user_id] = {
-        'password_hash': hash_password(password),
-        'coin_balance': 1.0,
-        'total_earned': 0.0,  #初始化为0
-        'total_spent': 0.0,   # 初始化为0
-        'registration_time': datetime.now().isoformat(),
-        'uploaded_files': [],
-        'referenced_files': []  #这个字段存在
-        } 
-        save_users(users)
-
     # 检查钱包地址是否已存在
-    conn = get_db_connection()
-    existing_user = conn.execute('SELECT * FROM users WHERE wallet_account = ?', (wallet_address,)).fetchone()
+    existing_user = user_directory.find_by_wallet(wallet_address)
     
     if existing_user:
         # 钱包地址已存在，返回用户信息
-        conn.close()
         return jsonify({
             'success': True,
             'message': '钱包已连接',
@@ -545,20 +701,10 @@ def connect_wallet():
         user_id = wallet_address
         password = '123456'
         
-        # 检查 user_id 是否已存在
-        user_exists = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
-        if user_exists:
-            conn.close()
+        # 创建新用户并绑定钱包地址，user_id 已存在时注册失败
+        if not user_directory.register(user_id, hash_password(password), wallet_account=wallet_address):
             return jsonify({'success': False, 'message': '用户ID已存在'})
         
-        # 创建新用户
-        add_user(user_id, hash_password(password))
-        
-        # 更新钱包地址
-        update_user(user_id, wallet_account=wallet_address)
-        
-        conn.close()
-        
         return jsonify({
             'success': True,
             'message': '钱包已连接并创建新用户',
@@ -567,35 +713,19 @@ def connect_wallet():
             'default_password': password  # 提示用户使用默认密码登录
         })
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'连接钱包失败: {str(e)}'})
 
 
 def calculate_user_earnings(user_id):
     """重新计算用户的总收益 - 修复统计问题"""
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    with db_pool.borrow() as conn:
+        user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
     
     if not user:
-        conn.close()
         return 0.0, 0.0, 0
     
-    transactions = load_transactions()
-    
-    total_earned = 0.0
-    total_spent = 0.0
-    reference_count = 0
-    
-    # 重新计算所有交易
-    for tx in transactions:
-        # 计算收益（奖励和引用）
-        if tx['to_user'] == user_id and tx['type'] in ['reward', 'reference']:
-            total_earned += tx['amount']
-            if tx['type'] == 'reference':
-                reference_count += 1
-        # 计算支出
-        elif tx['from_user'] == user_id and tx['type'] == 'spend':
-            total_spent += tx['amount']
+    # 收益（奖励和引用）与支出直接取交易索引中的累计值
+    total_earned, total_spent, reference_count = transaction_index.user_totals(user_id)
     
     # 确保余额正确
     initial_balance = 1.0  # 注册时赠送的1coin
@@ -604,7 +734,6 @@ def calculate_user_earnings(user_id):
     
     # 更新用户数据
     update_user(user_id, total_earned=total_earned, total_spent=total_spent, coin_balance=calculated_balance)
-    conn.close()
 
 
 
@@ -616,8 +745,6 @@ def calculate_user_earnings(user_id):
 
 def record_transaction(tx_type, from_user, to_user, amount, file_owner=None, file_id=None, question=None):
     """修复交易记录函数 - 确保余额正确更新"""
-    transactions = load_transactions()
-    
     transaction = {
         'id': str(uuid.uuid4()),
         'type': tx_type,
@@ -630,8 +757,7 @@ def record_transaction(tx_type, from_user, to_user, amount, file_owner=None, fil
         'timestamp': datetime.now().isoformat()
     }
     
-    transactions.append(transaction)
-    save_transactions(transactions)
+    transaction_log.append(transaction)
     
     print(f"💾 记录交易: {tx_type}, 从 {from_user} 到 {to_user}, 金额 {amount:.8f}")
     
@@ -656,6 +782,8 @@ def record_transaction(tx_type, from_user, to_user, amount, file_owner=None, fil
         ''', (amount, amount, to_user))
         print(f"🎁 用户 {to_user} 获得奖励 {amount:.8f}")
     
+    # 收益汇总表与余额在同一事务中更新
+    rollups.apply_transactions(conn, [transaction])
     conn.commit()
     conn.close()
     
@@ -669,16 +797,12 @@ def record_transaction(tx_type, from_user, to_user, amount, file_owner=None, fil
 
 @app.route('/profile')
 def user_profile():
-    users = load_users()
     wallet_address = request.args.get('wallet_address', '').strip()
     print("wallet_address:", wallet_address)
 
-    print("wallet_address:", wallet_address)
-
-    if wallet_address not in users:
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
         return jsonify({'success': False, 'message': '钱包未注册，请先连接钱包'})
-    
-    user_id = wallet_address
 
     
     # 🎯 重新计算用户收益确保数据准确
@@ -697,46 +821,23 @@ def user_profile():
     user_dict['uploaded_files'] = get_uploaded_files(user_id)
     user_dict['referenced_files'] = get_referenced_files(user_id)
     
-    transactions = load_transactions()
-    
-    # 获取用户的交易记录
-    user_transactions = []
-    for tx in transactions:
-        if tx['from_user'] == user_id or tx['to_user'] == user_id:
-            user_transactions.append(tx)
-    
-    # 按时间倒序排列，取最近20条
-    user_transactions.sort(key=lambda x: x['timestamp'], reverse=True)
-    recent_transactions = user_transactions[:20]
+    # 获取用户的交易记录，按时间倒序取最近20条
+    recent_transactions = transaction_index.recent(user_id, 20)
     
     # 获取用户文件引用统计
     user_files = search_files(user_id=user_id)
     reference_stats = []
     
     for file_info in user_files:
-        file_references = [tx for tx in transactions 
-                          if tx.get('file_id') == file_info['file_id'] and tx['type'] == 'reference']
         reference_stats.append({
             'file_id': file_info['file_id'],
             'filename': file_info['filename'],
-            'reference_count': len(file_references),
+            'reference_count': transaction_index.count('file_id', file_info['file_id'], 'reference'),
             'total_reward': file_info.get('total_reward', 0)
         })
     
     # 计算今日收益
-    today = datetime.now().date()
-    today_earned = 0.0
-    today_references = 0
-    
-    for tx in transactions:
-        if tx['to_user'] == user_id and tx['type'] == 'reward':
-            tx_time = datetime.fromisoformat(tx['timestamp']).date()
-            if tx_time == today:
-                today_earned += tx['amount']
-        elif tx.get('file_owner') == user_id and tx['type'] == 'reference':
-            tx_time = datetime.fromisoformat(tx['timestamp']).date()
-            if tx_time == today:
-                today_references += 1
+    today_earned, today_references = get_today_stats(user_id)
     
     # 调试信息
     print(f"📊 Profile页面 - 用户: {user_id}")
@@ -764,16 +865,14 @@ def save_shared_file(user_id, filename, content, authorize_rag=True):
     print("filename:", filename)
     print("authorize_rag:", authorize_rag)
 
-    files = load_files()
-
     file_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{user_id}"
     print("generated file_id:", file_id)
 
-    filepath = os.path.join(SHARED_FOLDER, f"{file_id}.txt")
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+    # 正文按内容哈希写入BlobStore，相同内容只存一份
+    content_hash, content_size = blob_store.put(content)
+    filepath = blob_store.path_for(content_hash)
 
-    print("file saved to local path:", filepath)
+    print("file saved to blob store:", filepath)
 
     # ⭐⭐⭐ 关键：先给默认值
     preview_url = None
@@ -801,10 +900,11 @@ def save_shared_file(user_id, filename, content, authorize_rag=True):
     ipfs_url = str(preview_url) if preview_url else None
     print("final ipfs_url used:", ipfs_url)
 
-    files[file_id] = {
+    file_store.add(file_id, {
         'filename': filename,
         'user_id': user_id,
-        'content': content,
+        'content_hash': content_hash,
+        'content_size': content_size,
         'content_preview': content[:200] + "..." if len(content) > 200 else content,
         'upload_time': datetime.now().isoformat(),
         'authorize_rag': authorize_rag,
@@ -812,16 +912,15 @@ def save_shared_file(user_id, filename, content, authorize_rag=True):
         'total_reward': 0.0,
         'file_path': filepath,
         'ipfs_url': ipfs_url
-    }
-
-    save_files(files)
+    })
     print("files metadata saved")
 
-    users = load_users()
-    if user_id in users:
-        users[user_id]['uploaded_files'].append(file_id)
-        save_users(users)
-        print("user upload list updated")
+    # 增量更新全文索引
+    conn = get_db_connection()
+    search_index.index_file(conn, file_id, filename, user_id, content)
+    conn.commit()
+    conn.close()
+    print("search index updated")
 
     add_uploaded_file(user_id, file_id)
     print("database record added")
@@ -848,7 +947,8 @@ def add_file_to_vector_store(filepath, file_id, user_id, filename,ipfs_url):
     global vector_store
 
     try:
-        init_vector_store(filepath,None,None,None,ipfs_url)
+        # 正文路径是内容哈希，无法再从文件名推断file_id，需显式传入
+        init_vector_store(filepath, file_id, user_id, filename, ipfs_url)
         print(f"成功添加文件到知识库: {filename}")
     except Exception as e:
         print(f"添加文件到向量库失败: {e}")
@@ -884,32 +984,29 @@ def add_file_to_vector_store(filepath, file_id, user_id, filename,ipfs_url):
     
 #     return sorted(results, key=lambda x: x['upload_time'], reverse=True)
 
-def search_files_in_content(files, keyword):
-    """在文件内容中搜索关键词"""
-    keyword_lower = keyword.lower()
-    results = []
-    
-    for file_id, file_data in files.items():
-        # 搜索文件名
-        if keyword_lower in file_data.get('filename', '').lower():
-            results.append(file_id)
-            continue
-            
-        # 搜索文件内容
-        if keyword_lower in file_data.get('content', '').lower():
-            results.append(file_id)
-            continue
-            
-        # 搜索文件ID
-        if keyword_lower in file_id.lower():
-            results.append(file_id)
-            continue
-            
-        # 搜索用户ID
-        if keyword_lower in file_data.get('user_id', '').lower():
-            results.append(file_id)
-    
-    return results
+def search_files_in_content(keyword, limit=None, cursor=None, file_id=None):
+    """通过全文索引检索文件名、正文、文件ID和用户ID
+
+    Returns:
+        ([(file_id, score), ...], next_cursor)，按相关度倒序
+    """
+    conn = get_db_connection()
+    try:
+        return search_index.search(conn, keyword, limit, cursor, file_id)
+    finally:
+        conn.close()
+
+def search_hit_entry(file_id, score, keyword):
+    """检索命中的文件元数据，附带相关度和高亮片段；索引中有而文件已不存在时返回 None"""
+    file_info = file_store.get(file_id)
+    if not file_info:
+        return None
+    return {
+        'file_id': file_id,
+        **file_info,
+        'score': score,
+        'snippet': search_index.snippet(file_store.get_content(file_id), keyword)
+    }
 
 
 # ==================== 智能奖励分配系统 ====================
@@ -976,165 +1073,106 @@ def calculate_reward_distribution(relevant_docs, total_cost):
     
     return reward_distribution
 
+def resolve_reward_file(file_id):
+    """查找奖励对应的文件，返回 (实际file_id, 文件信息)，找不到时返回 (file_id, None)"""
+    if file_id and file_store.exists(file_id):
+        return file_id, file_store.get(file_id)
+
+    # 如果file_id不匹配，尝试通过文件名或内容匹配
+    print(f"⚠️ 文件ID {file_id} 不在文件库中，尝试其他匹配方式")
+    
+    # 尝试通过文件名匹配（去掉_test后缀）
+    base_file_id = file_id.replace('_test', '') if file_id else ''
+    print(f"🔍 尝试基础文件名匹配: {base_file_id}")
+    
+    if base_file_id:
+        for actual_file_id, actual_file_info in file_store.all().items():
+            # 检查文件名是否包含基础file_id或内容是否匹配
+            if (
+                base_file_id in actual_file_id or 
+                base_file_id in actual_file_info.get('filename', '') or
+                (file_id == 'code_test' and '编程语言' in (file_store.get_content(actual_file_id) or ''))
+            ):
+                print(f"✅ 找到匹配文件: {actual_file_id} (原file_id: {file_id})")
+                return actual_file_id, actual_file_info
+    
+    print(f"❌ 无法找到与 {file_id} 匹配的文件")
+    return file_id, None
+
 def distribute_rewards(user_id, question, relevant_docs, total_cost):
-    """修复奖励分配函数 - 确保奖励正确分配和记录"""
+    """奖励分配函数 - 一次分配在一个数据库事务中完成结算"""
     reward_distribution = calculate_reward_distribution(relevant_docs, total_cost)
     
-    files = load_files()
-    transactions = load_transactions()
-    
     distribution_info = {}
-    total_distributed = 0.0
     
     print(f"🔍 开始奖励分配: 总成本 {total_cost:.6f}, 相关文档 {len(relevant_docs)} 个")
     send_system_message('info', f"开始奖励分配: 总成本 {total_cost:.6f}, 相关文档 {len(relevant_docs)} 个")
     
+    # 解析每个奖励对应的文件和所有者
+    rewards = []
+    for file_id, reward_info in reward_distribution.items():
+        actual_file_id, file_info = resolve_reward_file(file_id)
+        if not file_info:
+            print(f"❌ 找不到文件 {file_id} 的匹配信息")
+            continue
+        rewards.append({
+            'file_id': actual_file_id,
+            'file_owner': file_info['user_id'],
+            'reward': reward_info['reward'],
+            'weight': reward_info['weight'],
+            'similarity': reward_info['similarity']
+        })
+    
+    # 余额、引用记录、文件计数和汇总表在同一事务中批量写入
     conn = get_db_connection()
+    try:
+        settled, new_transactions = settle_rewards(conn, user_id, question, rewards)
+    except Exception as e:
+        print(f"❌ 奖励结算失败，已回滚: {e}")
+        send_system_message('error', f"奖励结算失败: {str(e)}")
+        return {}
+    finally:
+        conn.close()
     
-    for file_id, reward_info in reward_distribution.items():
-        try:
-            # 尝试找到匹配的文件
-            file_info = None
-            if file_id and file_id in files:
-
-                print('---------',file_id)
-
-                file_info = files[file_id]
-            else:
-                # 如果file_id不匹配，尝试通过文件名或内容匹配
-                print(f"⚠️ 文件ID {file_id} 不在files.json中，尝试其他匹配方式")
-                
-                # 尝试通过文件名匹配（去掉_test后缀）
-                base_file_id = file_id.replace('_test', '') if file_id else ''
-                print(f"🔍 尝试基础文件名匹配: {base_file_id}")
-                
-                for actual_file_id, actual_file_info in files.items():
-                    # 检查文件名是否包含基础file_id或内容是否匹配
-                    if base_file_id and (
-                        base_file_id in actual_file_id or 
-                        base_file_id in actual_file_info.get('filename', '') or
-                        ('编程语言' in actual_file_info.get('content', '') and file_id == 'code_test')
-                    ):
-                        print(f"✅ 找到匹配文件: {actual_file_id} (原file_id: {file_id})")
-                        file_info = actual_file_info
-                        file_id = actual_file_id  # 更新file_id为实际的file_id
-                        break
-                
-                if not file_info:
-                    print(f"❌ 无法找到与 {file_id} 匹配的文件")
-                
-            if file_info:
-                file_owner = file_info['user_id']
-                reward_amount = reward_info['reward']
-                
-                # 检查用户是否存在
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE user_id = ?', (file_owner,))
-                user = cursor.fetchone()
-                if user and reward_amount > 0:
-                    try:
-                        # 更新用户余额和总收益
-                        cursor.execute('''
-                        UPDATE users SET 
-                            coin_balance = coin_balance + ?,
-                            total_earned = total_earned + ?
-                        WHERE user_id = ?
-                        ''', (reward_amount, reward_amount, file_owner))
-                        
-                        # 记录奖励交易
-                        reward_tx = {
-                            'id': str(uuid.uuid4()),
-                            'type': 'reward',
-                            'from_user': None,  # 系统发放
-                            'to_user': file_owner,
-                            'amount': reward_amount,
-                            'file_owner': file_owner,
-                            'file_id': file_id,
-                            'question': question,
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        transactions.append(reward_tx)
-                        
-                        # 记录引用交易
-                        reference_tx = {
-                            'id': str(uuid.uuid4()),
-                            'type': 'reference',
-                            'from_user': user_id,
-                            'to_user': file_owner,
-                            'amount': 0.0,  # 引用记录，金额为0
-                            'file_owner': file_owner,
-                            'file_id': file_id,
-                            'question': question,
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        transactions.append(reference_tx)
-                        
-                        # 更新文件统计
-                        files[file_id]['reference_count'] += 1
-                        files[file_id]['total_reward'] += reward_amount
-
-                        users=load_users()
-                        if 'referenced_files' not in users[file_owner]:
-                            users[file_owner]['referenced_files'] = []
-                    
-                        reference_record = {
-                                'file_id': file_id,
-                                'question': question,
-                                'reward': reward_amount,
-                                'timestamp': datetime.now().isoformat(),
-                                'similarity': reward_info.get('similarity', 0),
-                                'weight': reward_info.get('weight', 0)
-                                }           
-                        users[file_owner]['referenced_files'].append(reference_record)
-                        save_users(users)
-                        
-                        total_distributed += reward_amount
-                        
-                        # 获取file_owner的钱包地址
-                        wallet_account = user['wallet_account'] if user['wallet_account'] else '未绑定钱包'
-                        
-                        print(f"✅ 成功分配奖励: {file_owner} (钱包: {wallet_account}) 获得 {reward_amount:.8f} coin")
-                        print(f"🔍 钱包地址类型: {type(wallet_account)}, 值: {wallet_account}")
-                        print(f"🔍 钱包地址比较: wallet_account != '未绑定钱包' -> {wallet_account != '未绑定钱包'}")
-                        
-                        send_system_message('success', f"成功分配奖励: {file_owner} (钱包: {wallet_account}) 获得 {reward_amount:.8f} coin")
-                        
-                        # 生成转账意图
-                        transfer_intent = None
-                        if wallet_account and wallet_account != '未绑定钱包' and wallet_account != '':
-                            print(f"🚀 生成转账意图，钱包地址: {wallet_account}")
-                            transfer_intent = {
-                                "action": "transfer",
-                                "fromChain": "zetachain",
-                                "toChain": "zetachain",
-                                "fromToken": "ZETA",
-                                "toToken": "ZETA",
-                                "amount": f"{reward_amount:.8f}",    
-                                "recipient": wallet_account
-                            }
-                            print(f"✅ 转账意图生成成功")
-                        else:
-                            print(f"❌ 不生成转账意图: 钱包地址无效 -> {wallet_account}")
-                        
-                        # 将转账意图添加到distribution_info中
-                        distribution_info[file_id] = {
-                            'reward': reward_amount,
-                            'weight': reward_info['weight'],
-                            'similarity': reward_info['similarity'],
-                            'transfer_intent': transfer_intent
-                        }
-                    except Exception as e:
-                        print(f"❌ 奖励分配失败 {file_id}: {e}")
-            else:
-                print(f"❌ 找不到文件 {file_id} 的匹配信息")
-        except Exception as e:
-            print(f"❌ 处理文件 {file_id} 时出错: {e}")
+    transaction_log.append_many(new_transactions)
+    file_store.refresh(*{r['file_id'] for r in settled})
     
-    # 确保数据保存
-    save_files(files)
-    save_transactions(transactions)
-    conn.commit()
-    conn.close()
+    total_distributed = 0.0
+    for r in settled:
+        file_id = r['file_id']
+        file_owner = r['file_owner']
+        reward_amount = r['reward']
+        total_distributed += reward_amount
+        
+        # 获取file_owner的钱包地址
+        wallet_account = r['wallet_account'] if r['wallet_account'] else '未绑定钱包'
+        
+        print(f"✅ 成功分配奖励: {file_owner} (钱包: {wallet_account}) 获得 {reward_amount:.8f} coin")
+        send_system_message('success', f"成功分配奖励: {file_owner} (钱包: {wallet_account}) 获得 {reward_amount:.8f} coin")
+        
+        # 生成转账意图
+        transfer_intent = None
+        if wallet_account and wallet_account != '未绑定钱包' and wallet_account != '':
+            print(f"🚀 生成转账意图，钱包地址: {wallet_account}")
+            transfer_intent = {
+                "action": "transfer",
+                "fromChain": "zetachain",
+                "toChain": "zetachain",
+                "fromToken": "ZETA",
+                "toToken": "ZETA",
+                "amount": f"{reward_amount:.8f}",    
+                "recipient": wallet_account
+            }
+        else:
+            print(f"❌ 不生成转账意图: 钱包地址无效 -> {wallet_account}")
+        
+        # 将转账意图添加到distribution_info中
+        distribution_info[file_id] = {
+            'reward': reward_amount,
+            'weight': r['weight'],
+            'similarity': r['similarity'],
+            'transfer_intent': transfer_intent
+        }
     
     print(f"🎯 奖励分配完成: 总分配金额 {total_distributed:.8f} coin")
     send_system_message('success', f"奖励分配完成: 总分配金额 {total_distributed:.8f} coin")
@@ -1245,7 +1283,7 @@ def enhanced_cosine_similarity(vec1, vec2):
     
     return float(similarity)
 
-def llm_based_relevance_check(question, document_content, llm_model):
+def llm_based_relevance_check(question, document_content, llm_model, raise_errors=False):
     try:
         truncated_content = document_content[:800] + "..." if len(document_content) > 800 else document_content
         
@@ -1265,23 +1303,37 @@ def llm_based_relevance_check(question, document_content, llm_model):
         
     except Exception as e:
         print(f"LLM相关性判断错误: {e}")
+        if raise_errors:
+            # 由调用方降级处理，避免把调用失败当作"不相关"写入缓存
+            raise
         return False
 
-def hybrid_relevance_check(question, doc, embeddings_model, llm_model):
-    semantic_similarity = calculate_semantic_similarity(question, doc.page_content, embeddings_model)
+def hybrid_relevance_check(question, doc, embeddings_model, llm_model, question_embedding=None, doc_embedding=None,
+                           semantic_similarity=None):
+    # 已批量算好相似度时直接使用
+    if semantic_similarity is None:
+        semantic_similarity = calculate_semantic_similarity(
+            question, doc.page_content, embeddings_model, question_embedding, doc_embedding)
     
+    decision = relevance_band(question, semantic_similarity)
+    if decision == 'llm':
+        is_llm_relevant = llm_based_relevance_check(question, doc.page_content, llm_model)
+        return is_llm_relevant, semantic_similarity
+    return decision == 'relevant', semantic_similarity
+
+def relevance_band(question, semantic_similarity):
+    """按相似度分档：'relevant' 直接相关，'llm' 需要LLM判断，'irrelevant' 直接不相关"""
     # 检测是否是概念性问题
     is_conceptual_question = any(keyword in question for keyword in 
                                 ["什么是", "什么叫", "定义", "概念", "含义", "解释", "为什么"])
     
     if semantic_similarity > 0.7:
-        return True, semantic_similarity
+        return 'relevant'
     elif semantic_similarity > 0.3 or (is_conceptual_question and semantic_similarity > 0.2):
         # 对于概念性问题，降低阈值到0.2，给予LLM判断的机会
-        is_llm_relevant = llm_based_relevance_check(question, doc.page_content, llm_model)
-        return is_llm_relevant, semantic_similarity
+        return 'llm'
     else:
-        return False, semantic_similarity
+        return 'irrelevant'
 
 def calculate_jaccard_similarity(text1, text2):
     words1 = set(text1.lower().split())
@@ -1295,15 +1347,17 @@ def calculate_jaccard_similarity(text1, text2):
     
     return intersection / union if union > 0 else 0.0
 
-def calculate_semantic_similarity(question, document_content, embeddings_model):
+def calculate_semantic_similarity(question, document_content, embeddings_model, question_embedding=None, doc_embedding=None):
     try:
-        question_embedding = embeddings_model.embed_query(question)
-        doc_embedding = embeddings_model.embed_query(document_content)
+        # 检索阶段已带回问题向量和向量库中存储的文档块向量时直接使用，不再请求嵌入API
+        if question_embedding is None:
+            question_embedding = embeddings_model.embed_query(question)
+        if doc_embedding is None:
+            doc_embedding = embeddings_model.embed_query(document_content)
         
         base_similarity = enhanced_cosine_similarity(question_embedding, doc_embedding)
         
-        is_conceptual_question = any(keyword in question for keyword in 
-                                    ["什么是", "什么叫", "定义", "概念", "含义", "解释"])
+        is_conceptual_question = any(keyword in question for keyword in CONCEPTUAL_MARKERS)
         
         doc_length = len(document_content.split())
         if is_conceptual_question:
@@ -1313,14 +1367,8 @@ def calculate_semantic_similarity(question, document_content, embeddings_model):
         
         jaccard_similarity = calculate_jaccard_similarity(question, document_content)
         
-        concept_keywords = {
-            "爱": ["爱", "爱情", "爱心", "关爱", "热爱", "情感", "感情", "关系", "亲密", "定义", "概念"],
-            "什么是": ["定义", "概念", "含义", "解释", "是什么", "什么叫", "意味着", "指的是"],
-            "编程语言": ["编程", "语言", "编程语言", "代码", "程序", "计算机", "语法", "语义", "功能"]
-        }
-        
         keyword_boost = 0.0
-        for concept, keywords in concept_keywords.items():
+        for concept, keywords in CONCEPT_KEYWORDS.items():
             if concept in question:
                 keyword_matches = sum(1 for keyword in keywords if keyword in document_content)
                 if keyword_matches > 0:
@@ -1365,8 +1413,83 @@ def calculate_semantic_similarity(question, document_content, embeddings_model):
         print(f"语义相似度计算错误: {e}")
         return 0.4
 
-def adaptive_filter_relevant_docs(question, docs, embeddings_model, llm_model):
+# LLM相关性判断线程池（所有请求共享，限制对LLM的总并发）
+relevance_pool = DeadlinePool(max_workers=RELEVANCE_MAX_WORKERS, name='relevance-check')
+
+def batch_semantic_similarities(question, docs, embeddings_model, question_embedding=None, doc_embeddings=None):
+    """一次性计算所有候选的综合相似度，批量计算失败时返回 None 列表，由调用方逐个计算"""
+    if not docs:
+        return []
+    try:
+        if question_embedding is None:
+            question_embedding = embeddings_model.embed_query(question)
+        if doc_embeddings is None:
+            doc_embeddings = [None] * len(docs)
+        # 检索阶段没有带回向量的候选单独计算
+        doc_embeddings = [
+            embedding if embedding is not None else embeddings_model.embed_query(doc.page_content)
+            for doc, embedding in zip(docs, doc_embeddings)
+        ]
+        scores, parts = score_candidates(
+            question, [doc.page_content for doc in docs], question_embedding, doc_embeddings)
+        for i in range(len(docs)):
+            print(f"相似度分解 - 语义:{parts['base'][i]:.3f}, Jaccard:{parts['jaccard'][i]:.3f}, 长度因子:{parts['length_factor'][i]:.3f}, 关键词增强:{parts['keyword_boost'][i]:.3f}, 综合:{scores[i]:.3f}")
+        return [float(score) for score in scores]
+    except Exception as e:
+        print(f"批量相似度计算错误: {e}，改为逐个计算")
+        return [None] * len(docs)
+
+def llm_relevance_verdicts(question, docs, indices, llm_model):
+    """对 docs 中下标为 indices 的文档块做LLM相关性判断，返回 {下标: 是否相关}
+
+    listwise 模式先一次调用判断全部候选，未解析出结论的候选再逐块判断；
+    两个阶段共用 RELEVANCE_DEADLINE_SECONDS，截止时仍未得到结论的下标不出现在结果中。
+    已缓存的判断直接使用，新得到的判断写入缓存。
+    """
+    started = time.monotonic()
+    keys = {i: hybrid_retrieval.doc_key(docs[i]) for i in indices}
+    cached = relevance_cache.get_many(question, list(keys.values()))
+    results = {i: cached[keys[i]] for i in indices if keys[i] in cached}
+    if results:
+        print(f"♻️ 相关性判断缓存命中 {len(results)}/{len(indices)} 个")
+    indices = [i for i in indices if i not in results]
+    if not indices:
+        return results
+
+    fresh = {}
+    if RELEVANCE_MODE == 'listwise':
+        contents = [docs[i].page_content for i in indices]
+        listwise_results, _ = relevance_pool.run(
+            {'listwise': functools.partial(
+                listwise_relevance_check, question, contents, llm_model, LISTWISE_MAX_CHARS)},
+            RELEVANCE_DEADLINE_SECONDS
+        )
+        for position, is_relevant in listwise_results.get('listwise', {}).items():
+            fresh[indices[position]] = is_relevant
+        if len(fresh) < len(indices):
+            print(f"列表式判断得到 {len(fresh)}/{len(indices)} 个结论，其余改为逐块判断")
+
+    remaining = [i for i in indices if i not in fresh]
+    deadline = RELEVANCE_DEADLINE_SECONDS - (time.monotonic() - started)
+    if remaining and deadline > 0:
+        per_doc_results, _ = relevance_pool.run(
+            {i: functools.partial(llm_based_relevance_check, question, docs[i].page_content, llm_model,
+                                  raise_errors=True)
+             for i in remaining},
+            deadline
+        )
+        fresh.update(per_doc_results)
+
+    relevance_cache.put_many(question, {
+        (keys[i], docs[i].metadata.get('file_id')): is_relevant for i, is_relevant in fresh.items()
+    })
+    results.update(fresh)
+    return results
+
+def adaptive_filter_relevant_docs(question, docs, embeddings_model, llm_model, question_embedding=None, doc_embeddings=None):
     relevant_docs = []
+    if doc_embeddings is None:
+        doc_embeddings = [None] * len(docs)
     
     print(f"开始自适应过滤 {len(docs)} 个文档")
     
@@ -1376,21 +1499,45 @@ def adaptive_filter_relevant_docs(question, docs, embeddings_model, llm_model):
     if is_conceptual_question:
         print("检测到概念性问题，采用LLM主导的过滤策略")
     
-    for i, doc in enumerate(docs):
+    similarities = batch_semantic_similarities(question, docs, embeddings_model, question_embedding, doc_embeddings)
+    
+    # 先按相似度分档，需要LLM判断的文档块稍后并发处理
+    decisions = {}
+    llm_pending = {}
+    for i, (doc, doc_embedding) in enumerate(zip(docs, doc_embeddings)):
         try:
-            is_relevant, similarity = hybrid_relevance_check(question, doc, embeddings_model, llm_model)
-            
-            doc_preview = doc.page_content[:50] + "..." if len(doc.page_content) > 50 else doc.page_content
-            print(f"文档 {i+1} 混合相似度: {similarity:.3f}, 相关: {is_relevant} - 内容: {doc_preview}")
-            
-            if is_relevant:
-                doc.metadata['semantic_similarity'] = float(similarity)
-                relevant_docs.append((similarity, doc))
-                
+            similarity = similarities[i]
+            if similarity is None:
+                similarity = calculate_semantic_similarity(
+                    question, doc.page_content, embeddings_model, question_embedding, doc_embedding)
+            band = relevance_band(question, similarity)
+            if band == 'llm':
+                llm_pending[i] = similarity
+            else:
+                decisions[i] = (band == 'relevant', similarity)
         except Exception as e:
             print(f"文档 {i+1} 相关性判断错误: {e}")
-            doc.metadata['semantic_similarity'] = 0.4
-            relevant_docs.append((0.4, doc))
+            decisions[i] = (True, 0.4)
+    
+    # 需要LLM判断的文档块共享一个截止时间；超时未完成的按相似度降级判断
+    if llm_pending:
+        llm_results = llm_relevance_verdicts(question, docs, list(llm_pending), llm_model)
+        for i, similarity in llm_pending.items():
+            if i in llm_results:
+                decisions[i] = (llm_results[i], similarity)
+            else:
+                is_relevant = similarity >= RELEVANCE_FALLBACK_THRESHOLD
+                print(f"文档 {i+1} LLM判断未按时完成，按相似度 {similarity:.3f} 判定为{'相关' if is_relevant else '不相关'}")
+                decisions[i] = (is_relevant, similarity)
+    
+    for i, doc in enumerate(docs):
+        is_relevant, similarity = decisions[i]
+        doc_preview = doc.page_content[:50] + "..." if len(doc.page_content) > 50 else doc.page_content
+        print(f"文档 {i+1} 混合相似度: {similarity:.3f}, 相关: {is_relevant} - 内容: {doc_preview}")
+        
+        if is_relevant:
+            doc.metadata['semantic_similarity'] = float(similarity)
+            relevant_docs.append((similarity, doc))
     
     if not relevant_docs:
         return []
@@ -1579,24 +1726,10 @@ def init_vector_store(filepath=None, file_id=None, user_id=None, filename=None,i
 
         all_texts = [c.page_content for c in chunks]
         all_metadatas = [c.metadata for c in chunks]
-        all_embeddings = []
-        for i, text in enumerate(all_texts):
-            embed_success = False
-            for attempt in range(5):
-                try:
-                    embed = embeddings.embed_query(text)
-                    all_embeddings.append(embed)
-                    print(f"手动嵌入块 {i+1} 成功")
-                    embed_success = True
-                    break
-                except Exception as e:
-                    if "502" in str(e):
-                        print(f"嵌入 502，重试块 {i+1} 第 {attempt+1} 次...")
-                        time.sleep(5)
-                    else:
-                        raise
-            if not embed_success:
-                raise Exception(f"嵌入块 {i+1} 失败，5 次重试")
+        # 分批并发嵌入；结果写入嵌入缓存，下面 add_texts 再次嵌入时直接命中
+        all_embeddings, embed_stats = ingest_embedder.embed(all_texts)
+        print(f"嵌入完成: {embed_stats['chunks']} 块 / {embed_stats['batches']} 批, "
+              f"耗时 {embed_stats['seconds']:.2f}s, {embed_stats['chunks_per_second']:.1f} 块/秒")
 
         if vector_store:
             vector_store.add_texts(
@@ -1605,6 +1738,7 @@ def init_vector_store(filepath=None, file_id=None, user_id=None, filename=None,i
                 metadatas=all_metadatas
             )
             print(f"文档已追加到知识库: {os.path.basename(filepath)}")
+            index_rag_chunks(chunks)
         else:
             class PrecomputedEmbeddings:
                 def __init__(self, pre_embeds):
@@ -1624,6 +1758,7 @@ def init_vector_store(filepath=None, file_id=None, user_id=None, filename=None,i
                 persist_directory='chroma_db'
             )
             print(f"手动新建知识库成功！文档数: {len(chunks)}")
+            index_rag_chunks(chunks)
 
         print(f"文件处理完成: {os.path.basename(filepath)}\n")
 
@@ -1633,8 +1768,6 @@ def init_vector_store(filepath=None, file_id=None, user_id=None, filename=None,i
 
 def enhanced_record_transaction(tx_type, from_user, to_user, amount, file_owner=None, file_id=None, question=None, details=None):
     """增强的交易记录功能"""
-    transactions = load_transactions()
-    
     transaction = {
         'id': str(uuid.uuid4()),
         'type': tx_type,
@@ -1648,8 +1781,7 @@ def enhanced_record_transaction(tx_type, from_user, to_user, amount, file_owner=
         'timestamp': datetime.now().isoformat()
     }
     
-    transactions.append(transaction)
-    save_transactions(transactions)
+    transaction_log.append(transaction)
     
     # 更新用户余额
     conn = get_db_connection()
@@ -1670,6 +1802,7 @@ def enhanced_record_transaction(tx_type, from_user, to_user, amount, file_owner=
         WHERE user_id = ?
         ''', (amount, amount, to_user))
 
+    rollups.apply_transactions(conn, [transaction])
     conn.commit()
     conn.close()
     
@@ -1677,26 +1810,16 @@ def enhanced_record_transaction(tx_type, from_user, to_user, amount, file_owner=
     log_transaction(transaction)
 
 def log_transaction(transaction):
-    """记录交易日志到文件"""
+    """记录交易日志（提交给后台线程追加写入，不阻塞请求）"""
     log_entry = {
         'timestamp': datetime.now().isoformat(),
         'transaction': transaction
     }
-    
-    log_file = 'transaction_logs.json'
-    logs = []
-    
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        except:
-            logs = []
-    
-    logs.append(log_entry)
-    
-    with open(log_file, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=2)
+    audit_log.write(log_entry)
+
+def read_transaction_logs(start=None, end=None):
+    """流式读取 [start, end) 时间范围内的交易日志，start/end 为ISO格式字符串"""
+    return audit_log.read_range(start, end)
 # ==================== Flask 路由 ====================
 
 # @app.route('/')
@@ -1776,15 +1899,12 @@ def log_transaction(transaction):
 
 @app.route('/share', methods=['POST'])
 def share_file():
-    users = load_users()
-
     wallet_address = request.form.get('wallet_address', '').strip()
     print("🪪 接收到钱包地址:", wallet_address)
 
-    if wallet_address not in users:
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
         return jsonify({'success': False, 'message': '钱包未注册，请先连接钱包'})
-    
-    user_id = wallet_address
 
     filename = request.form.get('filename', '').strip()
     content = request.form.get('content', '').strip()
@@ -1851,16 +1971,14 @@ def get_file_content(file_id):
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': '请先登录'})
     
-    files = load_files()
-    if file_id not in files:
+    file_info = file_store.get(file_id)
+    if not file_info:
         return jsonify({'success': False, 'message': '文件不存在'})
     
-    file_info = files[file_id]
-    
     return jsonify({
         'success': True,
         'filename': file_info['filename'],
-        'content': file_info['content'],
+        'content': file_store.get_content(file_id),
         'upload_time': file_info['upload_time'],
         'user_id': file_info['user_id'],
         'authorize_rag': file_info.get('authorize_rag', False),
@@ -1868,17 +1986,48 @@ def get_file_content(file_id):
         'total_reward': file_info.get('total_reward', 0)
     })
 
+# 投机生成统计（/health 中展示）
+speculation_stats = {'started': 0, 'released': 0, 'discarded': 0, 'discarded_chars': 0, 'discarded_seconds': 0.0}
+speculation_stats_lock = threading.Lock()
+
+def record_speculation(event, cost=None):
+    """记录一次投机生成的开始、采用或丢弃；丢弃时累计已经花掉的生成量和时间"""
+    with speculation_stats_lock:
+        speculation_stats[event] += 1
+        if cost:
+            speculation_stats['discarded_chars'] += cost['chars']
+            speculation_stats['discarded_seconds'] += cost['seconds']
+    if cost:
+        print(f"🗑️ 丢弃投机生成的回答: {cost['chunks']} 块 / {cost['chars']} 字, 用时 {cost['seconds']:.1f}s, "
+              f"{'已生成完毕' if cost['finished'] else '生成中途取消'}")
+
+def sse_data(text):
+    """把一段文本编码为一个SSE事件；文本中的换行拆成多行 data 字段，浏览器端会按原样拼回"""
+    return ''.join(f"data: {line}\n" for line in text.split('\n')) + "\n"
+
+def stream_llm_answer(prompt):
+    """逐块产出LLM生成的文本
+
+    调用方停止迭代时（客户端断开连接，Flask 关闭响应生成器）会关闭底层流式请求，模型不再继续生成。
+    """
+    stream = llm.stream(prompt)
+    try:
+        for chunk in stream:
+            text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if text:
+                yield text
+    finally:
+        stream.close()
+
 @app.route('/ask')
 def ask_stream():
 
-    users = load_users()
     wallet_address = request.args.get('wallet_address', '').strip()
     print("wallet_address:", wallet_address)
 
-    if wallet_address not in users:
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
         return jsonify({'success': False, 'message': '钱包未注册，请先连接钱包'})
-    
-    user_id = wallet_address
 
     question = request.args.get('q', '').strip()
     
@@ -1900,14 +2049,14 @@ def ask_stream():
         rag_reason = ""
         confidence = 0.0
         relevant_docs = []
+        speculation = None
         
         try:
             conversation_cost = 0.000001
             
             # 从数据库获取最新余额
-            conn = get_db_connection()
-            user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
-            conn.close()
+            with db_pool.borrow() as conn:
+                user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
             
             if user:
                 current_balance = user['coin_balance']
@@ -1924,12 +2073,9 @@ def ask_stream():
                     # 先发送一个测试消息
                     yield "data: 正在处理您的问题...\n\n"
                     
-                    response = llm.invoke(question)
-                    response_text = response.content if hasattr(response, 'content') else str(response)
-                    print(f"LLM响应内容: {response_text[:50]}...")
-                    
-                    # 发送完整回答
-                    yield f"data: {response_text}\n\n"
+                    # 模型每生成一段就转发给前端
+                    for text in stream_llm_answer(question):
+                        yield sse_data(text)
                     yield "data: [END]\n\n"
                 except Exception as e:
                     import traceback
@@ -1939,42 +2085,65 @@ def ask_stream():
                     yield "data: [END]\n\n"
                 return
 
-            print("知识库已加载，开始检索相关文档...")
+            # 近似问题命中答案缓存时跳过检索、过滤和生成，奖励结算照常进行
+            question_embedding = None
+            cached_entry = None
+            try:
+                question_embedding = embeddings.embed_query(question)
+                cached_entry, cache_similarity = answer_cache.lookup(question_embedding)
+            except Exception as e:
+                print(f"⚠️ 答案缓存查询失败: {e}")
+            
+            if cached_entry:
+                print(f"♻️ 答案缓存命中（相似度 {cache_similarity:.3f}，原问题: {cached_entry['question']}）")
+                relevant_docs = cached_entry['docs']
+                should_use_rag, rag_reason, confidence = cached_entry['decision']
+            else:
+                print("知识库已加载，开始检索相关文档...")
+            
+                # 向量检索与关键词检索并行，RRF融合后只保留前 HYBRID_TOP_K 个候选
+                all_docs, question_embedding, doc_embeddings = hybrid_retriever.retrieve(question)
             
-            retriever = vector_store.as_retriever(search_kwargs={"k": 10})
-            all_docs = retriever.invoke(question)
+                print(f"从知识库检索到 {len(all_docs)} 个文档块")
             
-            print(f"从知识库检索到 {len(all_docs)} 个文档块")
+                if not all_docs:
+                    print("未找到相关文档，将基于模型知识回答")
+                    try:
+                        for text in stream_llm_answer(question):
+                            yield sse_data(text)
+                        yield "data: [END]\n\n"
+                    except Exception as e:
+                        import traceback
+                        error_detail = traceback.format_exc()
+                        print(f"LLM服务详细错误:\n{error_detail}")
+                        yield f"data: LLM 服务错误: {str(e)}\n\n"
+                        yield "data: [END]\n\n"
+                    return
             
-            if not all_docs:
-                print("未找到相关文档，将基于模型知识回答")
                 try:
-                    response = llm.invoke(question)
-                    response_text = response.content if hasattr(response, 'content') else str(response)
-                    yield f"data: {response_text}\n\n"
-                    yield "data: [END]\n\n"
+                    print("开始智能过滤相关文档...")
+                    relevant_docs = adaptive_filter_relevant_docs(
+                        question, all_docs, embeddings, llm, question_embedding, doc_embeddings)
+                    print(f"过滤后保留 {len(relevant_docs)} 个相关文档")
                 except Exception as e:
-                    import traceback
-                    error_detail = traceback.format_exc()
-                    print(f"LLM服务详细错误:\n{error_detail}")
-                    yield f"data: LLM 服务错误: {str(e)}\n\n"
-                    yield "data: [END]\n\n"
-                return
+                    print(f"智能过滤出错: {str(e)}，使用所有检索到的文档")
+                    relevant_docs = all_docs
             
-            try:
-                print("开始智能过滤相关文档...")
-                relevant_docs = adaptive_filter_relevant_docs(question, all_docs, embeddings, llm)
-                print(f"过滤后保留 {len(relevant_docs)} 个相关文档")
-            except Exception as e:
-                print(f"智能过滤出错: {str(e)}，使用所有检索到的文档")
-                relevant_docs = all_docs
+                try:
+                    should_use_rag, rag_reason, confidence = intelligent_rag_decision(question, relevant_docs)
+                    print(f"{rag_reason} (置信度: {confidence:.2f})")
+                except Exception as e:
+                    print(f"智能决策出错: {str(e)}，默认使用RAG")
+                    should_use_rag, rag_reason, confidence = True, "默认使用RAG", 0.5
             
-            try:
-                should_use_rag, rag_reason, confidence = intelligent_rag_decision(question, relevant_docs)
-                print(f"{rag_reason} (置信度: {confidence:.2f})")
-            except Exception as e:
-                print(f"智能决策出错: {str(e)}，默认使用RAG")
-                should_use_rag, rag_reason, confidence = True, "默认使用RAG", 0.5
+            # 投机生成：等待用户确认转账的同时在后台生成回答，确认后直接输出
+            if SPECULATIVE_GENERATION and relevant_docs and should_use_rag and not cached_entry:
+                try:
+                    _, speculative_prompt = hybrid_answering_strategy(question, relevant_docs, confidence)
+                    speculation = SpeculativeAnswer(stream_llm_answer, speculative_prompt)
+                    record_speculation('started')
+                except Exception as e:
+                    print(f"⚠️ 投机生成启动失败，确认后再生成: {e}")
             
             # 当需要引用文档时，先发送转账意图给前端并等待用户确认
             if relevant_docs and should_use_rag:
@@ -1991,8 +2160,7 @@ def ask_stream():
                         transfer_intents = []
                         
                         for file_id, reward_info in reward_distribution.items():
-                            files = load_files()
-                            file_info = files.get(file_id, {})
+                            file_info = file_store.get(file_id) or {}
                             filename = file_info.get('filename', '未知文件')
                             file_owner = file_info.get('user_id', '未知用户')
                             
@@ -2017,19 +2185,24 @@ def ask_stream():
                         if transfer_intents:
                             yield "data: 📤 正在处理奖励分配...\n\n"
                             
-                            # 发送每个转账意图
-                            for intent in transfer_intents:
-                                socketio.emit('system_message', {
-                                    'type': 'intent',
-                                    'data': intent
-                                }, namespace='/ws')
-                                print(f"✅ 发送转账意图: {intent['amount']} {intent['fromToken']} 到 {intent['recipient']}")
-                            
-                            # 等待用户确认所有转账
-                            yield "data: 📤 请确认所有转账...\n\n"
-                            
-                            # 等待用户确认转账
-                            confirmed, tx_id, tx_hash = wait_for_transaction_confirmation(user_id, timeout=120)
+                            # 先登记等待再发送意图，确认随关联ID返回，同一用户的并发提问互不干扰
+                            confirmation_id = confirmation_broker.open(user_id)
+                            try:
+                                # 发送每个转账意图
+                                for intent in transfer_intents:
+                                    socketio.emit('system_message', {
+                                        'type': 'intent',
+                                        'data': {**intent, 'confirmation_id': confirmation_id}
+                                    }, namespace='/ws')
+                                    print(f"✅ 发送转账意图: {intent['amount']} {intent['fromToken']} 到 {intent['recipient']}")
+                                
+                                # 等待用户确认所有转账
+                                yield "data: 📤 请确认所有转账...\n\n"
+                                
+                                # 等待用户确认转账
+                                confirmed, tx_id, tx_hash = wait_for_transaction_confirmation(confirmation_id, timeout=120)
+                            finally:
+                                confirmation_broker.discard(confirmation_id)
                             
                             if confirmed:
                                 # 只有在用户确认转账后才扣除费用
@@ -2083,44 +2256,27 @@ def ask_stream():
                             yield f"data: {i+1}. {info['display']}\n"
                         yield "data: \n\n"
                     
+                    if cached_entry:
+                        yield sse_data(cached_entry['answer'])
+                        yield "data: [END]\n\n"
+                        return
+                    
                     print("正在生成回答...")
                     
-                    # 🎯 修复：添加超时保护和错误处理
                     try:
-                        # 设置生成回答的超时时间
-                        import threading
-                        from queue import Queue, Empty
-                        
-                        response_queue = Queue()
-                        error_queue = Queue()
-                        
-                        def generate_ai_response():
-                            try:
-                                response = llm.invoke(hybrid_prompt)
-                                response_text = response.content if hasattr(response, 'content') else str(response)
-                                response_queue.put(response_text)
-                            except Exception as e:
-                                error_queue.put(str(e))
-                        
-                        # 在单独的线程中生成回答
-                        thread = threading.Thread(target=generate_ai_response)
-                        thread.daemon = True
-                        thread.start()
-                        
-                        # 等待回答生成，最多等待60秒
-                        thread.join(timeout=60)
-                        
-                        if thread.is_alive():
-                            # 如果超时，发送超时信息
-                            yield "data: ⏰ 生成回答超时，请重试\n\n"
-                        elif not error_queue.empty():
-                            # 如果有错误，发送错误信息
-                            error_msg = error_queue.get()
-                            yield f"data: 生成回答时出错: {error_msg}\n\n"
+                        # 流式生成：模型每生成一段就转发给前端，客户端断开时停止生成
+                        # 已投机生成时先输出缓存的部分，再继续输出后台后续生成的内容
+                        if speculation is not None:
+                            record_speculation('released')
+                            answer_stream = speculation.release()
                         else:
-                            # 成功生成回答
-                            response_text = response_queue.get()
-                            yield f"data: {response_text}\n\n"
+                            answer_stream = stream_llm_answer(hybrid_prompt)
+                        answer_parts = []
+                        for text in answer_stream:
+                            answer_parts.append(text)
+                            yield sse_data(text)
+                        cache_answer(question, question_embedding, ''.join(answer_parts), relevant_docs,
+                                     (should_use_rag, rag_reason, confidence))
                             
                     except Exception as e:
                         print(f"AI回答生成异常: {e}")
@@ -2130,7 +2286,7 @@ def ask_stream():
                             simple_response = llm.invoke(f"请简单回答：{question}")
                             simple_text = simple_response.content if hasattr(simple_response, 'content') else str(simple_response)
                             yield f"data: 简化回答: {simple_text}\n\n"
-                        except:
+                        except Exception:
                             yield "data: 无法生成回答，请重试\n\n"
                 except Exception as e:
                     print(f"回答策略出错: {e}")
@@ -2143,26 +2299,21 @@ def ask_stream():
                     # 扣除费用
                     record_transaction('spend', user_id, 'system', conversation_cost, None, None, question)
                     
-                    enhanced_prompt = f"请回答以下问题：{question}"
-                    
-                    response = llm.invoke(enhanced_prompt)
-                    response_text = response.content if hasattr(response, 'content') else str(response)
-                    
-                    # 🎯 修复：直接在回答内容中添加提示信息
-                    full_response = response_text + "\n\n---\n\n💡 **本次回答基于模型的训练知识**"
-                    
-                    # 模拟流式输出
-                    import time
-                    words = full_response.split(' ')
-                    current_chunk = ""
+                    if cached_entry:
+                        yield sse_data(cached_entry['answer'])
+                    else:
+                        enhanced_prompt = f"请回答以下问题：{question}"
+                        
+                        # 流式生成：模型每生成一段就转发给前端
+                        answer_parts = []
+                        for text in stream_llm_answer(enhanced_prompt):
+                            answer_parts.append(text)
+                            yield sse_data(text)
+                        cache_answer(question, question_embedding, ''.join(answer_parts), relevant_docs,
+                                     (should_use_rag, rag_reason, confidence))
                     
-                    for i, word in enumerate(words):
-                        current_chunk += word + " "
-                        # 每4个单词或到达末尾时发送一次
-                        if i % 4 == 0 or i == len(words) - 1:
-                            yield f"data: {current_chunk}\n\n"
-                            current_chunk = ""
-                            time.sleep(0.03)  # 轻微延迟以模拟流式效果
+                    # 🎯 修复：在回答末尾添加提示信息
+                    yield sse_data("\n\n---\n\n💡 **本次回答基于模型的训练知识**")
                     
                     yield "data: [END]\n\n"
                     
@@ -2177,6 +2328,14 @@ def ask_stream():
             print(f"AI对话错误详情: {error_details}")
             yield f"data: 系统错误: {str(e)}\n\n"
             yield "data: [END]\n\n"
+        finally:
+            # 转账取消、超时、出错或客户端断开时，没有被采用的投机生成在这里丢弃
+            if speculation is not None:
+                cost = speculation.discard()
+                if cost:
+                    record_speculation('discarded', cost)
+            # 生成器在请求的 teardown 之后才执行，这里自行回滚遗留事务并归还连接
+            db_pool.release()
 
     return Response(generate_response(), mimetype='text/event-stream')
 
@@ -2194,12 +2353,10 @@ def file_detail(file_id):
     if 'user_id' not in session:
         return redirect('/login')
     
-    files = load_files()
-    if file_id not in files:
+    file_info = file_store.get(file_id)
+    if not file_info:
         return "文件不存在", 404
     
-    file_info = files[file_id]
-    
     return render_template('file_detail.html', 
                          file_info=file_info,
                          user_id=session['user_id'])
@@ -2254,6 +2411,7 @@ def add_content_to_vector_store(content, file_id, user_id, filename,ipfs_url):
             )
         else:
             vector_store.add_documents(docs)
+        index_rag_chunks(docs)
         
         print(f"成功添加内容到向量库: {filename} (共 {len(docs)} 块)")
     except Exception as e:
@@ -2297,8 +2455,8 @@ def reload_vector_store():
         for file_id, file_info in files.items():
             print('-----',file_id)
             if file_info.get('authorize_rag', False):
-                # 优先使用content字段直接加载
-                content = file_info.get('content')
+                # 优先使用正文直接加载
+                content = file_store.get_content(file_id)
                 user_id = file_info.get('user_id')
                 filename = file_info.get('filename')
                 ipfs_url= file_info.get('ipfs_url')
@@ -2432,6 +2590,7 @@ def reload_vector_store():
             persist_directory=original_chroma_db,
             embedding_function=embeddings
         )
+        rebuild_rag_chunk_index()
         
         return jsonify({
             'success': True,
@@ -2460,11 +2619,16 @@ def health_check():
         "llm_model": "unknown",
         "vector_store": "empty" if not vector_store else f"loaded ({vector_store._collection.count()} docs)",
         "user_count": user_count,
-        "file_count": len(load_files())
+        "file_count": file_store.count(),
+        "embedding_cache": embeddings.stats(),
+        "relevance_cache": relevance_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "speculative_generation": dict(speculation_stats, enabled=SPECULATIVE_GENERATION)
     }
     
     try:
-        test_embed = embeddings.embed_query("test")
+        # 绕过缓存，确认嵌入API本身可用
+        test_embed = embeddings.base.embed_query("test")
         status["embedding_model"] = "ok"
         
         test_response = llm.invoke("hello")
@@ -2476,6 +2640,9 @@ def health_check():
     
     return jsonify(status)
 
+# /api/files 可通过 fields 参数选择的字段
+API_FILE_FIELDS = ('file_id',) + FILE_COLUMNS + ('score', 'snippet')
+
 @app.route('/files')
 @app.route('/api/files')
 def list_files():
@@ -2498,24 +2665,53 @@ def list_files():
     keyword = request.args.get('keyword', '').strip()
     file_id = request.args.get('file_id', '').strip()
     
-    # 🎯 优化搜索逻辑
-    files = search_files(file_id=file_id if file_id else None, keyword=keyword)
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        fields = parse_fields(request.args.get('fields'), API_FILE_FIELDS)
+        
+        if keyword:
+            # 关键词检索按相关度分页
+            hits, next_cursor = search_files_in_content(
+                keyword, limit, request.args.get('cursor'), file_id=file_id if file_id else None)
+            files = [entry for entry in (search_hit_entry(fid, score, keyword) for fid, score in hits) if entry]
+        else:
+            files, next_cursor = file_store.page(
+                limit, request.args.get('cursor'), file_ids=[file_id] if file_id else None)
+    except InvalidPageRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    print(f"🔍 搜索请求 - 关键词: '{keyword}', 文件ID: '{file_id}', 结果数量: {len(files)}")
+    print(f"🔍 搜索请求 - 关键词: '{keyword}', 文件ID: '{file_id}', 本页数量: {len(files)}")
     
     return jsonify({
         'success': True,
-        'files': files,
-        'count': len(files)
+        'files': [project(f, fields) for f in files],
+        'count': len(files),
+        'next_cursor': next_cursor
     })
 
 def search_files(file_id=None, user_id=None, keyword=None):
     """优化文件搜索功能"""
-    files = load_files()
+    if user_id:
+        files = file_store.by_user(user_id)
+    elif file_id:
+        file_info = file_store.get(file_id)
+        files = {file_id: file_info} if file_info else {}
+    else:
+        files = file_store.all()
     results = []
     
     print(f"🔍 搜索文件 - file_id: {file_id}, user_id: {user_id}, keyword: {keyword}")
     
+    if keyword:
+        # 🎯 关键词检索走全文索引，结果按相关度排序
+        hits, _ = search_files_in_content(keyword, file_id=file_id)
+        results = [
+            {'file_id': fid, **files[fid], 'score': score}
+            for fid, score in hits if fid in files
+        ]
+        print(f"✅ 搜索完成，找到 {len(results)} 个文件")
+        return results
+    
     for fid, file_info in files.items():
         match = True
         
@@ -2523,16 +2719,6 @@ def search_files(file_id=None, user_id=None, keyword=None):
             match = False
         if user_id and file_info['user_id'] != user_id:
             match = False
-        if keyword:
-            keyword_lower = keyword.lower()
-            # 🎯 优化：在文件名和内容中搜索，提高搜索准确性
-            filename_match = keyword_lower in file_info['filename'].lower()
-            content_match = keyword_lower in file_info['content'].lower()
-            file_id_match = keyword_lower in fid.lower()
-            user_id_match = keyword_lower in file_info['user_id'].lower()
-            
-            if not (filename_match or content_match or file_id_match or user_id_match):
-                match = False
                 
         if match:
             results.append({
@@ -2546,9 +2732,27 @@ def search_files(file_id=None, user_id=None, keyword=None):
     print(f"✅ 搜索完成，找到 {len(sorted_results)} 个文件")
     return sorted_results
 
+# /community/files 返回的字段（不含正文，正文通过 /community/file/<file_id> 获取）
+COMMUNITY_FILE_FIELDS = ('file_id', 'filename', 'user_id', 'content', 'content_size', 'upload_time',
+                         'reference_count', 'total_reward', 'authorize_rag', 'ipfs_url', 'score', 'snippet')
+
+def community_file_entry(file_data):
+    return {
+        'file_id': file_data['file_id'],
+        'filename': file_data.get('filename', ''),
+        'user_id': file_data.get('user_id', ''),
+        'content': file_data.get('content_preview') or '',
+        'content_size': file_data.get('content_size') or 0,
+        'upload_time': file_data.get('upload_time', ''),
+        'reference_count': file_data.get('reference_count', 0),
+        'total_reward': file_data.get('total_reward', 0.0),
+        'authorize_rag': file_data.get('authorize_rag', False),
+        'ipfs_url': file_data.get('ipfs_url', '')
+    }
+
 @app.route('/community/files', methods=['GET'])
 def get_community_files():
-    """获取社区所有文件或搜索文件"""
+    """获取社区文件或搜索文件，按上传时间（搜索时按相关度）倒序游标分页（limit / cursor / fields）"""
     try:
         print("📥 收到社区文件请求")
         
@@ -2556,67 +2760,39 @@ def get_community_files():
         keyword = request.args.get('keyword', '').strip()
         print(f"🔍 搜索关键词: '{keyword}'")
         
-        # 加载文件数据
-        files = load_files()
-        
-        if not files:
-            print("⚠️ files.json为空或不存在")
-            return jsonify({
-                'success': True,
-                'message': '暂无文件数据',
-                'files': [],
-                'total_count': 0
-            })
-        
-        # 处理文件数据
-        file_list = []
-        
-        if keyword:
-            # 执行搜索
-            print(f"🔍 开始搜索，关键词: {keyword}")
-            search_results = search_files_in_content(files, keyword)
-            print(f"✅ 找到 {len(search_results)} 个匹配文件")
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            fields = parse_fields(request.args.get('fields'), COMMUNITY_FILE_FIELDS)
             
-            for file_id in search_results:
-                file_data = files[file_id]
-                file_list.append({
-                    'file_id': file_id,
-                    'filename': file_data.get('filename', ''),
-                    'user_id': file_data.get('user_id', ''),
-                    'content': file_data.get('content_preview', file_data.get('content', '')),
-                    'content_full': file_data.get('content', ''),
-                    'upload_time': file_data.get('upload_time', ''),
-                    'reference_count': file_data.get('reference_count', 0),
-                    'total_reward': file_data.get('total_reward', 0.0),
-                    'authorize_rag': file_data.get('authorize_rag', False),
-                    'ipfs_url': file_data.get('ipfs_url', '')
-                })
-        else:
-            # 返回所有文件
-            print(f"📂 返回所有文件，共 {len(files)} 个")
-            for file_id, file_data in files.items():
-                file_list.append({
-                    'file_id': file_id,
-                    'filename': file_data.get('filename', ''),
-                    'user_id': file_data.get('user_id', ''),
-                    'content': file_data.get('content_preview', file_data.get('content', '')),
-                    'content_full': file_data.get('content', ''),
-                    'upload_time': file_data.get('upload_time', ''),
-                    'reference_count': file_data.get('reference_count', 0),
-                    'total_reward': file_data.get('total_reward', 0.0),
-                    'authorize_rag': file_data.get('authorize_rag', False),
-                    'ipfs_url': file_data.get('ipfs_url', '')
-                })
-        
-        # 按上传时间倒序排序
-        file_list.sort(key=lambda x: x.get('upload_time', ''), reverse=True)
-        
-        print(f"✅ 返回 {len(file_list)} 个文件")
+            if keyword:
+                # 执行全文检索，按相关度分页
+                print(f"🔍 开始搜索，关键词: {keyword}")
+                conn = get_db_connection()
+                total_count = search_index.count(conn, keyword)
+                conn.close()
+                print(f"✅ 找到 {total_count} 个匹配文件")
+                hits, next_cursor = search_files_in_content(keyword, limit, request.args.get('cursor'))
+                file_list = []
+                for fid, score in hits:
+                    entry = search_hit_entry(fid, score, keyword)
+                    if entry:
+                        file_list.append(project(
+                            {**community_file_entry(entry), 'score': score, 'snippet': entry['snippet']}, fields))
+            else:
+                total_count = file_store.count()
+                files, next_cursor = file_store.page(limit, request.args.get('cursor'))
+                file_list = [project(community_file_entry(f), fields) for f in files]
+        except InvalidPageRequest as e:
+            return jsonify({'success': False, 'message': str(e), 'files': [], 'total_count': 0}), 400
+        
+        print(f"✅ 返回 {len(file_list)} 个文件（共 {total_count} 个）")
         return jsonify({
             'success': True,
-            'message': '文件数据获取成功',
+            'message': '文件数据获取成功' if total_count else '暂无文件数据',
             'files': file_list,
-            'total_count': len(file_list)
+            'count': len(file_list),
+            'total_count': total_count,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -2636,25 +2812,15 @@ def get_file_detail(file_id):
     try:
         print(f"📥 获取文件详情，文件ID: {file_id}")
         
-        # 加载文件数据
-        files = load_files()
-        
-        if not files:
-            print("⚠️ files.json为空或不存在")
-            return jsonify({
-                'success': False,
-                'message': '文件数据库为空'
-            }), 404
+        file_data = file_store.get(file_id)
         
-        if file_id not in files:
+        if not file_data:
             print(f"❌ 文件不存在: {file_id}")
             return jsonify({
                 'success': False,
                 'message': '文件不存在'
             }), 404
         
-        file_data = files[file_id]
-        
         # 获取用户信息（如果需要）
         user_id = file_data.get('user_id', '')
         
@@ -2666,7 +2832,7 @@ def get_file_detail(file_id):
                 'file_id': file_id,
                 'filename': file_data.get('filename', ''),
                 'user_id': user_id,
-                'content': file_data.get('content', ''),
+                'content': file_store.get_content(file_id) or '',
                 'content_preview': file_data.get('content_preview', ''),
                 'upload_time': file_data.get('upload_time', ''),
                 'reference_count': file_data.get('reference_count', 0),
@@ -2692,10 +2858,18 @@ def get_community_stats():
     try:
         print("📊 获取社区统计信息")
         
-        files = load_files()
+        # 计数随上传和结算在同一事务中更新，这里只读一行
+        conn = get_db_connection()
+        stats = community_stats.get(conn)
+        conn.close()
         
-        if not files:
-            print("⚠️ files.json为空或不存在")
+        total_files = stats['total_files']
+        total_references = stats['total_references']
+        total_rewards = stats['total_rewards']
+        active_authors = stats['active_authors']
+        
+        if not total_files:
+            print("⚠️ 文件库为空")
             return jsonify({
                 'success': True,
                 'message': '暂无统计信息',
@@ -2707,17 +2881,6 @@ def get_community_stats():
                 }
             })
         
-        # 计算统计数据
-        total_files = len(files)
-        total_references = sum(f.get('reference_count', 0) for f in files.values())
-        total_rewards = sum(f.get('total_reward', 0.0) for f in files.values())
-        
-        # 统计活跃作者
-        authors = set()
-        for file_data in files.values():
-            authors.add(file_data.get('user_id', ''))
-        active_authors = len(authors)
-        
         print(f"📊 社区统计: 文件={total_files}, 引用={total_references}, 收益={total_rewards}, 作者={active_authors}")
         
         return jsonify({
@@ -2747,39 +2910,21 @@ def handle_connect():
     emit('system_message', {'type': 'info', 'content': '后端WebSocket连接成功'})
 
 
-# 存储用户的转账确认状态
-user_transaction_confirmations = {}
+# 转账确认按每次请求的关联ID分发，等待方阻塞在事件上直到确认到达
+confirmation_broker = ConfirmationBroker()
 
 
-def wait_for_transaction_confirmation(user_id, timeout=120):
+def wait_for_transaction_confirmation(confirmation_id, timeout=120):
     """等待用户的转账确认
     
     Args:
-        user_id: 用户ID
+        confirmation_id: confirmation_broker.open() 返回的关联ID
         timeout: 超时时间（秒）
         
     Returns:
         tuple: (是否确认, 交易ID, 交易哈希)
     """
-    start_time = time.time()
-    
-    # 先清除之前的确认状态
-    if user_id in user_transaction_confirmations:
-        del user_transaction_confirmations[user_id]
-    
-    while time.time() - start_time < timeout:
-        # 检查用户的确认状态
-        if user_id in user_transaction_confirmations:
-            confirmation = user_transaction_confirmations[user_id]
-            # 清除已处理的确认状态
-            del user_transaction_confirmations[user_id]
-            return confirmation['confirmed'], confirmation['transaction_id'], confirmation['tx_hash']
-        
-        # 等待一小段时间
-        time.sleep(0.5)
-    
-    # 超时
-    return False, None, None
+    return confirmation_broker.wait(confirmation_id, timeout)
 
 @socketio.on('user_transaction_confirmation', namespace='/ws')
 def handle_user_transaction_confirmation(data):
@@ -2788,17 +2933,16 @@ def handle_user_transaction_confirmation(data):
     confirmed = data.get('confirmed')
     transaction_id = data.get('transaction_id')
     tx_hash = data.get('tx_hash')
+    confirmation_id = data.get('confirmation_id')
     
-    print(f"收到用户转账确认: 用户 {user_id}, 确认状态 {confirmed}, 交易ID {transaction_id}, 交易哈希 {tx_hash}")
+    print(f"收到用户转账确认: 用户 {user_id}, 确认状态 {confirmed}, 交易ID {transaction_id}, 交易哈希 {tx_hash}, 关联ID {confirmation_id}")
     
-    # 存储用户的确认状态
+    # 把确认送达对应的等待（前端传的是钱包地址，先解析为用户ID）
     if user_id:
-        user_transaction_confirmations[user_id] = {
-            'confirmed': confirmed,
-            'transaction_id': transaction_id,
-            'tx_hash': tx_hash,
-            'timestamp': datetime.now().isoformat()
-        }
+        resolved = confirmation_broker.resolve(
+            user_directory.resolve(user_id) or user_id, confirmed, transaction_id, tx_hash, confirmation_id)
+        if not resolved:
+            print(f"⚠️ 没有与该确认匹配的等待: 用户 {user_id}, 关联ID {confirmation_id}")
     
     # 发送确认消息给客户端
     emit('system_message', {
@@ -2908,78 +3052,45 @@ def get_dashboard_data():
         print("⚠️ 钱包地址为空")
         return jsonify({'success': False, 'message': '钱包地址不能为空'})
     
-    # 从JSON文件加载数据
-    users = load_users()
-    
     print(f"🔍 检查用户是否存在，钱包地址: {wallet_address}")
-    print(f"📁 用户列表中的用户: {list(users.keys())}")
-    
-    # 检查用户是否存在
-    if wallet_address not in users:
-        # 检查是否作为wallet_account存在
-        user_found = False
-        user_id = None
-        for uid, user_data in users.items():
-            if user_data.get('wallet_account') == wallet_address:
-                user_found = True
-                user_id = uid
-                print(f"✅ 通过wallet_account找到用户: {uid}")
-                break
-        
-        if not user_found:
-            print(f"❌ 用户不存在于users.json: {wallet_address}")
-            return jsonify({'success': False, 'message': '钱包未注册，请先连接钱包'})
-    else:
-        user_id = wallet_address
-        print(f"✅ 用户ID直接匹配: {user_id}")
     
-    user_data = users[user_id]
+    # 按user_id或wallet_account解析用户
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
+        print(f"❌ 用户不存在: {wallet_address}")
+        return jsonify({'success': False, 'message': '钱包未注册，请先连接钱包'})
+    print(f"✅ 找到用户: {user_id}")
+    
+    user_data = dict(get_user(user_id))
+    uploaded_file_ids = get_uploaded_files(user_id)
     
     # 计算统计数据
-    # 1. 总收益 - 直接从users.json获取
+    # 1. 总收益
     total_earned = user_data.get('total_earned', 0.0)
     print(f"💰 总收益: {total_earned}")
     
     # 2. Data NFT数量（上传的文件数量）
-    data_nft_count = len(user_data.get('uploaded_files', []))
+    data_nft_count = len(uploaded_file_ids)
     print(f"📁 Data NFT数量: {data_nft_count}")
     
-    # 3. AI调用次数（今日引用次数）
-    transactions = load_transactions()
-    today = datetime.now().date()
-    
-    ai_calls_today = 0
-    for tx in transactions:
-        tx_time = datetime.fromisoformat(tx['timestamp']).date()
-        if tx_time == today and tx.get('file_owner') == user_id and tx['type'] == 'reference':
-            ai_calls_today += 1
+    # 3. AI调用次数（今日引用次数）与 4. 本月增长（本月收益）均读取汇总表
+    conn = get_db_connection()
+    today_rollup = rollups.get_user_rollup(conn, user_id, 'day', datetime.now().date().isoformat())
+    month_rollup = rollups.get_user_rollup(conn, user_id, 'month', datetime.now().strftime('%Y-%m'))
+    conn.close()
     
+    ai_calls_today = today_rollup['reference_count']
     print(f"🤖 今日AI调用次数: {ai_calls_today}")
     
-    # 4. 本月增长（本月收益）
-    current_month = datetime.now().strftime('%Y-%m')
-    monthly_growth = 0.0
-    
-    for tx in transactions:
-        if tx['type'] == 'reward' and tx['to_user'] == user_id:
-            tx_time = datetime.fromisoformat(tx['timestamp'])
-            if tx_time.strftime('%Y-%m') == current_month:
-                monthly_growth += tx['amount']
+    monthly_growth = month_rollup['earned']
     
     print(f"📈 本月增长: {monthly_growth}")
     
-    # 获取最近活动（交易记录）
+    # 获取最近活动（交易记录），按时间倒序取最近5条
     recent_activity = []
-    user_transactions = []
-    
-    for tx in transactions:
-        if tx['from_user'] == user_id or tx['to_user'] == user_id or tx.get('file_owner') == user_id:
-            user_transactions.append(tx)
-    
-    # 按时间倒序排列，取最近5条
-    user_transactions.sort(key=lambda x: x['timestamp'], reverse=True)
+    user_transactions = transaction_index.recent(user_id, 5, fields=('from_user', 'to_user', 'file_owner'))
     
-    for i, tx in enumerate(user_transactions[:5]):
+    for i, tx in enumerate(user_transactions):
         activity_type = ""
         content = ""
         
@@ -3018,15 +3129,13 @@ def get_dashboard_data():
             })
     
     # 获取内容溯源（用户上传的文件信息）
-    files = load_files()
     content_tracing = []
     
-    uploaded_file_ids = user_data.get('uploaded_files', [])
     print(f"📄 用户上传的文件ID: {uploaded_file_ids}")
     
     for file_id in uploaded_file_ids[:5]:  # 只取前5个文件
-        if file_id in files:
-            file_info = files[file_id]
+        file_info = file_store.get(file_id)
+        if file_info:
             content_tracing.append({
                 'file_id': file_id,
                 'filename': file_info['filename'],
@@ -3072,7 +3181,7 @@ def get_dashboard_data():
             'content_tracing': content_tracing,
             'user_info': {
                 'user_id': user_id,
-                'wallet_address': user_data.get('wallet_account', user_id),
+                'wallet_address': user_data.get('wallet_account') or user_id,
                 'coin_balance': user_data.get('coin_balance', 0.0),
                 'total_earned': user_data.get('total_earned', 0.0),
                 'total_spent': user_data.get('total_spent', 0.0)
@@ -3090,50 +3199,24 @@ def dashboard_api():
 
 @app.route('/api/user/stats', methods=['GET'])
 def get_user_stats_api():
-    """获取用户统计信息（简化版）- 只使用JSON文件"""
+    """获取用户统计信息（简化版）"""
     wallet_address = request.args.get('wallet_address', '').strip()
     
     if not wallet_address:
         return jsonify({'success': False, 'message': '钱包地址不能为空'})
     
-    # 从JSON文件加载数据
-    users = load_users()
-    
-    # 检查用户是否存在
-    if wallet_address not in users:
-        # 检查是否作为wallet_account存在
-        user_found = False
-        user_id = None
-        for uid, user_data in users.items():
-            if user_data.get('wallet_account') == wallet_address:
-                user_found = True
-                user_id = uid
-                break
-        
-        if not user_found:
-            return jsonify({'success': False, 'message': '用户不存在'})
-    else:
-        user_id = wallet_address
+    # 按user_id或wallet_account解析用户
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
+        return jsonify({'success': False, 'message': '用户不存在'})
     
-    user_data = users[user_id]
+    user_data = dict(get_user(user_id))
     
     # 获取今日收益和引用
-    today = datetime.now().date()
-    transactions = load_transactions()
-    
-    today_earned = 0.0
-    today_references = 0
-    
-    for tx in transactions:
-        tx_time = datetime.fromisoformat(tx['timestamp']).date()
-        if tx_time == today:
-            if tx['type'] == 'reward' and tx['to_user'] == user_id:
-                today_earned += tx['amount']
-            elif tx['type'] == 'reference' and tx.get('file_owner') == user_id:
-                today_references += 1
+    today_earned, today_references = get_today_stats(user_id)
     
     # 获取上传文件数量
-    uploaded_files_count = len(user_data.get('uploaded_files', []))
+    uploaded_files_count = len(get_uploaded_files(user_id))
     
     return jsonify({
         'success': True,
@@ -3144,10 +3227,53 @@ def get_user_stats_api():
             'today_earned': today_earned,
             'today_references': today_references,
             'uploaded_files_count': uploaded_files_count,
-            'wallet_address': user_data.get('wallet_account', user_id)
+            'wallet_address': user_data.get('wallet_account') or user_id
         }
     })
 
+@app.route('/api/transaction_logs', methods=['GET'])
+def get_transaction_logs_api():
+    """按时间范围读取用户相关的交易审计日志，按时间正序分页（start / skip / end / limit）
+
+    响应中的 next_start、next_skip 作为下一页的 start、skip 传回，没有更多记录时 next_start 为 None。
+    """
+    wallet_address = request.args.get('wallet_address', '').strip()
+    if not wallet_address:
+        return jsonify({'success': False, 'message': '钱包地址不能为空'})
+
+    user_id = user_directory.resolve(wallet_address)
+    if not user_id:
+        return jsonify({'success': False, 'message': '用户不存在'})
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except InvalidPageRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    try:
+        skip = int(request.args.get('skip') or 0)
+    except ValueError:
+        skip = -1
+    if skip < 0:
+        return jsonify({'success': False, 'message': 'skip 必须是非负整数'}), 400
+
+    def user_entries():
+        for entry in read_transaction_logs(start, end):
+            tx = entry.get('transaction') or {}
+            if user_id in (tx.get('from_user'), tx.get('to_user'), tx.get('file_owner')):
+                yield entry
+
+    logs, next_start, next_skip = page_after(user_entries(), limit, start, skip)
+
+    return jsonify({
+        'success': True,
+        'logs': logs,
+        'count': len(logs),
+        'next_start': next_start,
+        'next_skip': next_skip
+    })
+
 
 @app.route('/stake', methods=['POST'])
 def handle_stake():
@@ -3176,21 +3302,8 @@ def handle_stake():
         conn.commit()
         conn.close()
         
-        # 更新数据库中的files表的total_staked字段
-        conn = get_db_connection()
-        conn.execute('''
-        UPDATE files 
-        SET total_staked = total_staked + ? 
-        WHERE id = ?
-        ''', (amount, file_id))
-        conn.commit()
-        conn.close()
-        
-        # 同时更新JSON文件以保持兼容性
-        files = load_files()
-        if file_id in files:
-            files[file_id]['total_staked'] = files[file_id].get('total_staked', 0) + amount
-            save_files(files)
+        # 更新files表的total_staked字段并刷新缓存
+        file_store.add_stake(file_id, amount)
         
         return jsonify({
             'success': True,
@@ -3206,14 +3319,24 @@ def handle_stake():
         return jsonify({'success': False, 'message': f'服务器错误: {str(e)}'})
 
 
+# GET /stake 可通过 fields 参数选择的字段
+STAKE_FIELDS = ('id', 'file_id', 'wallet_address', 'amount', 'content_id', 'stake_time', 'filename')
+
 @app.route('/stake', methods=['GET'])
 def get_stakes():
-    """获取质押记录"""
+    """获取质押记录，按质押时间倒序游标分页（limit / cursor / fields）"""
     try:
         # 获取查询参数
         wallet_address = request.args.get('wallet_address', '').strip()
         file_id = request.args.get('file_id', '').strip()
         
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            fields = parse_fields(request.args.get('fields'), STAKE_FIELDS)
+            cursor_clause, cursor_params = keyset_clause(STAKE_TIME_SORT, 't1.id', request.args.get('cursor'))
+        except InvalidPageRequest as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -3236,9 +3359,13 @@ def get_stakes():
         if wallet_address:
             query += " AND t1.wallet_address = ?"
             params.append(wallet_address)               
+        if cursor_clause:
+            query += " AND " + cursor_clause
+            params.extend(cursor_params)
         
-        # 按时间倒序排列
-        query += " ORDER BY t1.stake_time DESC"
+        # 按时间倒序排列，多取一条用于判断是否还有下一页
+        query += f" ORDER BY {STAKE_TIME_SORT} DESC, t1.id DESC LIMIT ?"
+        params.append(limit + 1)
 
         print(query, params)
         
@@ -3246,13 +3373,15 @@ def get_stakes():
         stakes = cursor.fetchall()
         conn.close()
         
-        for stake in stakes:
-            print(stake)
+        next_cursor = None
+        if len(stakes) > limit:
+            stakes = stakes[:limit]
+            next_cursor = encode_cursor(stakes[-1]['stake_time'] or '', stakes[-1]['id'])
 
         # 转换为字典列表
         stake_list = []
         for stake in stakes:
-            stake_list.append({
+            stake_list.append(project({
                 'id': stake['id'],
                 'file_id': stake['file_id'],
                 'wallet_address': stake['wallet_address'],
@@ -3260,12 +3389,13 @@ def get_stakes():
                 'content_id': stake['content_id'],
                 'stake_time': stake['stake_time'],
                 'filename': stake['filename']  # 新增文件名字段
-            })
+            }, fields))
         
         return jsonify({
             'success': True,
             'stakes': stake_list,
-            'count': len(stake_list)
+            'count': len(stake_list),
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -3283,6 +3413,12 @@ if __name__ == '__main__':
         try:
             count = vector_store._collection.count()
             print(f"✅ 向量库加载成功，包含 {count} 个文档")
+            # 升级后首次启动时为已有文档块建立关键词索引
+            conn = get_db_connection()
+            needs_rebuild = count > 0 and hybrid_retrieval.is_empty(conn)
+            conn.close()
+            if needs_rebuild:
+                rebuild_rag_chunk_index()
         except Exception as e:
             print(f"❌ 向量库访问错误: {e}")
     else:
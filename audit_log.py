@@ -0,0 +1,248 @@
+# audit_log.py - 交易审计日志
+"""
+替代 transaction_logs.json 的"读取全部-追加-重写"模式:
+记录由后台线程以换行分隔的JSON追加写入，按日期和大小轮转，
+已关闭的分段压缩为 .jsonl.gz；读取时按文件名中的日期筛选分段并逐行流式读取。
+
+文件命名: audit-YYYYMMDD-NNN.jsonl[.gz]
+
+旧版 transaction_logs.json 在首次启动时按记录日期导入为分段，导入后改名为 .imported，不会重复导入。
+"""
+import os
+import re
+import gzip
+import json
+import queue
+import shutil
+import threading
+from datetime import datetime
+
+_SEGMENT_RE = re.compile(r'^audit-(\d{8})-(\d{3})\.jsonl(\.gz)?$')
+_STOP = object()
+
+
+class AuditLog:
+    """后台线程写入的轮转审计日志
+
+    Args:
+        directory: 日志目录
+        max_bytes: 单个分段的大小上限
+        compress: 是否压缩已关闭的分段
+        flush_interval: 队列空闲时最长多久 flush 一次（秒）
+        legacy_json: 旧版 transaction_logs.json 路径，存在时导入一次
+    """
+
+    def __init__(self, directory='transaction_logs', max_bytes=16 * 1024 * 1024, compress=True,
+                 flush_interval=1.0, legacy_json=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.flush_interval = flush_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue()
+        self._file = None
+        self._day = None
+        self._seq = 0
+        self._size = 0
+
+        # 上次运行遗留的未压缩分段（非当天的）在启动时补压缩
+        if compress:
+            today = datetime.now().strftime('%Y%m%d')
+            for name in os.listdir(directory):
+                match = _SEGMENT_RE.match(name)
+                if match and not match.group(3) and match.group(1) != today:
+                    self._compress(os.path.join(directory, name))
+
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _import_legacy(self, legacy_json):
+        """把旧版 JSON 数组按记录日期写成已关闭的分段，全部落盘后再改名旧文件"""
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 无法导入旧审计日志 {legacy_json}: {e}")
+            return
+
+        by_day = {}
+        for record in sorted(records, key=lambda r: r.get('timestamp', '')):
+            day = record.get('timestamp', '')[:10].replace('-', '')
+            if not re.fullmatch(r'\d{8}', day):
+                day = datetime.now().strftime('%Y%m%d')
+            by_day.setdefault(day, []).append(record)
+
+        # 先写临时文件，全部写完再改名，导入中途崩溃时下次启动重新导入而不会重复
+        written = []
+        for day, day_records in by_day.items():
+            name = f"audit-{day}-{self._next_seq(day):03d}.jsonl" + ('.gz' if self.compress else '')
+            path = os.path.join(self.directory, name)
+            opener = gzip.open if self.compress else open
+            with opener(path + '.tmp', 'wb') as f:
+                for record in day_records:
+                    f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            written.append(path)
+        for path in written:
+            os.replace(path + '.tmp', path)
+        os.replace(legacy_json, legacy_json + '.imported')
+        print(f"✅ 已从 {legacy_json} 导入 {len(records)} 条审计日志")
+
+    # ---------- 写入 ----------
+
+    def write(self, record):
+        """提交一条记录，立即返回，由后台线程写入"""
+        self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """等待队列中已提交的记录全部写入磁盘"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._file:
+                    self._file.flush()
+                continue
+
+            if item is _STOP:
+                self._close_segment(compress=False)
+                return
+            if isinstance(item, threading.Event):
+                if self._file:
+                    self._file.flush()
+                item.set()
+                continue
+
+            try:
+                self._write_record(item)
+            except Exception as e:
+                print(f"❌ 写入审计日志失败: {e}")
+
+    def _write_record(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        day = datetime.now().strftime('%Y%m%d')
+        if self._file is None or day != self._day or self._size + len(line) > self.max_bytes:
+            self._rotate(day)
+        self._file.write(line)
+        self._size += len(line)
+
+    def _next_seq(self, day):
+        seq = 0
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match and match.group(1) == day:
+                seq = max(seq, int(match.group(2)) + 1)
+        return seq
+
+    def _rotate(self, day):
+        self._close_segment(compress=self.compress)
+        self._day = day
+        self._seq = self._next_seq(day)
+        path = os.path.join(self.directory, f"audit-{day}-{self._seq:03d}.jsonl")
+        self._file = open(path, 'ab')
+        self._size = 0
+
+    def _close_segment(self, compress):
+        if self._file is None:
+            return
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        if compress:
+            self._compress(path)
+
+    @staticmethod
+    def _compress(path):
+        # 先压缩到临时文件再原子改名，读取方不会看到写了一半的 .gz；
+        # 改名后、删除原文件前两者并存，read_range 会跳过有同名 .gz 的 .jsonl
+        tmp_path = path + '.gz.tmp'
+        try:
+            with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, path + '.gz')
+            os.remove(path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"⚠️ 压缩审计日志分段失败 {path}: {e}")
+
+    # ---------- 读取 ----------
+
+    def read_range(self, start=None, end=None):
+        """流式读取时间戳在 [start, end) 内的记录，start/end 为 ISO 格式字符串
+
+        只打开日期可能落在范围内的分段，逐行解析，不整体加载文件。
+        """
+        start_day = start[:10].replace('-', '') if start else None
+        end_day = end[:10].replace('-', '') if end else None
+
+        names = set(os.listdir(self.directory))
+        segments = []
+        for name in names:
+            match = _SEGMENT_RE.match(name)
+            if not match:
+                continue
+            if not match.group(3) and name + '.gz' in names:
+                # 压缩已完成、原文件尚未删除，只读 .gz
+                continue
+            day = match.group(1)
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            segments.append((day, int(match.group(2)), name))
+
+        for _, _, name in sorted(segments):
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) and os.path.exists(path + '.gz'):
+                # 列目录之后该分段已被压缩
+                path += '.gz'
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    record = json.loads(line)
+                    timestamp = record.get('timestamp', '')
+                    if start and timestamp < start:
+                        continue
+                    if end and timestamp >= end:
+                        continue
+                    yield record
+
+
+def page_after(records, limit, start=None, skip=0):
+    """从按时间正序的记录流中取一页，游标为 (start, skip)，不含已返回的记录
+
+    start 为上一页第一条未返回记录的时间戳，skip 为该时间戳上已返回的记录数，
+    同一时间戳的多条记录跨页时不会重复也不会遗漏。
+
+    Returns:
+        (page, next_start, next_skip)，没有更多记录时 next_start 为 None
+    """
+    page = []
+    run_timestamp = None
+    run_count = 0
+    for record in records:
+        timestamp = record.get('timestamp', '')
+        if timestamp != run_timestamp:
+            run_timestamp = timestamp
+            run_count = 0
+        if start is not None and timestamp == start and run_count < skip:
+            run_count += 1
+            continue
+        if len(page) == limit:
+            return page, timestamp, run_count
+        page.append(record)
+        run_count += 1
+    return page, None, 0
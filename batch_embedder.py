@@ -0,0 +1,108 @@
+# batch_embedder.py - 入库时的批量并发嵌入
+"""
+init_vector_store 原先逐块调用 embed_query，遇到502固定等待5秒再试，长文档入库需要数分钟。
+这里把文档块按服务端单次上限（DashScope为25条）分批调用 embed_documents，
+多个批次在有限并发下同时请求；临时性错误按指数退避加随机抖动重试，
+重试用尽后整批记为失败（服务端持续不可用时拆分只会成倍增加等待时间）；
+非临时性错误（例如某一条文本不合法）时对半拆分，把问题文本隔离出来，其余文本照常嵌入。
+已成功的批次结果保留（经 CachedEmbeddings 落盘，重新上传时不会重复请求）。
+"""
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+# 视为临时性故障、值得重试的错误特征
+TRANSIENT_ERROR_MARKERS = ('502', '503', '504', '429', 'Throttling', 'timeout', 'Timeout',
+                           'Connection', 'temporarily')
+
+
+class EmbeddingBatchError(Exception):
+    """部分文档块在重试后仍无法嵌入"""
+
+    def __init__(self, failed_indices, last_error):
+        self.failed_indices = failed_indices
+        self.last_error = last_error
+        super().__init__(f"{len(failed_indices)} 个文档块嵌入失败: {last_error}")
+
+
+def is_transient(error):
+    message = f"{type(error).__name__}: {error}"
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+class BatchEmbedder:
+    """分批、限并发、带退避重试的嵌入器
+
+    Args:
+        embeddings: 提供 embed_documents 的嵌入模型
+        batch_size: 每批文本数（服务端单次请求上限）
+        max_concurrency: 同时进行的请求数
+        max_retries: 每批最多重试次数
+        base_delay: 首次重试前的退避上限（秒），之后每次翻倍
+        max_delay: 单次退避的上限（秒）
+    """
+
+    def __init__(self, embeddings, batch_size=25, max_concurrency=4, max_retries=5, base_delay=1.0,
+                 max_delay=30.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='batch-embedder')
+
+    def _backoff(self, attempt):
+        # full jitter：在 [0, min(上限, base * 2^attempt)] 内随机等待，避免多个批次同时重试
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))))
+
+    def _embed_with_retry(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"返回向量数 {len(vectors)} 与文本数 {len(texts)} 不一致")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                print(f"⚠️ 嵌入批次（{len(texts)} 条）失败，第 {attempt + 1} 次重试: {e}")
+                self._backoff(attempt)
+
+    def _embed_batch(self, start, texts):
+        """嵌入一个批次，返回 ({序号: 向量}, {失败序号: 错误})；非临时性错误时对半拆分再试"""
+        try:
+            vectors = self._embed_with_retry(texts)
+            return {start + i: vector for i, vector in enumerate(vectors)}, {}
+        except Exception as e:
+            if len(texts) == 1 or is_transient(e):
+                return {}, {start + i: e for i in range(len(texts))}
+            print(f"⚠️ 嵌入批次（{len(texts)} 条）失败，拆分后重试: {e}")
+            middle = len(texts) // 2
+            left_done, left_failed = self._embed_batch(start, texts[:middle])
+            right_done, right_failed = self._embed_batch(start + middle, texts[middle:])
+            return {**left_done, **right_done}, {**left_failed, **right_failed}
+
+    def embed(self, texts):
+        """嵌入全部文本，返回 (向量列表, 统计信息)；有文本最终失败时抛出 EmbeddingBatchError"""
+        started = time.perf_counter()
+        futures = [
+            self._executor.submit(self._embed_batch, start, texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        done, failed = {}, {}
+        for future in futures:
+            batch_done, batch_failed = future.result()
+            done.update(batch_done)
+            failed.update(batch_failed)
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            'chunks': len(texts),
+            'batches': len(futures),
+            'seconds': elapsed,
+            'chunks_per_second': len(texts) / elapsed if texts and elapsed > 0 else 0.0
+        }
+        if failed:
+            raise EmbeddingBatchError(sorted(failed), next(iter(failed.values())))
+        return [done[i] for i in range(len(texts))], stats
@@ -0,0 +1,113 @@
+# batch_scoring.py - 候选文档相似度的批量计算
+"""
+与 calculate_semantic_similarity 使用同一套打分公式，但一次处理全部候选:
+候选向量组成矩阵后一次算出余弦相似度，Jaccard重合度用词表上的0/1矩阵计算，
+长度因子、关键词增强和sigmoid混合也都按向量整体运算，候选数增加到上百个时开销基本不变。
+
+打分结果与逐个调用 calculate_semantic_similarity 一致（仅有浮点舍入级别的差异）。
+"""
+import numpy as np
+
+# 判定"概念性问题"的关键词（打分公式使用，不含"为什么"）
+CONCEPTUAL_MARKERS = ["什么是", "什么叫", "定义", "概念", "含义", "解释"]
+
+# 问题中出现某个概念时，文档命中其相关词越多，相似度提升越多
+CONCEPT_KEYWORDS = {
+    "爱": ["爱", "爱情", "爱心", "关爱", "热爱", "情感", "感情", "关系", "亲密", "定义", "概念"],
+    "什么是": ["定义", "概念", "含义", "解释", "是什么", "什么叫", "意味着", "指的是"],
+    "编程语言": ["编程", "语言", "编程语言", "代码", "程序", "计算机", "语法", "语义", "功能"]
+}
+
+
+def cosine_similarities(question_embedding, doc_embeddings):
+    """问题向量与每个候选向量的余弦相似度，零向量记为0"""
+    q = np.asarray(question_embedding, dtype=float).flatten()
+    matrix = np.asarray(doc_embeddings, dtype=float).reshape(len(doc_embeddings), -1)
+    dots = matrix @ q
+    q_norm = np.linalg.norm(q)
+    doc_norms = np.linalg.norm(matrix, axis=1)
+    valid = matrix.any(axis=1) & (doc_norms != 0) & bool(q.any()) & (q_norm != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarities = np.clip(dots / (doc_norms * q_norm), -1.0, 1.0)
+    return np.where(valid, similarities, 0.0)
+
+
+def jaccard_similarities(question, contents):
+    """问题与每个候选按空白分词后的Jaccard重合度"""
+    question_words = set(question.lower().split())
+    doc_words = [set(content.lower().split()) for content in contents]
+    vocabulary = {word: i for i, word in enumerate(question_words.union(*doc_words))}
+
+    doc_matrix = np.zeros((len(contents), len(vocabulary)), dtype=np.int64)
+    for row, words in enumerate(doc_words):
+        doc_matrix[row, [vocabulary[word] for word in words]] = 1
+    question_vector = np.zeros(len(vocabulary), dtype=np.int64)
+    question_vector[[vocabulary[word] for word in question_words]] = 1
+
+    intersection = doc_matrix @ question_vector
+    union = doc_matrix.sum(axis=1) + question_vector.sum() - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+def keyword_boosts(question, contents, is_conceptual_question):
+    """按 CONCEPT_KEYWORDS 的顺序，每个候选取第一个有命中的概念计算提升"""
+    boosts = np.zeros(len(contents))
+    assigned = np.zeros(len(contents), dtype=bool)
+    rate, cap = (0.08, 0.25) if is_conceptual_question else (0.05, 0.15)
+    for concept, keywords in CONCEPT_KEYWORDS.items():
+        if concept not in question:
+            continue
+        matches = np.array([sum(1 for keyword in keywords if keyword in content) for content in contents])
+        hit = ~assigned & (matches > 0)
+        boosts = np.where(hit, np.minimum(cap, matches * rate), boosts)
+        assigned |= hit
+    return boosts
+
+
+def score_candidates(question, contents, question_embedding, doc_embeddings):
+    """批量计算综合相似度
+
+    Args:
+        question: 用户问题
+        contents: 候选文档块文本列表
+        question_embedding: 问题向量
+        doc_embeddings: 与 contents 一一对应的文档块向量
+
+    Returns:
+        (综合相似度数组, 各分量字典)
+    """
+    if not contents:
+        return np.zeros(0), {}
+    is_conceptual_question = any(keyword in question for keyword in CONCEPTUAL_MARKERS)
+
+    base = cosine_similarities(question_embedding, doc_embeddings)
+    jaccard = jaccard_similarities(question, contents)
+    boosts = keyword_boosts(question, contents, is_conceptual_question)
+
+    word_counts = np.array([len(content.split()) for content in contents], dtype=float)
+    length_factor = np.minimum(1.0, word_counts / (25 if is_conceptual_question else 40))
+
+    question_len = len(question)
+    doc_lens = np.array([len(content) for content in contents], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length_similarity = np.where(
+            (question_len > 0) & (doc_lens > 0),
+            1 - np.abs(question_len - doc_lens) / (question_len + doc_lens),
+            0.0
+        )
+
+    if is_conceptual_question:
+        blended = 0.75 * base + 0.05 * jaccard + 0.1 * length_factor + 0.1 * length_similarity + boosts
+        scores = 1 / (1 + np.exp(-6 * (blended - 0.4)))
+    else:
+        blended = 0.8 * base + 0.05 * jaccard + 0.1 * length_factor + 0.05 * length_similarity + boosts
+        scores = 1 / (1 + np.exp(-10 * (blended - 0.55)))
+
+    components = {
+        'base': base,
+        'jaccard': jaccard,
+        'length_factor': length_factor,
+        'keyword_boost': boosts
+    }
+    return scores, components
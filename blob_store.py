@@ -0,0 +1,64 @@
+# blob_store.py - 按内容寻址的文档正文存储
+"""
+文档正文按 SHA-256 寻址存放在 blobs/ 目录下，元数据只保存哈希、大小和预览，
+需要正文时才按哈希读取。相同内容只存一份。
+
+目录结构: blobs/ab/cdef0123...（前两位十六进制作为子目录）
+"""
+import os
+import hashlib
+import tempfile
+
+
+class BlobStore:
+    """内容寻址的正文存储
+
+    Args:
+        root: 存储根目录
+    """
+
+    def __init__(self, root='blobs'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path_for(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash[2:])
+
+    def put(self, text):
+        """写入正文，返回 (哈希, 字节数)；内容已存在时不重复写入"""
+        data = text.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 每次写入使用独立的临时文件，同一进程内多个线程并发写入相同内容时互不干扰
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                            dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return content_hash, len(data)
+
+    def get(self, content_hash):
+        """按哈希读取正文，不存在时返回 None"""
+        if not content_hash:
+            return None
+        try:
+            with open(self.path_for(content_hash), 'rb') as f:
+                return f.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def exists(self, content_hash):
+        return bool(content_hash) and os.path.exists(self.path_for(content_hash))
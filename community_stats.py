@@ -0,0 +1,148 @@
+# community_stats.py - 社区统计计数表
+"""
+/community/stats 需要的文件数、总引用次数、总收益和作者数保存在单行的 community_stats 表中，
+上传文件和奖励结算时在同一个SQLite事务内增量更新，接口只需读取这一行。
+
+增量计数可能因为手工改库、旧版本写入等原因与files表产生偏差，
+后台对账任务定期从files表重新汇总，发现偏差时打印并以汇总结果为准:
+    python community_stats.py reconcile
+"""
+import sys
+import sqlite3
+import time
+import threading
+from contextlib import closing
+from datetime import datetime
+
+STAT_FIELDS = ('total_files', 'total_references', 'total_rewards', 'active_authors')
+
+
+def create_table(cursor):
+    """创建统计表（在 init_db 中调用）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS community_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_files INTEGER DEFAULT 0,
+        total_references INTEGER DEFAULT 0,
+        total_rewards REAL DEFAULT 0.0,
+        active_authors INTEGER DEFAULT 0,
+        updated_at TEXT,
+        reconciled_at TEXT
+    )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO community_stats (id) VALUES (1)')
+
+
+def record_upload(conn, file_id, user_id):
+    """新文件写入files表之后调用，不提交事务"""
+    conn.execute('''
+    UPDATE community_stats SET
+        total_files = total_files + 1,
+        active_authors = active_authors + NOT EXISTS (SELECT 1 FROM files WHERE user_id = ? AND id != ?),
+        updated_at = ?
+    WHERE id = 1
+    ''', (user_id, file_id, datetime.now().isoformat()))
+
+
+def record_rewards(conn, reference_count, reward_total):
+    """奖励结算时调用，不提交事务"""
+    conn.execute('''
+    UPDATE community_stats SET
+        total_references = total_references + ?,
+        total_rewards = total_rewards + ?,
+        updated_at = ?
+    WHERE id = 1
+    ''', (reference_count, reward_total, datetime.now().isoformat()))
+
+
+def get(conn):
+    row = conn.execute('SELECT {} FROM community_stats WHERE id = 1'.format(', '.join(STAT_FIELDS))).fetchone()
+    if row is None:
+        return {field: 0 for field in STAT_FIELDS}
+    return dict(zip(STAT_FIELDS, tuple(row)))
+
+
+def _compute(conn):
+    row = conn.execute('''
+    SELECT COUNT(*),
+           COALESCE(SUM(COALESCE(reference_count, 0)), 0),
+           COALESCE(SUM(COALESCE(total_reward, 0)), 0.0),
+           COUNT(DISTINCT user_id)
+    FROM files
+    ''').fetchone()
+    return dict(zip(STAT_FIELDS, tuple(row)))
+
+
+def reconcile(conn):
+    """从files表重新汇总并覆盖计数，返回发现的偏差 {字段: (计数值, 实际值)}"""
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')  # 汇总与覆盖之间不允许其他写入
+    try:
+        stored = get(conn)
+        actual = _compute(conn)
+        drift = {}
+        for field in STAT_FIELDS:
+            if abs((stored[field] or 0) - actual[field]) > 1e-9:
+                drift[field] = (stored[field], actual[field])
+        now = datetime.now().isoformat()
+        conn.execute('''
+        INSERT INTO community_stats (id, total_files, total_references, total_rewards, active_authors,
+                                     updated_at, reconciled_at)
+        VALUES (1, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            total_files = excluded.total_files,
+            total_references = excluded.total_references,
+            total_rewards = excluded.total_rewards,
+            active_authors = excluded.active_authors,
+            updated_at = CASE WHEN ? THEN excluded.updated_at ELSE updated_at END,
+            reconciled_at = excluded.reconciled_at
+        ''', tuple(actual[field] for field in STAT_FIELDS) + (now, now, bool(drift)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return drift
+
+
+def start_reconciler(connect, interval=600):
+    """启动后台对账线程，每 interval 秒对账一次
+
+    Args:
+        connect: 返回 sqlite3 连接的函数，线程内调用
+        interval: 对账间隔（秒）
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with closing(connect()) as conn:
+                    drift = reconcile(conn)
+                if drift:
+                    details = ', '.join(f"{field}: {before} -> {after}" for field, (before, after) in drift.items())
+                    print(f"⚠️ 社区统计计数出现偏差，已按files表修正: {details}")
+            except Exception as e:
+                print(f"❌ 社区统计对账失败: {e}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'reconcile':
+        print("用法: python community_stats.py reconcile [数据库文件]")
+        return 1
+
+    db_file = argv[2] if len(argv) > 2 else 'talktoearn.db'
+    conn = sqlite3.connect(db_file)
+    try:
+        create_table(conn.cursor())
+        drift = reconcile(conn)
+        print(f"✅ 对账完成，偏差: {drift or '无'}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
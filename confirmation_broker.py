@@ -0,0 +1,81 @@
+# confirmation_broker.py - 转账确认的等待与分发
+"""
+/ask 发出转账意图后需要等待用户在前端确认。原先按 user_id 在全局字典中每0.5秒轮询一次，
+同一钱包同时提出的两个问题会互相"抢走"对方的确认。
+
+这里每次等待都分配一个关联ID（confirmation_id），随转账意图一起发给前端，前端确认时原样带回:
+- 等待方阻塞在自己的 Event 上，空闲时不占用CPU，确认到达时立即被唤醒
+- 确认按关联ID精确送达，只有同一用户的确认才会被接受
+- 旧版前端不带关联ID时，确认交给该用户最早开始、尚未得到结果的等待
+- 等待结束（确认、取消或超时）后条目立即清理
+"""
+import uuid
+import time
+import threading
+
+
+class _PendingConfirmation:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.created_at = time.monotonic()
+        self.event = threading.Event()
+        self.result = None
+
+
+class ConfirmationBroker:
+    """按关联ID分发转账确认"""
+
+    def __init__(self):
+        self._pending = {}  # confirmation_id -> _PendingConfirmation，按创建顺序排列
+        self._lock = threading.Lock()
+
+    def open(self, user_id):
+        """登记一次等待，返回关联ID；需在发出转账意图之前调用，避免确认先于等待到达"""
+        confirmation_id = uuid.uuid4().hex
+        with self._lock:
+            self._pending[confirmation_id] = _PendingConfirmation(user_id)
+        return confirmation_id
+
+    def wait(self, confirmation_id, timeout):
+        """阻塞等待确认结果
+
+        Returns:
+            tuple: (是否确认, 交易ID, 交易哈希)；超时或关联ID不存在时为 (False, None, None)
+        """
+        with self._lock:
+            pending = self._pending.get(confirmation_id)
+        if pending is None:
+            return False, None, None
+        try:
+            if not pending.event.wait(timeout):
+                return False, None, None
+            return pending.result
+        finally:
+            with self._lock:
+                self._pending.pop(confirmation_id, None)
+
+    def resolve(self, user_id, confirmed, transaction_id=None, tx_hash=None, confirmation_id=None):
+        """送达一次确认，返回收到确认的关联ID；没有匹配的等待时返回 None"""
+        with self._lock:
+            if confirmation_id:
+                pending = self._pending.get(confirmation_id)
+                if pending is None or pending.user_id != user_id or pending.event.is_set():
+                    return None
+            else:
+                confirmation_id = next((cid for cid, p in self._pending.items()
+                                        if p.user_id == user_id and not p.event.is_set()), None)
+                if confirmation_id is None:
+                    return None
+                pending = self._pending[confirmation_id]
+            pending.result = (bool(confirmed), transaction_id, tx_hash)
+            pending.event.set()
+        return confirmation_id
+
+    def discard(self, confirmation_id):
+        """清理一次等待（发出意图后请求中断、未进入 wait 时调用），可重复调用"""
+        with self._lock:
+            self._pending.pop(confirmation_id, None)
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for p in self._pending.values() if not p.event.is_set())
@@ -0,0 +1,193 @@
+# db_pool.py - SQLite连接池
+"""
+每个线程（eventlet下为每个协程）复用一条SQLite连接，而不是每次调用都重新打开。
+
+连接打开时设置:
+- journal_mode=WAL：读写互不阻塞，/ask 读余额时不会被奖励写入卡住
+- synchronous=NORMAL：WAL模式下仍能保证提交不损坏，减少fsync
+- cache_size / mmap_size：页缓存与内存映射读
+- busy_timeout：写锁竞争时等待而不是立刻抛出 "database is locked"
+
+sqlite3 模块会在每条连接上缓存已编译的语句（cached_statements），
+连接复用后相同SQL无需重复编译。
+
+同一线程内嵌套获取连接时（例如 calculate_user_earnings 中调用 update_user），
+内层拿到的是建立在 SAVEPOINT 上的句柄：内层 commit 只释放自己的保存点，
+不会把外层尚未完成的事务提前提交；内层 close 时回滚自己未提交的修改。
+
+打开中的句柄按由外到内的顺序记在栈中（弱引用）。外层句柄 close 时连同漏掉 close 的内层句柄一起结束；
+句柄没有 close 就被回收（例如异常路径上泄漏）时，线程下次获取连接会回滚它遗留的修改，
+不会让之后的顶层句柄误建立在保存点上。
+"""
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+class _ThreadConnection:
+    """线程独占的底层连接及打开中的句柄栈（弱引用，由外到内，第 i 层使用保存点 pool_sp_i）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.handles = []
+
+    @property
+    def depth(self):
+        return len(self.handles)
+
+    def index(self, handle):
+        for i, ref in enumerate(self.handles):
+            if ref() is handle:
+                return i
+        return None
+
+    def discard_from(self, index):
+        """结束第 index 层及更内层的句柄，回滚它们未提交的修改"""
+        dropped = self.handles[index:]
+        del self.handles[index:]
+        for ref in dropped:
+            handle = ref()
+            if handle is not None:
+                handle._closed = True
+        if index == 0:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+        else:
+            self.conn.execute(f'ROLLBACK TO pool_sp_{index}')
+            self.conn.execute(f'RELEASE pool_sp_{index}')
+
+    def prune(self):
+        """没有 close 就被回收的句柄视为泄漏，从它所在的层开始回滚"""
+        for i, ref in enumerate(self.handles):
+            if ref() is None:
+                self.discard_from(i)
+                return
+
+
+class PooledConnection:
+    """池化连接的句柄，每次 connection() 返回一个新句柄
+
+    调用方保持原有的 get_db_connection() ... conn.close() 写法；
+    close() 并不真正关闭连接，只回滚本句柄未提交的修改后归还，重复调用无副作用。
+    嵌套句柄（savepoint 不为空）的 commit / rollback 只作用于自己的保存点。
+    """
+
+    def __init__(self, slot, savepoint=None):
+        self._slot = slot
+        self._conn = slot.conn
+        self._savepoint = savepoint
+        self._closed = False
+        if savepoint:
+            self._conn.execute(f'SAVEPOINT {savepoint}')
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        if self._savepoint:
+            # 释放后重新建立保存点，句柄可以继续写入并再次提交
+            self._conn.execute(f'RELEASE {self._savepoint}')
+            self._conn.execute(f'SAVEPOINT {self._savepoint}')
+        else:
+            self._conn.commit()
+
+    def rollback(self):
+        if self._savepoint:
+            self._conn.execute(f'ROLLBACK TO {self._savepoint}')
+        else:
+            self._conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """与 sqlite3 连接的 with 语义一致：正常退出时提交，异常时回滚"""
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def close(self):
+        if self._closed:
+            return
+        index = self._slot.index(self)
+        if index is None:
+            # 外层句柄已先结束，本句柄的保存点随之回滚
+            self._closed = True
+            return
+        self._slot.discard_from(index)
+
+
+class ConnectionPool:
+    """按线程复用的SQLite连接池
+
+    Args:
+        database: 数据库文件路径
+        busy_timeout: 写锁等待时间（秒）
+        cache_size_kb: 每条连接的页缓存大小（KB）
+        mmap_size: 内存映射读取的字节数上限
+        synchronous: PRAGMA synchronous 取值
+        cached_statements: 每条连接缓存的预编译语句数量
+    """
+
+    def __init__(self, database, busy_timeout=10.0, cache_size_kb=16000, mmap_size=256 * 1024 * 1024,
+                 synchronous='NORMAL', cached_statements=256):
+        self.database = database
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row  # 返回字典形式的行
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def connection(self):
+        """获取当前线程的连接句柄；当前线程已有未归还的句柄时，新句柄建立在保存点上"""
+        slot = getattr(self._local, 'conn', None)
+        if slot is None:
+            slot = _ThreadConnection(self._open())
+            self._local.conn = slot
+        # 线程被复用时，上一次使用泄漏的句柄在这里回滚
+        slot.prune()
+        savepoint = f'pool_sp_{slot.depth}' if slot.depth else None
+        pooled = PooledConnection(slot, savepoint)
+        slot.handles.append(weakref.ref(pooled))
+        return pooled
+
+    @contextmanager
+    def borrow(self):
+        """with pool.borrow() as conn: 离开作用域时自动 close，提前 return 或抛出异常也不会漏掉"""
+        conn = self.connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def release(self):
+        """重置当前线程的连接状态，在请求结束时调用，回滚遗留事务（例如异常路径上漏掉的 close）"""
+        slot = getattr(self._local, 'conn', None)
+        if slot is not None:
+            slot.discard_from(0)
+
+    def close(self):
+        """真正关闭当前线程的连接"""
+        slot = getattr(self._local, 'conn', None)
+        if slot is not None:
+            slot.conn.close()
+            self._local.conn = None
@@ -0,0 +1,54 @@
+# deadline_pool.py - 带总时限的并发任务执行
+"""
+一组相互独立的调用（例如逐块的LLM相关性判断）提交到有界线程池并发执行，
+整组共享一个截止时间：到期时已完成的结果照常返回，未完成的任务放弃等待，
+由调用方对这些任务采用降级策略。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class DeadlinePool:
+    """有界线程池 + 整组截止时间
+
+    Args:
+        max_workers: 最大并发数
+        name: 线程名前缀
+    """
+
+    def __init__(self, max_workers=4, name='deadline-pool'):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def run(self, tasks, deadline):
+        """并发执行 tasks，最多等待 deadline 秒
+
+        Args:
+            tasks: {键: 无参可调用对象}
+            deadline: 整组的等待时限（秒）
+
+        Returns:
+            (results, timed_out)
+            results: {键: 返回值}，只包含按时完成且未抛异常的任务
+            timed_out: 未能按时完成的键列表
+        """
+        if not tasks:
+            return {}, []
+        started = time.monotonic()
+        futures = {self._executor.submit(task): key for key, task in tasks.items()}
+        done, not_done = wait(futures, timeout=deadline)
+
+        results = {}
+        for future in done:
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"⚠️ 并发任务 {key} 执行失败: {e}")
+        for future in not_done:
+            future.cancel()  # 尚未开始的任务直接取消，已在执行的任务结果将被丢弃
+
+        timed_out = [futures[future] for future in not_done]
+        if timed_out:
+            print(f"⏱️ {time.monotonic() - started:.2f}s 截止时仍有 {len(timed_out)} 个任务未完成")
+        return results, timed_out
@@ -0,0 +1,149 @@
+# embedding_cache.py - 嵌入向量缓存
+"""
+包装 DashScopeEmbeddings，按 (模型, sha256(文本)) 缓存嵌入向量
+（DashScope对 query 和 document 两种文本类型给出的向量不同，两者分开缓存）:
+- 内存层：OrderedDict 实现的LRU，容量满时淘汰最久未用的条目
+- 持久层：独立的SQLite文件，向量以 float32 二进制存放，重启后仍然有效
+
+同一段文本（问题、文档块）只会向API请求一次。
+返回的向量统一为 float32 精度，首次计算和命中缓存时结果完全一致。
+"""
+import array
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+def _pack(vector):
+    return array.array('f', vector).tobytes()
+
+
+def _unpack(blob):
+    values = array.array('f')
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """带内存LRU和SQLite持久层的嵌入缓存
+
+    Args:
+        base: 实际调用API的嵌入模型（如 DashScopeEmbeddings）
+        model: 模型名称，作为缓存键的一部分，换模型后不会误用旧向量
+        path: 持久层SQLite文件路径
+        memory_size: 内存层最多缓存的向量数
+    """
+
+    def __init__(self, base, model, path='embedding_cache.db', memory_size=10000):
+        self.base = base
+        self.model = model
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_type TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, text_type, text_hash)
+        )
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    # ---------- 缓存层 ----------
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, text_type, keys):
+        """依次查内存层和持久层，返回 {hash: 向量}"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get((text_type, key))
+                if vector is not None:
+                    self._memory.move_to_end((text_type, key))
+                    found[key] = vector
+            missing = [key for key in keys if key not in found]
+            self._stats['memory_hits'] += len(found)
+
+            if missing:
+                placeholders = ', '.join('?' for _ in missing)
+                rows = self._conn.execute(
+                    'SELECT text_hash, vector FROM embeddings '
+                    f'WHERE model = ? AND text_type = ? AND text_hash IN ({placeholders})',
+                    [self.model, text_type] + missing
+                ).fetchall()
+                for key, blob in rows:
+                    vector = _unpack(blob)
+                    found[key] = vector
+                    self._remember((text_type, key), vector)
+                self._stats['disk_hits'] += len(rows)
+        return found
+
+    def _store(self, text_type, entries):
+        """写入新计算的向量，entries 为 {hash: 向量}"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, text_type, text_hash, dim, vector) VALUES (?, ?, ?, ?, ?)',
+                [(self.model, text_type, key, len(vector), _pack(vector)) for key, vector in entries.items()]
+            )
+            self._conn.commit()
+            for key, vector in entries.items():
+                self._remember((text_type, key), vector)
+            self._stats['misses'] += len(entries)
+
+    # ---------- Embeddings 接口 ----------
+
+    def embed_documents(self, texts):
+        keys = [self.text_hash(text) for text in texts]
+        found = self._lookup('document', list(dict.fromkeys(keys)))
+
+        # 未命中的文本去重后一次性交给底层模型
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            vectors = self.base.embed_documents(list(pending.values()))
+            computed = {key: _unpack(_pack(vector)) for key, vector in zip(pending, vectors)}
+            self._store('document', computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self.text_hash(text)
+        found = self._lookup('query', [key])
+        if key in found:
+            return found[key]
+        vector = _unpack(_pack(self.base.embed_query(text)))
+        self._store('query', {key: vector})
+        return vector
+
+    # ---------- 统计 ----------
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,291 @@
+# file_store.py - 基于SQLite files表的文件元数据存储
+"""
+文件元数据以SQLite files表为准，进程内维护一份读缓存，写入时同步刷新对应条目。
+文档正文不在元数据中，只记录 content_hash / content_size，正文按需从 BlobStore 读取。
+files.json 仅作为可选导出:
+    python file_store.py export [数据库文件] [导出路径]
+"""
+import sys
+import json
+import sqlite3
+import threading
+
+import community_stats
+from pagination import keyset_clause, encode_cursor
+
+# 分页排序列：upload_time 为空的旧记录按空字符串排在最后，而不是被游标条件过滤掉
+UPLOAD_TIME_SORT = "COALESCE(upload_time, '')"
+# 单条语句中 id IN (...) 的参数个数上限，低于旧版SQLite的 999 个变量限制
+MAX_IN_PARAMS = 500
+
+FILE_COLUMNS = ('filename', 'user_id', 'content_hash', 'content_size', 'content_preview', 'upload_time',
+                'authorize_rag', 'reference_count', 'total_reward', 'file_path', 'ipfs_url', 'total_staked')
+
+
+def create_indexes(cursor):
+    """补充正文哈希列并为files表的常用查询列建立索引（在 init_db 中调用）"""
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(files)').fetchall()}
+    if 'content_hash' not in existing:
+        cursor.execute('ALTER TABLE files ADD COLUMN content_hash TEXT')
+    if 'content_size' not in existing:
+        cursor.execute('ALTER TABLE files ADD COLUMN content_size INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_user_id ON files (user_id)')
+    # (COALESCE(upload_time, ''), id) 表达式索引用于按上传时间倒序的游标分页
+    cursor.execute('DROP INDEX IF EXISTS idx_files_upload_time')
+    cursor.execute('DROP INDEX IF EXISTS idx_files_upload_time_id')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_files_upload_sort_id ON files ({UPLOAD_TIME_SORT}, id)')
+
+
+def migrate_content_to_blobs(conn, blob_store):
+    """把files表中内联的content移入BlobStore，只保留哈希和大小"""
+    rows = conn.execute(
+        'SELECT id, content FROM files WHERE content IS NOT NULL AND content_hash IS NULL'
+    ).fetchall()
+    updates = []
+    for file_id, content in rows:
+        content_hash, content_size = blob_store.put(content)
+        updates.append((content_hash, content_size, file_id))
+    conn.executemany(
+        'UPDATE files SET content_hash = ?, content_size = ?, content = NULL WHERE id = ?', updates
+    )
+    return len(updates)
+
+
+def sync_from_json(conn, files_json_path):
+    """把 files.json 中的记录覆盖写入files表
+
+    切换到SQLite之前，引用次数、收益等计数只写入了files.json，需要一次性同步过来。
+    """
+    with open(files_json_path, 'r', encoding='utf-8') as f:
+        files = json.load(f)
+    rows = []
+    for file_id, info in files.items():
+        rows.append((
+            file_id,
+            info['filename'],
+            info['user_id'],
+            info.get('content'),
+            info.get('content_preview'),
+            info.get('upload_time'),
+            1 if info.get('authorize_rag', True) else 0,
+            info.get('reference_count', 0),
+            info.get('total_reward', 0.0),
+            info.get('file_path', ''),
+            info.get('ipfs_url', ''),
+            info.get('total_staked', 0.0)
+        ))
+    conn.executemany('''
+    INSERT OR REPLACE INTO files (id, filename, user_id, content, content_preview, upload_time,
+                                  authorize_rag, reference_count, total_reward, file_path, ipfs_url, total_staked)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+
+def _row_to_file(row):
+    info = {column: row[column] for column in FILE_COLUMNS}
+    info['authorize_rag'] = bool(info['authorize_rag'])
+    info['reference_count'] = info['reference_count'] or 0
+    info['total_reward'] = info['total_reward'] or 0.0
+    info['total_staked'] = info['total_staked'] or 0.0
+    return info
+
+
+class FileStore:
+    """文件元数据的写穿缓存
+
+    Args:
+        connect: 返回 sqlite3 连接（row_factory 为 sqlite3.Row）的函数
+        blob_store: 存放文档正文的 BlobStore
+    """
+
+    def __init__(self, connect, blob_store):
+        self._connect = connect
+        self._blob_store = blob_store
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        conn = self._connect()
+        rows = conn.execute('SELECT id, {} FROM files'.format(', '.join(FILE_COLUMNS))).fetchall()
+        conn.close()
+        with self._lock:
+            self._cache = {row['id']: _row_to_file(row) for row in rows}
+            self._loaded = True
+
+    def refresh(self, *file_ids):
+        """从SQLite重新读取指定文件，写入后调用以保持缓存一致"""
+        if not file_ids:
+            return
+        conn = self._connect()
+        placeholders = ', '.join('?' for _ in file_ids)
+        rows = conn.execute('SELECT id, {} FROM files WHERE id IN ({})'.format(
+            ', '.join(FILE_COLUMNS), placeholders), file_ids).fetchall()
+        conn.close()
+        found = {row['id']: _row_to_file(row) for row in rows}
+        with self._lock:
+            for file_id in file_ids:
+                if file_id in found:
+                    self._cache[file_id] = found[file_id]
+                else:
+                    self._cache.pop(file_id, None)
+
+    def invalidate(self):
+        """丢弃整个缓存，下次读取时重新加载"""
+        with self._lock:
+            self._cache = {}
+            self._loaded = False
+
+    # ---------- 读取 ----------
+
+    def get(self, file_id):
+        self._ensure_loaded()
+        return self._cache.get(file_id)
+
+    def exists(self, file_id):
+        self._ensure_loaded()
+        return file_id in self._cache
+
+    def all(self):
+        """file_id -> 元数据 的字典（浅拷贝，条目请勿修改）"""
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._cache)
+
+    def by_user(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            return {fid: info for fid, info in self._cache.items() if info['user_id'] == user_id}
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self._cache)
+
+    def page(self, limit, cursor=None, file_ids=None, user_id=None):
+        """按 (upload_time, id) 倒序分页读取，返回 (条目列表, next_cursor)
+
+        file_ids 不为 None 时只在这些文件中分页（例如搜索命中的结果）；
+        id 较多时按 MAX_IN_PARAMS 分批查询，每批各取一页后合并。
+        """
+        if file_ids is not None and not file_ids:
+            return [], None
+        conditions, params = [], []
+        clause, clause_params = keyset_clause(UPLOAD_TIME_SORT, 'id', cursor)
+        if clause:
+            conditions.append(clause)
+            params.extend(clause_params)
+        if user_id:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if file_ids is None:
+            batches = [None]
+        else:
+            file_ids = list(dict.fromkeys(file_ids))
+            batches = [file_ids[i:i + MAX_IN_PARAMS] for i in range(0, len(file_ids), MAX_IN_PARAMS)]
+
+        rows = []
+        conn = self._connect()
+        for batch in batches:
+            batch_conditions = conditions + (['id IN ({})'.format(', '.join('?' for _ in batch))] if batch else [])
+            where = ' WHERE ' + ' AND '.join(batch_conditions) if batch_conditions else ''
+            rows.extend(conn.execute('SELECT id, {} FROM files{} ORDER BY {} DESC, id DESC LIMIT ?'.format(
+                ', '.join(FILE_COLUMNS), where, UPLOAD_TIME_SORT), params + (batch or []) + [limit + 1]).fetchall())
+        conn.close()
+        if len(batches) > 1:
+            rows.sort(key=lambda row: (row['upload_time'] or '', row['id']), reverse=True)
+
+        items = [{'file_id': row['id'], **_row_to_file(row)} for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last['upload_time'] or '', last['file_id'])
+        return items, next_cursor
+
+    def get_content(self, file_id):
+        """按需读取文档正文，文件不存在时返回 None"""
+        info = self.get(file_id)
+        if not info:
+            return None
+        content = self._blob_store.get(info['content_hash'])
+        if content is not None:
+            return content
+        # 尚未迁移到BlobStore的旧记录
+        conn = self._connect()
+        row = conn.execute('SELECT content FROM files WHERE id = ?', (file_id,)).fetchone()
+        conn.close()
+        return row['content'] if row else None
+
+    # ---------- 写入 ----------
+
+    def add(self, file_id, info):
+        """新增文件，info 中需包含 content_hash / content_size，不含正文"""
+        conn = self._connect()
+        conn.execute('''
+        INSERT INTO files (id, filename, user_id, content_hash, content_size, content_preview, upload_time,
+                           authorize_rag, reference_count, total_reward, file_path, ipfs_url, total_staked)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            file_id,
+            info['filename'],
+            info['user_id'],
+            info['content_hash'],
+            info['content_size'],
+            info.get('content_preview'),
+            info.get('upload_time'),
+            1 if info.get('authorize_rag') else 0,
+            info.get('reference_count', 0),
+            info.get('total_reward', 0.0),
+            info.get('file_path', ''),
+            info.get('ipfs_url'),
+            info.get('total_staked', 0.0)
+        ))
+        # 社区统计计数与文件记录在同一事务中提交
+        community_stats.record_upload(conn, file_id, info['user_id'])
+        conn.commit()
+        conn.close()
+        self.refresh(file_id)
+
+    def add_stake(self, file_id, amount):
+        conn = self._connect()
+        conn.execute('''
+        UPDATE files SET total_staked = COALESCE(total_staked, 0) + ? WHERE id = ?
+        ''', (amount, file_id))
+        conn.commit()
+        conn.close()
+        self.refresh(file_id)
+
+    def export_json(self, path):
+        """导出为旧版 files.json 格式（包含正文）"""
+        files = {}
+        for file_id, info in self.all().items():
+            files[file_id] = {**info, 'content': self.get_content(file_id)}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(files, f, ensure_ascii=False, indent=2)
+        return len(files)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'export':
+        print("用法: python file_store.py export [数据库文件] [导出路径]")
+        return 1
+
+    from blob_store import BlobStore
+
+    db_file = argv[2] if len(argv) > 2 else 'talktoearn.db'
+    export_path = argv[3] if len(argv) > 3 else 'files.json'
+
+    def connect():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    total = FileStore(connect, BlobStore()).export_json(export_path)
+    print(f"✅ 已导出 {total} 个文件元数据到 {export_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
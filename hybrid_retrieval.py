@@ -0,0 +1,235 @@
+# hybrid_retrieval.py - 向量检索 + 关键词检索的混合召回
+"""
+RAG检索时向量检索（Chroma）和关键词检索（SQLite FTS5，按文档块建立）并行执行，
+两路结果按倒数排名融合（Reciprocal Rank Fusion）:
+
+    score(d) = Σ 1 / (rrf_k + rank_i(d))
+
+两路都排在前面的文档块得分最高，只有一路命中的也能保留下来。
+融合后只把前 top_k 个候选交给 adaptive_filter_relevant_docs，减少后续的LLM相关性判断。
+
+向量检索直接带回Chroma中存储的文档块向量，问题向量也随结果返回，
+打分阶段不必再为每个候选调用嵌入API；只由关键词检索召回的块（Chroma中的id是随机生成的，无法按块定位）
+一次性交给嵌入模型计算，入库时已写入嵌入缓存，通常直接命中缓存。
+
+关键词索引的内容与Chroma中的文档块保持一致：
+写入向量库时调用 index_chunks，重建向量库后调用 rebuild_from_collection。
+"""
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from langchain_core.documents import Document
+
+import search_index
+
+
+def create_tables(cursor):
+    """创建文档块表和对应的全文索引（在 init_db 中调用）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rag_chunks (
+        chunk_key TEXT PRIMARY KEY,
+        file_id TEXT,
+        metadata TEXT,
+        content TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rag_chunks_file_id ON rag_chunks (file_id)')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS rag_chunks_fts USING fts5(
+        chunk_key UNINDEXED,
+        content,
+        tokenize = 'unicode61'
+    )
+    ''')
+
+
+def chunk_key(file_id, content):
+    """文档块的唯一标识，两路检索结果据此合并"""
+    return hashlib.sha1(f"{file_id}\n{content}".encode('utf-8')).hexdigest()
+
+
+def doc_key(doc):
+    return chunk_key(doc.metadata.get('file_id'), doc.page_content)
+
+
+def index_chunks(conn, docs):
+    """把文档块写入关键词索引，不提交事务"""
+    for doc in docs:
+        key = doc_key(doc)
+        conn.execute('''
+        INSERT OR REPLACE INTO rag_chunks (chunk_key, file_id, metadata, content) VALUES (?, ?, ?, ?)
+        ''', (key, doc.metadata.get('file_id'), json.dumps(doc.metadata, ensure_ascii=False), doc.page_content))
+        conn.execute('DELETE FROM rag_chunks_fts WHERE chunk_key = ?', (key,))
+        conn.execute('INSERT INTO rag_chunks_fts (chunk_key, content) VALUES (?, ?)',
+                     (key, search_index.tokenize(doc.page_content)))
+    return len(docs)
+
+
+def is_empty(conn):
+    return conn.execute('SELECT 1 FROM rag_chunks LIMIT 1').fetchone() is None
+
+
+def rebuild_from_collection(conn, collection, batch_size=500):
+    """清空关键词索引并从Chroma集合中重新读取全部文档块，不提交事务"""
+    conn.execute('DELETE FROM rag_chunks')
+    conn.execute('DELETE FROM rag_chunks_fts')
+    total = 0
+    offset = 0
+    while True:
+        batch = collection.get(include=['documents', 'metadatas'], limit=batch_size, offset=offset)
+        documents = batch.get('documents') or []
+        if not documents:
+            break
+        metadatas = batch.get('metadatas') or [{}] * len(documents)
+        total += index_chunks(conn, [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(documents, metadatas)
+        ])
+        offset += len(documents)
+    return total
+
+
+def search_chunks(conn, question, limit):
+    """关键词召回，返回按 bm25 排序的文档块"""
+    match = search_index.build_any_match(question)
+    if match is None:
+        return []
+    rows = conn.execute('''
+    SELECT c.metadata, c.content FROM rag_chunks_fts f
+    JOIN rag_chunks c ON c.chunk_key = f.chunk_key
+    WHERE rag_chunks_fts MATCH ?
+    ORDER BY f.rank
+    LIMIT ?
+    ''', (match, limit)).fetchall()
+    return [Document(page_content=content, metadata=json.loads(metadata or '{}')) for metadata, content in rows]
+
+
+def reciprocal_rank_fusion(ranked_lists, rrf_k=60, top_k=None):
+    """按RRF合并多路排序结果
+
+    Args:
+        ranked_lists: [(来源名称, [Document, ...]), ...]，每一路按相关度从高到低
+        rrf_k: 平滑常数，越大各名次之间的差距越小
+        top_k: 返回的数量，None 表示全部
+
+    Returns:
+        融合后的文档列表，metadata 中附带 rrf_score 和 retrieval_sources
+    """
+    scores = {}
+    docs = {}
+    sources = {}
+    for source, ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)  # 先出现的一路（向量检索）的文档对象优先
+            sources.setdefault(key, []).append(source)
+
+    fused = sorted(scores, key=lambda key: scores[key], reverse=True)
+    if top_k is not None:
+        fused = fused[:top_k]
+    results = []
+    for key in fused:
+        doc = docs[key]
+        doc.metadata['rrf_score'] = scores[key]
+        doc.metadata['retrieval_sources'] = ','.join(sources[key])
+        results.append(doc)
+    return results
+
+
+class HybridRetriever:
+    """并行执行向量检索和关键词检索，再做RRF融合
+
+    Args:
+        get_vector_store: 返回当前 Chroma 实例的函数（重建知识库后实例会变化）
+        connect: 返回 sqlite3 连接的函数
+        embeddings: 计算问题向量的嵌入模型（与向量库使用的一致）
+        vector_k: 向量检索召回数量
+        lexical_k: 关键词检索召回数量
+        top_k: 融合后交给过滤阶段的候选数量
+        rrf_k: RRF 平滑常数
+    """
+
+    def __init__(self, get_vector_store, connect, embeddings, vector_k=10, lexical_k=10, top_k=6, rrf_k=60):
+        self._get_vector_store = get_vector_store
+        self._connect = connect
+        self._embeddings = embeddings
+        self.vector_k = vector_k
+        self.lexical_k = lexical_k
+        self.top_k = top_k
+        self.rrf_k = rrf_k
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hybrid-retrieval')
+
+    def _vector_search(self, store, query_embedding):
+        """返回 [(Document, 存储的向量), ...]"""
+        if store is None:
+            return []
+        result = store._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=self.vector_k,
+            include=['documents', 'metadatas', 'embeddings', 'distances']
+        )
+        hits = []
+        for text, metadata, vector, distance in zip(result['documents'][0], result['metadatas'][0],
+                                                    result['embeddings'][0], result['distances'][0]):
+            doc = Document(page_content=text, metadata=dict(metadata or {}))
+            doc.metadata['vector_distance'] = float(distance)
+            hits.append((doc, list(vector)))
+        return hits
+
+    def _embed_chunks(self, docs):
+        """为只由关键词检索召回的文档块计算向量，返回 {chunk_key: 向量}"""
+        vectors = self._embeddings.embed_documents([doc.page_content for doc in docs])
+        return {doc_key(doc): list(vector) for doc, vector in zip(docs, vectors)}
+
+    def _lexical_search(self, question):
+        # 检索线程长期存活，句柄在 with 结束时归还
+        with closing(self._connect()) as conn:
+            return search_chunks(conn, question, self.lexical_k)
+
+    def retrieve(self, question):
+        """检索候选文档块
+
+        Returns:
+            (docs, query_embedding, doc_embeddings)
+            doc_embeddings 与 docs 一一对应，是向量库中存储的文档块向量
+        """
+        store = self._get_vector_store()
+        # 关键词检索在线程池中执行，同时在当前线程计算问题向量并做向量检索
+        lexical_future = self._executor.submit(self._lexical_search, question)
+
+        vector_error = None
+        query_embedding = None
+        try:
+            query_embedding = self._embeddings.embed_query(question)
+            vector_hits = self._vector_search(store, query_embedding)
+        except Exception as e:
+            vector_error = e
+            vector_hits = []
+            print(f"⚠️ 向量检索失败，仅使用关键词检索结果: {e}")
+        try:
+            lexical_docs = lexical_future.result()
+        except Exception as e:
+            if vector_error is not None:
+                raise vector_error
+            lexical_docs = []
+            print(f"⚠️ 关键词检索失败，仅使用向量检索结果: {e}")
+
+        vector_docs = [doc for doc, _ in vector_hits]
+        fused = reciprocal_rank_fusion(
+            [('vector', vector_docs), ('lexical', lexical_docs)], rrf_k=self.rrf_k, top_k=self.top_k
+        )
+        print(f"🔀 混合检索: 向量 {len(vector_docs)} 个, 关键词 {len(lexical_docs)} 个, 融合后保留 {len(fused)} 个")
+
+        vectors = {doc_key(doc): vector for doc, vector in vector_hits}
+        lexical_only = [doc for doc in fused if doc_key(doc) not in vectors]
+        if lexical_only:
+            try:
+                vectors.update(self._embed_chunks(lexical_only))
+            except Exception as e:
+                print(f"⚠️ 计算关键词召回文档块的向量失败: {e}")
+        # 计算失败的块留空，由打分阶段自行计算
+        doc_embeddings = [vectors.get(doc_key(doc)) for doc in fused]
+        return fused, query_embedding, doc_embeddings
@@ -0,0 +1,141 @@
+# listwise_rerank.py - 一次LLM调用判断全部候选文档块的相关性
+"""
+逐块判断时每个候选都要单独请求一次LLM（"相关/不相关"）。
+listwise 模式把问题和全部候选（编号、截断后）放进同一个提示词，
+让模型按编号逐条给出结论，一个问题只需调用一次LLM。
+
+模型输出不一定严格遵守格式，解析按以下顺序尝试:
+1. JSON（[{"id": 1, "relevant": true}, ...]、{"1": "相关", ...} 或 ["相关", "不相关", ...]），
+   纯数字数组（例如 "[1] 不相关" 中的编号标记）不当作JSON
+2. 逐行的 "编号: 结论"（如 "1: 相关"、"[2] 不相关"、"3. 0.8"）
+结论可以是标签（相关/不相关/是/否/yes/no/true/false）或分数（0~1，或0~10）；
+标签需要完整匹配，"相关性较低"、"是否相关无法判断" 这类说法不算结论。
+没有解析出结论的编号不出现在结果中，由调用方改为逐块判断。
+"""
+import re
+import json
+
+# 分数达到该值（归一化到0~1后）视为相关
+SCORE_THRESHOLD = 0.5
+
+POSITIVE_LABELS = ('相关', '是', 'yes', 'true', 'relevant')
+NEGATIVE_LABELS = ('不相关', '无关', '否', 'no', 'false', 'irrelevant', 'not relevant')
+
+# 长标签在前，"不相关" 先于 "相关"、"not relevant" 先于 "no" 匹配；标签后不能紧跟文字
+_LABEL_PATTERN = re.compile(
+    r'^(?:{})(?!\w)'.format('|'.join(re.escape(label) for label in
+                                      sorted(POSITIVE_LABELS + NEGATIVE_LABELS, key=len, reverse=True)))
+)
+
+_LINE_PATTERN = re.compile(
+    r'^\s*(?:文档|候选|doc)?\s*[\[【(（]?\s*(\d+)\s*[\]】)）]?\s*[:：.、\-]?\s*(.+?)\s*$',
+    re.IGNORECASE
+)
+
+
+def build_prompt(question, contents, max_chars=500):
+    """构造listwise判断的提示词，候选从1开始编号"""
+    blocks = []
+    for number, content in enumerate(contents, start=1):
+        truncated = content[:max_chars] + "..." if len(content) > max_chars else content
+        blocks.append(f"[{number}] {truncated}")
+    candidates = "\n\n".join(blocks)
+    return f"""请严格判断以下每个文档片段是否与用户问题相关。
+
+用户问题：{question}
+
+文档片段：
+{candidates}
+
+请按编号逐行回答，每行格式为"编号: 相关"或"编号: 不相关"，共 {len(contents)} 行，不要解释："""
+
+
+def parse_label(value):
+    """把单条结论解析为 True/False，无法识别时返回 None"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        score = float(value)
+        if score > 1:
+            score /= 10
+        return score >= SCORE_THRESHOLD
+    text = str(value).strip().strip('"\'。.，,').lower()
+    if not text:
+        return None
+    try:
+        return parse_label(float(text.split('/')[0]))
+    except ValueError:
+        pass
+    match = _LABEL_PATTERN.match(text)
+    if not match:
+        return None
+    return match.group(0) not in NEGATIVE_LABELS
+
+
+def _find_json(text):
+    """找出输出中第一个像判断结果的JSON：对象，或由对象/标签组成的数组"""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r'[\[{]', text):
+        try:
+            data, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data:
+            return data
+        if isinstance(data, list) and data and all(isinstance(entry, (dict, str, bool)) for entry in data):
+            return data
+    return None
+
+
+def _parse_json(text):
+    data = _find_json(text)
+    if data is None:
+        return {}
+
+    verdicts = {}
+    if isinstance(data, dict):
+        items = data.items()
+    else:
+        items = []
+        for position, entry in enumerate(data, start=1):
+            if isinstance(entry, dict):
+                number = entry.get('id', entry.get('index', position))
+                value = next((entry[k] for k in ('relevant', 'label', 'score', 'relevance') if k in entry), None)
+                items.append((number, value))
+            else:
+                items.append((position, entry))
+    for number, value in items:
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            continue
+        verdict = parse_label(value) if value is not None else None
+        if verdict is not None:
+            verdicts[number] = verdict
+    return verdicts
+
+
+def _parse_lines(text):
+    verdicts = {}
+    for line in text.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if not match:
+            continue
+        verdict = parse_label(match.group(2))
+        if verdict is not None:
+            verdicts.setdefault(int(match.group(1)), verdict)
+    return verdicts
+
+
+def parse_verdicts(text, count):
+    """解析模型输出，返回 {候选下标(从0开始): 是否相关}，只包含解析成功的候选"""
+    verdicts = _parse_json(text) or _parse_lines(text)
+    return {number - 1: verdict for number, verdict in verdicts.items() if 1 <= number <= count}
+
+
+def listwise_relevance_check(question, contents, llm_model, max_chars=500):
+    """一次调用判断全部候选，返回 {下标: 是否相关}；调用失败时抛出异常"""
+    response = llm_model.invoke(build_prompt(question, contents, max_chars))
+    response_text = response.content.strip()
+    print(f"LLM列表式相关性判断结果: '{response_text}'")
+    return parse_verdicts(response_text, len(contents))
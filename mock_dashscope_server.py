@@ -0,0 +1,331 @@
+# mock_dashscope_server.py - 本地的DashScope兼容替身服务
+"""
+app.py 启动时就会调用一次 llm.invoke，之后的嵌入、相关性判断和回答生成也都请求DashScope，
+没有网络或不想消耗额度时无法压测整条流程。这个脚本在本地实现 DashScopeEmbeddings / ChatTongyi
+实际调用的两个HTTP接口:
+
+    POST /api/v1/services/embeddings/text-embedding/text-embedding
+    POST /api/v1/services/aigc/text-generation/generation   （支持 SSE 流式输出）
+
+- 嵌入：按字符二元组和词做特征哈希得到确定性的向量（同一文本永远得到同一向量，
+  字面相近的文本向量也相近），维度可配置
+- 对话：返回模板化的回答；相关性判断的提示词按固定格式回答"相关"
+- 可配置基础延迟、流式分块间隔，以及按比例注入500、502和429限流错误
+
+用法:
+    python mock_dashscope_server.py [--port 8089] [--latency 0.2] [--chunk-delay 0.02]
+                                    [--error-rate 0] [--bad-gateway-rate 0.05] [--throttle-rate 0]
+
+启动 app.py 前设置环境变量 DASHSCOPE_BASE_URL=http://127.0.0.1:8089/api/v1 即可让应用改用本服务。
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+EMBEDDING_PATH = '/api/v1/services/embeddings/text-embedding/text-embedding'
+GENERATION_PATH = '/api/v1/services/aigc/text-generation/generation'
+
+# 与各嵌入模型实际输出一致的维度
+EMBEDDING_DIMENSIONS = {
+    'text-embedding-v1': 1536,
+    'text-embedding-v2': 1536,
+    'text-embedding-v3': 1024,
+    'text-embedding-v4': 1024
+}
+
+DEFAULT_REPLY = "【本地模拟回答】关于「{question}」：这是由本地替身服务生成的回答，仅用于离线测试和压测。"
+
+
+def _features(text):
+    """字符二元组 + 空白分词，作为特征哈希的输入"""
+    text = text.lower()
+    features = [text[i:i + 2] for i in range(len(text) - 1)]
+    features.extend(text.split())
+    return features or [text]
+
+
+def hash_embedding(text, dim):
+    """确定性的特征哈希向量（L2归一化）"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        digest = hashlib.md5(feature.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _last_user_message(payload):
+    body = payload.get('input') or {}
+    if body.get('prompt'):
+        return body['prompt']
+    for message in reversed(body.get('messages') or []):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            if isinstance(content, list):  # 多模态格式 [{"text": ...}]
+                content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+            return content or ''
+    return ''
+
+
+def canned_reply(prompt, template=DEFAULT_REPLY):
+    """按提示词类型给出固定格式的回答"""
+    # listwise 相关性判断：按候选数量逐行回答
+    match = re.search(r'共 (\d+) 行', prompt)
+    if match and '按编号逐行回答' in prompt:
+        return '\n'.join(f"{i}: 相关" for i in range(1, int(match.group(1)) + 1))
+    # 逐块相关性判断
+    if '只回答"相关"或"不相关"' in prompt:
+        return '相关'
+    question = prompt
+    match = re.search(r'问题[：:]\s*(.+)', prompt)
+    if match:
+        question = match.group(1).strip()
+    return template.format(question=question[:100])
+
+
+class MockState:
+    """服务配置和请求统计"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.stats = {'embedding_requests': 0, 'embedded_texts': 0, 'generation_requests': 0,
+                      'stream_requests': 0, 'injected_errors': 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def pick_fault(self):
+        """按配置的比例决定本次请求是否注入错误，返回 (HTTP状态码, 错误码) 或 None"""
+        with self.lock:
+            roll = self.random.random()
+        args = self.args
+        if roll < args.bad_gateway_rate:
+            return 502, 'BadGateway'
+        roll -= args.bad_gateway_rate
+        if roll < args.throttle_rate:
+            return 429, 'Throttling.RateQuota'
+        roll -= args.throttle_rate
+        if roll < args.error_rate:
+            return 500, 'InternalError'
+        return None
+
+    def delay(self):
+        latency = self.args.latency
+        if self.args.jitter:
+            with self.lock:
+                latency += self.random.uniform(0, self.args.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+
+class MockDashScopeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockDashScope/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if not self.state.args.quiet:
+            super().log_message(format, *args)
+
+    # ---------- 响应辅助 ----------
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, code, message, request_id):
+        if status == 502:
+            # 网关错误与线上一致，返回的是HTML而不是JSON
+            data = b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(status, {'code': code, 'message': message, 'request_id': request_id})
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    # ---------- 路由 ----------
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        else:
+            self._send_json(404, {'code': 'NotFound', 'message': self.path})
+
+    def do_POST(self):
+        request_id = str(uuid.uuid4())
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_error(400, 'InvalidParameter', 'Request body is not valid JSON', request_id)
+            return
+
+        path = self.path.split('?')[0]
+        if path not in (EMBEDDING_PATH, GENERATION_PATH):
+            self._send_json(404, {'code': 'NotFound', 'message': path, 'request_id': request_id})
+            return
+
+        self.state.delay()
+        fault = self.state.pick_fault()
+        if fault:
+            status, code = fault
+            self.state.count('injected_errors')
+            self._send_error(status, code, f'Injected {code} from mock server', request_id)
+            return
+
+        if path == EMBEDDING_PATH:
+            self._handle_embedding(payload, request_id)
+        else:
+            self._handle_generation(payload, request_id)
+
+    def _handle_embedding(self, payload, request_id):
+        texts = (payload.get('input') or {}).get('texts')
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            self._send_error(400, 'InvalidParameter', 'input.texts is required', request_id)
+            return
+        if len(texts) > self.state.args.max_batch:
+            self._send_error(400, 'InvalidParameter',
+                             f'batch size is invalid, it should not be larger than {self.state.args.max_batch}',
+                             request_id)
+            return
+
+        model = payload.get('model', '')
+        dim = (payload.get('parameters') or {}).get('dimension') or self.state.args.dim \
+            or EMBEDDING_DIMENSIONS.get(model, 1536)
+        self.state.count('embedding_requests')
+        self.state.count('embedded_texts', len(texts))
+        self._send_json(200, {
+            'output': {
+                'embeddings': [{'text_index': i, 'embedding': hash_embedding(text, dim)}
+                               for i, text in enumerate(texts)]
+            },
+            'usage': {'total_tokens': sum(len(text) for text in texts)},
+            'request_id': request_id
+        })
+
+    def _handle_generation(self, payload, request_id):
+        parameters = payload.get('parameters') or {}
+        prompt = _last_user_message(payload)
+        reply = canned_reply(prompt, self.state.args.reply)
+        message_format = parameters.get('result_format', 'text') == 'message'
+        input_tokens = len(prompt)
+
+        def output(text, finish_reason):
+            if message_format:
+                return {'choices': [{'finish_reason': finish_reason,
+                                     'message': {'role': 'assistant', 'content': text}}]}
+            return {'text': text, 'finish_reason': finish_reason}
+
+        def usage(output_tokens):
+            return {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                    'total_tokens': input_tokens + output_tokens}
+
+        self.state.count('generation_requests')
+        stream = (self.headers.get('X-DashScope-SSE') == 'enable'
+                  or 'text/event-stream' in (self.headers.get('Accept') or '')
+                  or parameters.get('stream'))
+        if not stream:
+            self._send_json(200, {'output': output(reply, 'stop'), 'usage': usage(len(reply)),
+                                  'request_id': request_id})
+            return
+
+        self.state.count('stream_requests')
+        incremental = parameters.get('incremental_output', False)
+        size = self.state.args.chunk_size
+        pieces = [reply[i:i + size] for i in range(0, len(reply), size)] or ['']
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream;charset=UTF-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            sent = ''
+            for number, piece in enumerate(pieces, start=1):
+                if number > 1 and self.state.args.chunk_delay > 0:
+                    time.sleep(self.state.args.chunk_delay)
+                sent += piece
+                last = number == len(pieces)
+                body = {'output': output(piece if incremental else sent, 'stop' if last else 'null'),
+                        'usage': usage(len(sent)), 'request_id': request_id}
+                event = (f"id:{number}\nevent:result\n:HTTP_STATUS/200\n"
+                         f"data:{json.dumps(body, ensure_ascii=False)}\n\n")
+                self._write_chunk(event.encode('utf-8'))
+            self._write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开（例如 /ask 的前端关闭了连接）
+            self.close_connection = True
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='本地DashScope兼容替身服务（嵌入 + 对话）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--dim', type=int, default=0, help='嵌入维度，0 表示按模型名取默认值')
+    parser.add_argument('--max-batch', type=int, default=25, help='单次嵌入请求的最多文本数')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的基础延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='在基础延迟上随机增加的最大延迟（秒）')
+    parser.add_argument('--chunk-size', type=int, default=4, help='流式输出每块的字符数')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='流式输出块之间的间隔（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的比例')
+    parser.add_argument('--bad-gateway-rate', type=float, default=0.0, help='返回502的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回429限流的比例')
+    parser.add_argument('--reply', default=DEFAULT_REPLY, help='回答模板，{question} 替换为问题')
+    parser.add_argument('--seed', type=int, default=None, help='错误注入和延迟抖动的随机种子')
+    parser.add_argument('--quiet', action='store_true', help='不打印每个请求的访问日志')
+    return parser.parse_args(argv)
+
+
+def make_server(args):
+    server = ThreadingHTTPServer((args.host, args.port), MockDashScopeHandler)
+    server.daemon_threads = True
+    server.state = MockState(args)
+    return server
+
+
+def main(argv):
+    args = parse_args(argv[1:])
+    server = make_server(args)
+    print(f"🧪 DashScope替身服务已启动: http://{args.host}:{server.server_port}/api/v1")
+    print(f"   启动应用前设置 DASHSCOPE_BASE_URL=http://{args.host}:{server.server_port}/api/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,73 @@
+# pagination.py - 列表接口的游标分页与字段投影
+"""
+列表接口统一使用 keyset 分页：按 (排序列, id) 倒序，游标记录上一页最后一条的 (排序列, id)，
+下一页从该位置之后继续，翻页开销与页码无关，也不会因新插入的记录而重复或遗漏。
+
+请求参数:
+    limit   每页条数，默认 DEFAULT_LIMIT，最大 MAX_LIMIT
+    cursor  上一页响应中的 next_cursor
+    fields  逗号分隔的返回字段，不传则返回全部字段
+"""
+import json
+import base64
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidPageRequest(ValueError):
+    """分页参数不合法"""
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise InvalidPageRequest(f"limit 参数不合法: {value}")
+    if limit <= 0:
+        raise InvalidPageRequest(f"limit 必须大于0: {value}")
+    return min(limit, maximum)
+
+
+def encode_cursor(sort_value, item_id):
+    raw = json.dumps([sort_value, item_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (排序列取值, id)，未传游标时返回 None"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidPageRequest(f"cursor 参数不合法: {cursor}")
+    return sort_value, item_id
+
+
+def keyset_clause(sort_column, id_column, cursor):
+    """生成倒序翻页的 WHERE 条件，返回 (sql片段, 参数)；没有游标时 sql片段为空"""
+    position = decode_cursor(cursor)
+    if position is None:
+        return '', []
+    return f'({sort_column}, {id_column}) < (?, ?)', list(position)
+
+
+def parse_fields(value, allowed):
+    """解析 fields 参数，返回字段元组；未传时返回 None 表示全部字段"""
+    if not value:
+        return None
+    fields = tuple(f.strip() for f in value.split(',') if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise InvalidPageRequest(f"不支持的字段: {', '.join(unknown)}")
+    return fields
+
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {field: item.get(field) for field in fields}
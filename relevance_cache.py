@@ -0,0 +1,116 @@
+# relevance_cache.py - LLM相关性判断结果缓存
+"""
+热门问题会反复命中同样的文档块，每次都重新请求LLM判断"相关/不相关"。
+这里按 (规范化问题的哈希, 文档块 chunk_key) 缓存判断结果:
+- 问题先做规范化（NFKC、小写、去掉空白和末尾标点），措辞上的细微差别不影响命中
+- chunk_key 由 file_id 和文档块内容计算（见 hybrid_retrieval.chunk_key），内容变化后自然不再命中
+- 条目有TTL，容量满时淘汰最久未用的条目（OrderedDict 实现的LRU）
+- 文件重新入库时按 file_id 失效，重建知识库时全部清空
+"""
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+_TRAILING_PUNCTUATION = '?？!！。.，,;；:：~～'
+
+
+def normalize_question(question):
+    text = unicodedata.normalize('NFKC', question).lower()
+    text = re.sub(r'\s+', '', text)
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def question_hash(question):
+    return hashlib.sha256(normalize_question(question).encode('utf-8')).hexdigest()
+
+
+class RelevanceVerdictCache:
+    """带TTL和容量上限的相关性判断缓存
+
+    Args:
+        ttl: 条目有效期（秒）
+        max_entries: 最多缓存的判断结果数
+    """
+
+    def __init__(self, ttl=3600, max_entries=20000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (问题哈希, chunk_key) -> (是否相关, 过期时间, file_id)
+        self._keys_by_file = {}        # file_id -> {(问题哈希, chunk_key), ...}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _drop(self, key):
+        _, _, file_id = self._entries.pop(key)
+        keys = self._keys_by_file.get(file_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_file[file_id]
+
+    def get_many(self, question, chunk_keys):
+        """返回 {chunk_key: 是否相关}，只包含命中且未过期的条目"""
+        q_hash = question_hash(question)
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for chunk_key in chunk_keys:
+                key = (q_hash, chunk_key)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._stats['misses'] += 1
+                    continue
+                if entry[1] <= now:
+                    self._drop(key)
+                    self._stats['expired'] += 1
+                    self._stats['misses'] += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[chunk_key] = entry[0]
+                self._stats['hits'] += 1
+        return found
+
+    def put_many(self, question, verdicts):
+        """写入判断结果，verdicts 为 {(chunk_key, file_id): 是否相关}"""
+        q_hash = question_hash(question)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for (chunk_key, file_id), is_relevant in verdicts.items():
+                key = (q_hash, chunk_key)
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = (bool(is_relevant), expires_at, file_id)
+                self._keys_by_file.setdefault(file_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate_files(self, file_ids):
+        """文件的文档块重新入库后，丢弃涉及这些文件的全部判断"""
+        removed = 0
+        with self._lock:
+            for file_id in set(file_ids):
+                for key in list(self._keys_by_file.get(file_id, ())):
+                    self._drop(key)
+                    removed += 1
+            self._stats['invalidations'] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._keys_by_file.clear()
+            self._stats['invalidations'] += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
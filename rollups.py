@@ -0,0 +1,128 @@
+# rollups.py - 按日/按月累计的收益汇总表
+"""
+按用户维护日、月两级汇总，和余额更新在同一个SQLite事务中增量写入。
+仪表盘的"今日收益""今日引用""今日AI调用""本月增长"因此只需一次主键查询。
+
+已有历史可以通过命令行回填:
+    python rollups.py backfill
+"""
+import sys
+import sqlite3
+
+PERIODS = (('day', 10), ('month', 7))  # (周期, ISO时间戳前缀长度)
+
+
+def create_tables(cursor):
+    """创建汇总表（在 init_db 中调用）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_earnings_rollup (
+        user_id TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        earned REAL DEFAULT 0.0,
+        spent REAL DEFAULT 0.0,
+        reward_count INTEGER DEFAULT 0,
+        reference_count INTEGER DEFAULT 0,
+        spend_count INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, period, bucket)
+    )
+    ''')
+
+
+def _rollup_rows(transactions):
+    """把交易转换为汇总表的增量行"""
+    user_rows = []
+    for tx in transactions:
+        timestamp = tx.get('timestamp') or ''
+        tx_type = tx.get('type')
+        amount = tx.get('amount') or 0.0
+        for period, prefix in PERIODS:
+            bucket = timestamp[:prefix]
+            if tx_type == 'reward':
+                if tx.get('to_user'):
+                    # (user_id, period, bucket, earned, spent, reward_count, reference_count, spend_count)
+                    user_rows.append((tx['to_user'], period, bucket, amount, 0.0, 1, 0, 0))
+            elif tx_type == 'reference':
+                if tx.get('file_owner'):
+                    user_rows.append((tx['file_owner'], period, bucket, 0.0, 0.0, 0, 1, 0))
+            elif tx_type == 'spend':
+                if tx.get('from_user'):
+                    user_rows.append((tx['from_user'], period, bucket, 0.0, amount, 0, 0, 1))
+    return user_rows
+
+
+def apply_transactions(conn, transactions):
+    """把交易累加进汇总表，不提交事务，由调用方与余额更新一起 commit"""
+    user_rows = _rollup_rows(transactions)
+    if user_rows:
+        conn.executemany('''
+        INSERT INTO user_earnings_rollup
+            (user_id, period, bucket, earned, spent, reward_count, reference_count, spend_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, period, bucket) DO UPDATE SET
+            earned = earned + excluded.earned,
+            spent = spent + excluded.spent,
+            reward_count = reward_count + excluded.reward_count,
+            reference_count = reference_count + excluded.reference_count,
+            spend_count = spend_count + excluded.spend_count
+        ''', user_rows)
+
+
+def get_user_rollup(conn, user_id, period, bucket):
+    """读取用户某日/某月的汇总，不存在时返回全0"""
+    row = conn.execute('''
+    SELECT earned, spent, reward_count, reference_count, spend_count
+    FROM user_earnings_rollup WHERE user_id = ? AND period = ? AND bucket = ?
+    ''', (user_id, period, bucket)).fetchone()
+    if not row:
+        return {'earned': 0.0, 'spent': 0.0, 'reward_count': 0, 'reference_count': 0, 'spend_count': 0}
+    return {
+        'earned': row[0],
+        'spent': row[1],
+        'reward_count': row[2],
+        'reference_count': row[3],
+        'spend_count': row[4]
+    }
+
+
+def backfill(conn, transactions, batch_size=5000):
+    """清空汇总表并从交易历史重建，在一个事务内完成"""
+    conn.execute('DELETE FROM user_earnings_rollup')
+    total = 0
+    batch = []
+    for tx in transactions:
+        batch.append(tx)
+        if len(batch) >= batch_size:
+            apply_transactions(conn, batch)
+            total += len(batch)
+            batch = []
+    apply_transactions(conn, batch)
+    total += len(batch)
+    conn.commit()
+    return total
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'backfill':
+        print("用法: python rollups.py backfill [数据库文件] [交易日志目录]")
+        return 1
+
+    from transaction_log import TransactionLog
+
+    db_file = argv[2] if len(argv) > 2 else 'talktoearn.db'
+    log_dir = argv[3] if len(argv) > 3 else 'transaction_log'
+
+    log = TransactionLog(log_dir, legacy_json='transactions.json')
+    conn = sqlite3.connect(db_file)
+    try:
+        create_tables(conn.cursor())
+        total = backfill(conn, log.iter_all())
+        print(f"✅ 汇总表回填完成，共处理 {total} 条交易")
+    finally:
+        conn.close()
+        log.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
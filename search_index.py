@@ -0,0 +1,229 @@
+# search_index.py - 基于SQLite FTS5的文件全文索引
+"""
+对文件名、正文、文件ID和用户ID建立FTS5全文索引，替代逐个文件做子串扫描。
+
+FTS5自带的 unicode61 分词器会把连续的中文当成一个词，无法按词检索，
+所以写入和查询前先在Python中分词:
+- 连续的中日韩字符切成二元组（"区块链" -> "区块 块链"），末字再单独保留一个，
+  这样单字查询也能用前缀匹配命中
+- 其余字母数字按单词切分并转小写
+
+查询时每个中文片段转成相邻二元组组成的短语（等价于子串匹配），
+英文/数字单词按前缀匹配，多个关键词之间为 AND，结果按 bm25 排序。
+文件ID的小写形式另存于 files_fts_keys 表，按其主键索引做精确/前缀匹配（例如 "20240101" 或完整ID）；
+前缀匹配没有结果时才退回与旧版一样的子串扫描（例如钱包地址的中间一段）。
+只命中文件ID的结果得分为0，排在全文命中之后。
+build_any_match 则把整句问题拆成任一命中即可的词项，供RAG的关键词召回使用。
+"""
+import re
+import html
+
+from pagination import decode_cursor, encode_cursor
+
+# 各列的 bm25 权重：文件名命中比正文命中更相关
+_BM25_WEIGHTS = (0.0, 5.0, 2.0, 2.0, 1.0)
+
+_CJK = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|([^\\W_{_CJK}]+)')
+
+
+def create_table(cursor):
+    """创建全文索引表（在 init_db 中调用）"""
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+        file_id UNINDEXED,
+        filename,
+        file_key,
+        user_id,
+        content,
+        tokenize = 'unicode61'
+    )
+    ''')
+    existed = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files_fts_keys'"
+    ).fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS files_fts_keys (
+        key TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        PRIMARY KEY (key, file_id)
+    ) WITHOUT ROWID
+    ''')
+    if not existed:
+        # 已有索引的库首次升级时从全文索引补齐
+        cursor.execute('INSERT OR IGNORE INTO files_fts_keys (key, file_id) SELECT lower(file_id), file_id FROM files_fts')
+
+
+def _segments(text):
+    """切分为 (是否中日韩, 片段) 序列"""
+    for match in _TOKEN_RE.finditer((text or '').lower()):
+        if match.group(1):
+            yield True, match.group(1)
+        else:
+            yield False, match.group(2)
+
+
+def _bigrams(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text):
+    """把原文转换成写入FTS5的分词文本"""
+    tokens = []
+    for is_cjk, segment in _segments(text):
+        if is_cjk:
+            tokens.extend(_bigrams(segment))
+            if len(segment) > 1:
+                tokens.append(segment[-1])
+        else:
+            tokens.append(segment)
+    return ' '.join(tokens)
+
+
+def build_match(keyword):
+    """把用户输入的关键词转换为FTS5 MATCH表达式，没有可检索内容时返回 None"""
+    terms = []
+    for is_cjk, segment in _segments(keyword):
+        if is_cjk and len(segment) > 1:
+            terms.append('"{}"'.format(' '.join(_bigrams(segment))))
+        else:
+            terms.append('"{}"*'.format(segment))
+    return ' AND '.join(terms) if terms else None
+
+
+def build_any_match(text):
+    """把一段自然语言（例如用户问题）转换为任一词项命中即可的MATCH表达式，用于召回"""
+    terms = []
+    for is_cjk, segment in _segments(text):
+        if is_cjk:
+            terms.extend('"{}"'.format(gram) for gram in _bigrams(segment))
+        else:
+            terms.append('"{}"*'.format(segment))
+    terms = list(dict.fromkeys(terms))
+    return ' OR '.join(terms) if terms else None
+
+
+def index_file(conn, file_id, filename, user_id, content):
+    """写入或覆盖一个文件的索引，不提交事务"""
+    conn.execute('DELETE FROM files_fts WHERE file_id = ?', (file_id,))
+    conn.execute('''
+    INSERT INTO files_fts (file_id, filename, file_key, user_id, content)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (file_id, tokenize(filename), tokenize(file_id), tokenize(user_id), tokenize(content)))
+    conn.execute('INSERT OR IGNORE INTO files_fts_keys (key, file_id) VALUES (?, ?)', (file_id.lower(), file_id))
+
+
+def rebuild(conn, files):
+    """清空并重建索引，files 为 (file_id, filename, user_id, content) 的可迭代对象，不提交事务"""
+    conn.execute('DELETE FROM files_fts')
+    conn.execute('DELETE FROM files_fts_keys')
+    total = 0
+    for file_id, filename, user_id, content in files:
+        index_file(conn, file_id, filename, user_id, content)
+        total += 1
+    return total
+
+
+def _score_sql():
+    return '-bm25(files_fts, {})'.format(', '.join(str(w) for w in _BM25_WEIGHTS))
+
+
+def _file_id_hits(conn, needle):
+    """文件ID命中的子查询：先按主键范围做精确/前缀匹配，没有结果时才退回子串扫描"""
+    upper = needle[:-1] + chr(ord(needle[-1]) + 1)
+    prefixed = conn.execute(
+        'SELECT 1 FROM files_fts_keys WHERE key >= ? AND key < ? LIMIT 1', (needle, upper)
+    ).fetchone()
+    if prefixed:
+        return 'SELECT file_id, 0.0 AS score FROM files_fts_keys WHERE key >= ? AND key < ?', [needle, upper]
+    return 'SELECT file_id, 0.0 AS score FROM files_fts_keys WHERE instr(key, ?) > 0', [needle]
+
+
+def _hits_query(conn, keyword):
+    """命中文件的子查询，返回 (sql, 参数)；没有可检索内容时 sql 为 None"""
+    match = build_match(keyword)
+    needle = (keyword or '').strip().lower()
+    parts, params = [], []
+    if match is not None:
+        parts.append('SELECT file_id, {} AS score FROM files_fts WHERE files_fts MATCH ?'.format(_score_sql()))
+        params.append(match)
+    if needle:
+        sql, sql_params = _file_id_hits(conn, needle)
+        parts.append(sql)
+        params.extend(sql_params)
+    if not parts:
+        return None, []
+    return 'SELECT file_id, MAX(score) AS score FROM ({}) GROUP BY file_id'.format(' UNION ALL '.join(parts)), params
+
+
+def search(conn, keyword, limit=None, cursor=None, file_id=None):
+    """按相关度倒序检索，返回 ([(file_id, score), ...], next_cursor)
+
+    score 越大越相关；limit 为 None 时返回全部命中。
+    """
+    hits_sql, hits_params = _hits_query(conn, keyword)
+    if hits_sql is None:
+        return [], None
+
+    conditions, params = [], []
+    position = decode_cursor(cursor)
+    if position is not None:
+        conditions.append('(score, file_id) < (?, ?)')
+        params.extend(position)
+    if file_id:
+        conditions.append('file_id = ?')
+        params.append(file_id)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    sql = 'SELECT file_id, score FROM ({}){} ORDER BY score DESC, file_id DESC'.format(hits_sql, where)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        rows = conn.execute(sql, hits_params + params + [limit + 1]).fetchall()
+    else:
+        rows = conn.execute(sql, hits_params + params).fetchall()
+
+    hits = [(row[0], row[1]) for row in rows]
+    next_cursor = None
+    if limit is not None and len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1][1], hits[-1][0])
+    return hits, next_cursor
+
+
+def count(conn, keyword):
+    hits_sql, hits_params = _hits_query(conn, keyword)
+    if hits_sql is None:
+        return 0
+    return conn.execute('SELECT COUNT(*) FROM ({})'.format(hits_sql), hits_params).fetchone()[0]
+
+
+def snippet(text, keyword, width=40, mark=('<mark>', '</mark>')):
+    """在原文中截取关键词附近的片段并高亮，找不到关键词时返回开头部分
+
+    返回值会作为HTML渲染，原文先转义，只有高亮标记本身是HTML。
+    """
+    text = text or ''
+    needles = [segment for _, segment in _segments(keyword)]
+    lowered = text.lower()
+    positions = [(lowered.find(n), n) for n in needles if lowered.find(n) >= 0]
+    if not positions:
+        return html.escape(text[:width * 2]) + ('...' if len(text) > width * 2 else '')
+
+    first, _ = min(positions)
+    start = max(0, first - width)
+    end = min(len(text), first + width)
+    window = text[start:end]
+
+    pattern = re.compile('|'.join(re.escape(n) for n in sorted(set(needles), key=len, reverse=True)),
+                         re.IGNORECASE)
+    parts = []
+    last = 0
+    for m in pattern.finditer(window):
+        parts.append(html.escape(window[last:m.start()]))
+        parts.append(f'{mark[0]}{html.escape(m.group(0))}{mark[1]}')
+        last = m.end()
+    parts.append(html.escape(window[last:]))
+    highlighted = ''.join(parts)
+    return ('...' if start > 0 else '') + highlighted + ('...' if end < len(text) else '')
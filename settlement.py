@@ -0,0 +1,111 @@
+# settlement.py - 奖励结算引擎
+"""
+一次 reward_distribution 对应一个SQLite事务:
+用户余额、引用记录、文件计数、收益汇总表和社区统计全部用 executemany 批量写入，
+要么全部生效，要么全部回滚；热路径上不再重写任何JSON文件。
+"""
+import uuid
+from datetime import datetime
+
+import rollups
+import community_stats
+
+
+def settle_rewards(conn, payer_id, question, rewards):
+    """在一个事务中结算奖励
+
+    Args:
+        conn: sqlite3 连接（row_factory 为 sqlite3.Row），调用前不应有未提交的事务
+        payer_id: 提问（付费）用户ID
+        question: 用户问题
+        rewards: [{'file_id', 'file_owner', 'reward', 'weight', 'similarity'}, ...]
+
+    Returns:
+        (settled, transactions)
+        settled: 实际结算成功的条目，附带 file_owner 的 wallet_account
+        transactions: 需要追加到交易日志的 reward/reference 交易
+    """
+    rewards = [r for r in rewards if r['reward'] > 0]
+    if not rewards:
+        return [], []
+
+    # 一次查询取回所有文件所有者，不存在的用户跳过
+    owner_ids = sorted({r['file_owner'] for r in rewards})
+    placeholders = ', '.join('?' for _ in owner_ids)
+    owners = {
+        row['user_id']: row
+        for row in conn.execute(
+            f'SELECT user_id, wallet_account FROM users WHERE user_id IN ({placeholders})', owner_ids
+        ).fetchall()
+    }
+
+    timestamp = datetime.now().isoformat()
+    settled = []
+    transactions = []
+    balance_rows = {}
+    reference_rows = []
+    file_rows = []
+
+    for r in rewards:
+        owner = owners.get(r['file_owner'])
+        if owner is None:
+            print(f"❌ 文件 {r['file_id']} 的所有者 {r['file_owner']} 不存在，跳过结算")
+            continue
+
+        amount = r['reward']
+        balance_rows[r['file_owner']] = balance_rows.get(r['file_owner'], 0.0) + amount
+        reference_rows.append((r['file_owner'], r['file_id'], question, amount, timestamp,
+                               r.get('similarity', 0), r.get('weight', 0)))
+        file_rows.append((amount, r['file_id']))
+
+        transactions.append({
+            'id': str(uuid.uuid4()),
+            'type': 'reward',
+            'from_user': None,  # 系统发放
+            'to_user': r['file_owner'],
+            'amount': amount,
+            'file_owner': r['file_owner'],
+            'file_id': r['file_id'],
+            'question': question,
+            'timestamp': timestamp
+        })
+        transactions.append({
+            'id': str(uuid.uuid4()),
+            'type': 'reference',
+            'from_user': payer_id,
+            'to_user': r['file_owner'],
+            'amount': 0.0,  # 引用记录，金额为0
+            'file_owner': r['file_owner'],
+            'file_id': r['file_id'],
+            'question': question,
+            'timestamp': timestamp
+        })
+        settled.append({**r, 'wallet_account': owner['wallet_account']})
+
+    if not settled:
+        return [], []
+
+    with conn:
+        conn.executemany('''
+        UPDATE users SET
+            coin_balance = coin_balance + ?,
+            total_earned = total_earned + ?
+        WHERE user_id = ?
+        ''', [(amount, amount, owner_id) for owner_id, amount in balance_rows.items()])
+
+        conn.executemany('''
+        INSERT INTO referenced_files (user_id, file_id, question, reward, timestamp, similarity, weight)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', reference_rows)
+
+        conn.executemany('''
+        UPDATE files SET
+            reference_count = COALESCE(reference_count, 0) + 1,
+            total_reward = COALESCE(total_reward, 0) + ?
+        WHERE id = ?
+        ''', file_rows)
+
+        rollups.apply_transactions(conn, transactions)
+        community_stats.record_rewards(conn, len(file_rows), sum(amount for amount, _ in file_rows))
+
+    return settled, transactions
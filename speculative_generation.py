@@ -0,0 +1,144 @@
+# speculative_generation.py - 等待转账确认期间提前生成回答
+"""
+需要引用文档时，/ask 要等用户在钱包中确认转账（最长两分钟）后才开始生成回答。
+投机生成在发出转账意图的同时就在后台线程中开始流式生成，生成的文本先缓存起来:
+- 用户确认后 release()：先一次性交出已缓存的文本，再继续转发后续生成的内容
+- 用户取消或超时 discard()：停止生成、丢弃缓存，并返回这次投机生成的开销，供调用方记录
+
+discard() 在后台线程处于两个文本块之间时直接关闭底层流式请求；后台线程正在等待下一块时
+（生成器不能跨线程关闭）由后台线程在该块返回后立即关闭，且不再读取后续内容。
+丢弃时的开销按取消时刻计算，不包括取消之后后台线程收尾的时间。
+"""
+import time
+import threading
+
+
+class SpeculativeAnswer:
+    """在后台线程中预先生成的回答
+
+    Args:
+        stream_factory: 接收提示词、返回文本块迭代器的函数（如 stream_llm_answer）
+        prompt: 提示词
+        name: 后台线程名
+    """
+
+    def __init__(self, stream_factory, prompt, name='speculative-answer'):
+        self._parts = []
+        self._done = False
+        self._completed = False
+        self._error = None
+        self._released = False
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        # 后台线程在 next() 期间持有，discard() 拿不到时说明正在等待下一块
+        self._stream_lock = threading.Lock()
+        self._stream = None
+        self._stream_closed = False
+        self.started_at = time.monotonic()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.cancelled_at = None
+        self._thread = threading.Thread(target=self._run, args=(stream_factory, prompt), name=name, daemon=True)
+        self._thread.start()
+
+    def _close_stream(self):
+        """关闭底层流式请求，调用方需持有 _stream_lock"""
+        if self._stream_closed:
+            return
+        self._stream_closed = True
+        if self._stream is not None and hasattr(self._stream, 'close'):
+            self._stream.close()
+
+    def _run(self, stream_factory, prompt):
+        try:
+            with self._stream_lock:
+                if self._cancelled.is_set():
+                    return
+                self._stream = stream_factory(prompt)
+                iterator = iter(self._stream)
+            while True:
+                with self._stream_lock:
+                    if self._cancelled.is_set():
+                        break
+                    try:
+                        text = next(iterator)
+                    except StopIteration:
+                        self._completed = True
+                        break
+                    if self._cancelled.is_set():
+                        # 等待期间已被丢弃，这一块不再缓存
+                        break
+                with self._condition:
+                    if self.first_chunk_at is None:
+                        self.first_chunk_at = time.monotonic()
+                    self._parts.append(text)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._stream_lock:
+                try:
+                    self._close_stream()
+                except Exception as e:
+                    print(f"⚠️ 关闭投机生成的流式请求失败: {e}")
+            with self._condition:
+                self._done = True
+                self.finished_at = time.monotonic()
+                self._condition.notify_all()
+
+    def release(self):
+        """逐块产出回答：先交出已缓存的部分，再跟随后台生成；生成出错时在产出已有文本后抛出
+
+        调用方提前停止迭代（客户端断开）时同时取消后台生成。
+        """
+        self._released = True
+        position = 0
+        try:
+            while True:
+                with self._condition:
+                    while position >= len(self._parts) and not self._done:
+                        self._condition.wait()
+                    pending = self._parts[position:]
+                    position = len(self._parts)
+                    finished = self._done
+                if pending:
+                    yield ''.join(pending)
+                if finished and position >= len(self._parts):
+                    break
+            if self._error is not None:
+                raise self._error
+        finally:
+            self._cancelled.set()
+
+    def discard(self):
+        """取消并丢弃投机生成的回答，返回开销；已经 release 的回答不受影响，返回 None"""
+        if self._released:
+            return None
+        with self._condition:
+            if self.cancelled_at is None:
+                self.cancelled_at = time.monotonic()
+        self._cancelled.set()
+        if self._stream_lock.acquire(blocking=False):
+            try:
+                self._close_stream()
+            except Exception as e:
+                print(f"⚠️ 关闭投机生成的流式请求失败: {e}")
+            finally:
+                self._stream_lock.release()
+        return self.cost()
+
+    def cost(self):
+        """已经生成的文本量和耗时"""
+        with self._condition:
+            chars = sum(len(part) for part in self._parts)
+            chunks = len(self._parts)
+            finished = self._completed
+            end = self.finished_at or time.monotonic()
+            if self.cancelled_at is not None:
+                end = min(end, self.cancelled_at)
+        return {
+            'chunks': chunks,
+            'chars': chars,
+            'seconds': end - self.started_at,
+            'finished': finished
+        }
@@ -0,0 +1,34 @@
+// src/lib/pagination.ts
+// 列表接口（/community/files、/api/files、/stake）按 next_cursor 游标分页：
+// 首次只取第一页，用户点击"加载更多"时再带上 next_cursor 取下一页
+
+export const PAGE_LIMIT = 50;
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+// 在列表接口 URL 上附加每页条数和游标
+export const pagedUrl = (url: string, cursor?: string | null) => {
+  const params = new URLSearchParams({ limit: String(PAGE_LIMIT) });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  return `${url}${url.includes('?') ? '&' : '?'}${params.toString()}`;
+};
+
+// 取一页，返回 key 字段的条目和下一页游标（没有更多时为 null）
+export async function fetchPage<T>(url: string, key: string, cursor?: string | null): Promise<Page<T>> {
+  const response = await fetch(pagedUrl(url, cursor), {
+    headers: { 'Accept': 'application/json' },
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP错误: ${response.status}`);
+  }
+  const page = await response.json();
+  if (!page.success) {
+    throw new Error(page.message || '分页加载失败');
+  }
+  return { items: page[key] || [], nextCursor: page.next_cursor || null };
+}
@@ -167,7 +167,8 @@ const Chat = () => {
         socket.emit('user_transaction_confirmation', {
           user_id: account,
           confirmed: false,
-          tx_hash: null
+          tx_hash: null,
+          confirmation_id: intent.confirmation_id
         });
       }
       return;
@@ -211,7 +212,8 @@ const Chat = () => {
           user_id: account,
           confirmed: true,
           tx_hash: txHash,
-          transaction_id: null  // 如果有transaction_id，可以在这里添加
+          transaction_id: null,  // 如果有transaction_id，可以在这里添加
+          confirmation_id: intent.confirmation_id
         });
       }
       
@@ -235,7 +237,8 @@ const Chat = () => {
         socket.emit('user_transaction_confirmation', {
           user_id: account,
           confirmed: false,
-          tx_hash: null
+          tx_hash: null,
+          confirmation_id: intent.confirmation_id
         });
       }
     } finally {
@@ -258,7 +261,8 @@ const Chat = () => {
       socket.emit('user_transaction_confirmation', {
         user_id: account,
         confirmed: false,
-        tx_hash: null
+        tx_hash: null,
+        confirmation_id: pendingIntent?.confirmation_id
       });
     }
   };
@@ -344,6 +348,7 @@ const Chat = () => {
               toToken: data.data.toToken,
               amount: data.data.amount,
               recipient: data.data.recipient,
+              confirmation_id: data.data.confirmation_id,
             };
             
             // 设置待处理的意图
@@ -7,6 +7,7 @@ import { Card } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Skeleton } from "@/components/ui/skeleton";
 import { useToast } from "@/components/ui/use-toast";
+import { fetchPage, pagedUrl } from "@/lib/pagination";
 import { 
   Search, 
   FileText, 
@@ -28,7 +29,7 @@ interface FileInfo {
   filename: string;
   user_id: string;
   content: string;
-  content_full?: string;
+  content_size?: number;
   upload_time: string;
   reference_count: number;
   total_reward: number;
@@ -48,6 +49,10 @@ const Community = () => {
   const [filteredFiles, setFilteredFiles] = useState<FileInfo[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  // 游标分页：当前列表的请求地址和下一页游标
+  const [listUrl, setListUrl] = useState('/api/community/files');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [stats, setStats] = useState<CommunityStats | null>(null);
   const [statsLoading, setStatsLoading] = useState(false);
   const { toast } = useToast();
@@ -65,7 +70,7 @@ const Community = () => {
       console.log("🌐 前端请求URL:", testUrl);
       console.log("📡 预期代理到后端:", `http://localhost:5001/community/files`);
       
-      const response = await fetch(testUrl, {
+      const response = await fetch(pagedUrl(testUrl), {
         method: 'GET',
         headers: {
           'Accept': 'application/json',
@@ -106,6 +111,8 @@ const Community = () => {
         console.log(`📄 获取到 ${result.files?.length || 0} 个文件`);
         setFiles(result.files || []);
         setFilteredFiles(result.files || []);
+        setListUrl(testUrl);
+        setNextCursor(result.next_cursor || null);
         
         if (keyword) {
           toast({
@@ -130,6 +137,27 @@ const Community = () => {
     }
   };
 
+  // 加载下一页社区文件
+  const loadMoreFiles = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const page = await fetchPage<FileInfo>(listUrl, 'files', nextCursor);
+      setFiles(prev => [...prev, ...page.items]);
+      setFilteredFiles(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('❌ 加载更多文件错误:', error);
+      toast({
+        title: "加载失败",
+        description: error instanceof Error ? error.message : "未知错误",
+        variant: "destructive",
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // 获取社区统计
   const fetchCommunityStats = async () => {
     try {
@@ -569,20 +597,14 @@ const Community = () => {
                 </div>
               )}
 
-              {/* 分页提示（如果需要） */}
-              {filteredFiles.length > 9 && (
+              {/* 还有下一页时按需加载 */}
+              {nextCursor && (
                 <div className="mt-8 text-center">
                   <p className="text-sm text-muted-foreground">
-                    显示 {Math.min(9, filteredFiles.length)} 个文件，共 {filteredFiles.length} 个
+                    已显示 {filteredFiles.length} 个文件
                   </p>
-                  <Button variant="outline" className="mt-4" onClick={() => {
-                    toast({
-                      title: "功能提示",
-                      description: "分页功能正在开发中",
-                      duration: 2000,
-                    });
-                  }}>
-                    加载更多
+                  <Button variant="outline" className="mt-4" onClick={loadMoreFiles} disabled={loadingMore}>
+                    {loadingMore ? '加载中...' : '加载更多'}
                   </Button>
                 </div>
               )}
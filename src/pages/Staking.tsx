@@ -9,6 +9,7 @@ import { useState, useEffect } from "react";
 import { toast } from "sonner";
 import { useWeb3 } from '../hooks/useWeb3';
 import { ethers } from 'ethers';
+import { fetchPage } from '@/lib/pagination';
 
 
 // 导入智能合约ABI
@@ -47,10 +48,13 @@ const Staking = () => {
   const [files, setFiles] = useState<any[]>([]);
   const [selectedFile, setSelectedFile] = useState<string | null>(null);
   const [isLoadingFiles, setIsLoadingFiles] = useState(false);
+  const [filesCursor, setFilesCursor] = useState<string | null>(null);
   
   // 质押记录相关状态
   const [stakeRecords, setStakeRecords] = useState<any[]>([]);
   const [isLoadingStakes, setIsLoadingStakes] = useState(false);
+  const [stakesCursor, setStakesCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   
   // 生成内容ID
   const generateContentId = () => {
@@ -58,53 +62,43 @@ const Staking = () => {
     return ethers.keccak256(ethers.toUtf8Bytes(contentIdStr));
   };
   
-  // 获取文件列表
-  const fetchFiles = async () => {
+  // 获取文件列表（第一页，cursor 不为空时追加下一页）
+  const fetchFiles = async (cursor: string | null = null) => {
     if (!isConnected) return;
     
     try {
-      setIsLoadingFiles(true);
+      cursor ? setIsLoadingMore(true) : setIsLoadingFiles(true);
       console.log("🔍 正在获取文件列表...");
-      const response = await fetch(`/api/files?wallet_address=${account}`);
-      const data = await response.json();
-      
-      if (data.success) {
-        console.log("✅ 文件列表获取成功:", data.files);
-        setFiles(data.files);
-      } else {
-        console.error("❌ 获取文件列表失败:", data.message);
-        toast.error("获取文件列表失败");
-      }
+      const page = await fetchPage<any>(`/api/files?wallet_address=${account}`, 'files', cursor);
+      console.log("✅ 文件列表获取成功:", page.items);
+      setFiles(prev => cursor ? [...prev, ...page.items] : page.items);
+      setFilesCursor(page.nextCursor);
     } catch (error) {
       console.error("❌ 获取文件列表出错:", error);
       toast.error("获取文件列表出错");
     } finally {
       setIsLoadingFiles(false);
+      setIsLoadingMore(false);
     }
   };
   
-  // 获取质押记录
-  const fetchStakeRecords = async () => {
+  // 获取质押记录（第一页，cursor 不为空时追加下一页）
+  const fetchStakeRecords = async (cursor: string | null = null) => {
     if (!isConnected || !account) return;
     
     try {
-      setIsLoadingStakes(true);
+      cursor ? setIsLoadingMore(true) : setIsLoadingStakes(true);
       console.log("🔍 正在获取质押记录...");
-      const response = await fetch(`/api/stake?wallet_address=${account}`);
-      const data = await response.json();
-      
-      if (data.success) {
-        console.log("✅ 质押记录获取成功:", data.stakes);
-        setStakeRecords(data.stakes);
-      } else {
-        console.error("❌ 获取质押记录失败:", data.message);
-        toast.error("获取质押记录失败");
-      }
+      const page = await fetchPage<any>(`/api/stake?wallet_address=${account}`, 'stakes', cursor);
+      console.log("✅ 质押记录获取成功:", page.items);
+      setStakeRecords(prev => cursor ? [...prev, ...page.items] : page.items);
+      setStakesCursor(page.nextCursor);
     } catch (error) {
       console.error("❌ 获取质押记录出错:", error);
       toast.error("获取质押记录出错");
     } finally {
       setIsLoadingStakes(false);
+      setIsLoadingMore(false);
     }
   };
   
@@ -490,7 +484,7 @@ const Staking = () => {
                   <Button 
                     variant="ghost" 
                     size="sm" 
-                    onClick={fetchFiles}
+                    onClick={() => fetchFiles()}
                     disabled={!isConnected || isLoadingFiles}
                     className="text-gray-300 hover:text-white"
                   >
@@ -525,6 +519,17 @@ const Staking = () => {
                         </div>
                       </div>
                     ))}
+                    {filesCursor && (
+                      <Button
+                        variant="ghost"
+                        size="sm"
+                        className="w-full text-gray-300 hover:text-white"
+                        onClick={() => fetchFiles(filesCursor)}
+                        disabled={isLoadingMore}
+                      >
+                        {isLoadingMore ? <Loader2 className="h-4 w-4 animate-spin" /> : '加载更多'}
+                      </Button>
+                    )}
                   </div>
                 )}
               </div>
@@ -696,7 +701,7 @@ const Staking = () => {
                 <Button 
                   variant="ghost" 
                   size="sm" 
-                  onClick={fetchStakeRecords}
+                  onClick={() => fetchStakeRecords()}
                   disabled={!isConnected || isLoadingStakes}
                   className="text-gray-300 hover:text-white"
                 >
@@ -732,6 +737,17 @@ const Staking = () => {
                         </div>
                       </div>
                     ))}
+                    {stakesCursor && (
+                      <Button
+                        variant="ghost"
+                        size="sm"
+                        className="w-full text-gray-300 hover:text-white"
+                        onClick={() => fetchStakeRecords(stakesCursor)}
+                        disabled={isLoadingMore}
+                      >
+                        {isLoadingMore ? <Loader2 className="h-4 w-4 animate-spin" /> : '加载更多'}
+                      </Button>
+                    )}
                   </div>
                 )}
               </div>
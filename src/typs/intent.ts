@@ -18,6 +18,7 @@ export interface Intent {
   amount?: string
   recipient?: string
   additionalParams?: Record<string, unknown>
+  confirmation_id?: string  // 后端分配的关联ID，确认转账时原样带回
 }
 
 export interface LLMResponse {
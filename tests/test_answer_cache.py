@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+def doc(file_id):
+    return SimpleNamespace(metadata={'file_id': file_id}, page_content='内容')
+
+
+def test_lookup_by_similarity():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store('q1', [1.0, 0.0], '答案1', [doc('f1')], ['k1'], (True, 'rag', 0.9))
+    entry, similarity = cache.lookup([0.99, 0.05])
+    assert entry['answer'] == '答案1' and similarity > 0.95
+    entry, similarity = cache.lookup([0.0, 1.0])
+    assert entry is None and similarity < 0.95
+    assert cache.lookup([0.0, 0.0]) == (None, 0.0)
+
+
+def test_invalidate_files_and_uncited():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store('q1', [1.0, 0.0], '引用f1', [doc('f1')], ['k1'], (True, '', 1.0))
+    cache.store('q2', [0.0, 1.0], '无引用', [], [], (False, '', 0.0))
+    assert cache.invalidate_files(['f2']) == 0
+    assert cache.invalidate_files(['f2'], include_uncited=True) == 1
+    assert cache.lookup([0.0, 1.0])[0] is None
+    assert cache.invalidate_files(['f1']) == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_ttl_and_capacity(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.9, ttl=10, max_entries=2)
+    cache.store('a', [1.0, 0.0, 0.0], 'A', [], [], (False, '', 0.0))
+    cache.store('b', [0.0, 1.0, 0.0], 'B', [], [], (False, '', 0.0))
+    cache.store('c', [0.0, 0.0, 1.0], 'C', [], [], (False, '', 0.0))
+    assert cache.lookup([1.0, 0.0, 0.0])[0] is None
+    assert cache.lookup([0.0, 0.0, 1.0])[0]['answer'] == 'C'
+    assert cache.stats()['evictions'] == 1
+    now[0] = 11
+    assert cache.lookup([0.0, 0.0, 1.0])[0] is None
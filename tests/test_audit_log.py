@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+
+from audit_log import AuditLog, page_after
+
+
+def entry(timestamp, tx_id):
+    return {'timestamp': timestamp, 'transaction': {'id': tx_id}}
+
+
+def test_legacy_json_imported_once(tmp_path):
+    legacy = tmp_path / 'transaction_logs.json'
+    legacy.write_text(json.dumps([
+        entry('2024-01-02T10:00:00', 'b'),
+        entry('2024-01-01T09:00:00', 'a'),
+        entry('2024-01-03T08:00:00', 'c'),
+    ]), encoding='utf-8')
+
+    log = AuditLog(str(tmp_path / 'audit'), legacy_json=str(legacy))
+    assert [r['transaction']['id'] for r in log.read_range()] == ['a', 'b', 'c']
+    assert [r['transaction']['id'] for r in log.read_range('2024-01-02', '2024-01-03')] == ['b']
+    log.close()
+    assert not legacy.exists() and os.path.exists(str(legacy) + '.imported')
+
+    reopened = AuditLog(str(tmp_path / 'audit'), legacy_json=str(legacy))
+    assert len(list(reopened.read_range())) == 3
+    reopened.close()
+
+
+def test_written_records_are_readable(tmp_path):
+    log = AuditLog(str(tmp_path / 'audit'), compress=False)
+    log.write(entry('2024-01-01T00:00:00', 'x'))
+    log.flush(timeout=5)
+    assert [r['transaction']['id'] for r in log.read_range('2024-01-01')] == ['x']
+    log.close()
+
+
+def test_compress_is_atomic_and_reader_skips_duplicate_segment(tmp_path):
+    directory = tmp_path / 'audit'
+    log = AuditLog(str(directory), compress=False)
+    log.write(entry('2024-01-01T00:00:00', 'x'))
+    log.close()
+    (segment,) = os.listdir(directory)
+    path = str(directory / segment)
+
+    # 压缩完成、原文件尚未删除的中间状态：只读一份
+    with open(path, 'rb') as f:
+        data = f.read()
+    with gzip.open(path + '.gz', 'wb') as f:
+        f.write(data)
+    reader = AuditLog(str(directory), compress=False)
+    assert [r['transaction']['id'] for r in reader.read_range()] == ['x']
+    reader.close()
+
+    os.remove(path + '.gz')
+    AuditLog._compress(path)
+    assert sorted(os.listdir(directory)) == [segment + '.gz']
+
+
+def test_page_after_cursor_is_exclusive_across_equal_timestamps():
+    records = [entry('2024-01-01T00:00:00', 'a')] + \
+        [entry('2024-01-01T00:00:01', c) for c in 'bcde'] + \
+        [entry('2024-01-01T00:00:02', 'f')]
+
+    seen = []
+    start, skip = None, 0
+    for _ in range(10):
+        remaining = [r for r in records if start is None or r['timestamp'] >= start]
+        page, start, skip = page_after(remaining, 2, start, skip)
+        seen.extend(r['transaction']['id'] for r in page)
+        if start is None:
+            break
+    assert seen == list('abcdef')
@@ -0,0 +1,65 @@
+import pytest
+
+from batch_embedder import BatchEmbedder, EmbeddingBatchError, is_transient
+
+
+class FakeEmbeddings:
+    """按脚本返回结果或抛出错误的嵌入模型"""
+
+    def __init__(self, fail=None):
+        self.fail = fail or (lambda texts, call: None)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        error = self.fail(texts, len(self.calls))
+        if error is not None:
+            raise error
+        return [[float(len(text))] for text in texts]
+
+
+def make_embedder(embeddings, **kwargs):
+    kwargs.setdefault('base_delay', 0)
+    return BatchEmbedder(embeddings, **kwargs)
+
+
+def test_is_transient():
+    assert is_transient(RuntimeError('HTTP 502 Bad Gateway'))
+    assert is_transient(ConnectionError('reset'))
+    assert not is_transient(ValueError('input too long'))
+
+
+def test_batches_and_order():
+    fake = FakeEmbeddings()
+    vectors, stats = make_embedder(fake, batch_size=2).embed(['a', 'bb', 'ccc', 'dddd', 'e'])
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [1.0]]
+    assert stats['batches'] == 3 and stats['chunks'] == 5
+    assert sorted(len(call) for call in fake.calls) == [1, 2, 2]
+
+
+def test_transient_error_is_retried_without_split():
+    fake = FakeEmbeddings(lambda texts, call: RuntimeError('503 unavailable') if call <= 2 else None)
+    vectors, _ = make_embedder(fake, batch_size=4, max_concurrency=1).embed(['a', 'b', 'c', 'd'])
+    assert len(vectors) == 4
+    assert [len(call) for call in fake.calls] == [4, 4, 4]
+
+
+def test_exhausted_transient_retries_fail_whole_batch_without_split():
+    fake = FakeEmbeddings(lambda texts, call: RuntimeError('502 Bad Gateway'))
+    with pytest.raises(EmbeddingBatchError) as info:
+        make_embedder(fake, batch_size=4, max_retries=2, max_concurrency=1).embed(['a', 'b', 'c', 'd'])
+    assert info.value.failed_indices == [0, 1, 2, 3]
+    assert [len(call) for call in fake.calls] == [4, 4, 4]
+
+
+def test_non_transient_error_splits_to_isolate_bad_text():
+    fake = FakeEmbeddings(lambda texts, call: ValueError('invalid input') if 'bad' in texts else None)
+    with pytest.raises(EmbeddingBatchError) as info:
+        make_embedder(fake, batch_size=4, max_concurrency=1).embed(['a', 'bad', 'c', 'd'])
+    assert info.value.failed_indices == [1]
+    assert isinstance(info.value.last_error, ValueError)
+
+
+def test_empty_input_reports_zero_throughput():
+    vectors, stats = make_embedder(FakeEmbeddings()).embed([])
+    assert vectors == [] and stats['chunks_per_second'] == 0.0
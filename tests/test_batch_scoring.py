@@ -0,0 +1,67 @@
+import ast
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+import batch_scoring
+from batch_scoring import score_candidates
+
+REFERENCE_FUNCTIONS = ('enhanced_cosine_similarity', 'calculate_jaccard_similarity', 'calculate_semantic_similarity')
+
+
+@pytest.fixture(scope='module')
+def calculate_semantic_similarity():
+    """从 app.py 源码中取出逐个打分的原函数（导入 app 需要 Flask 等完整运行环境）"""
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app.py')
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    module = ast.Module(body=[node for node in tree.body
+                              if isinstance(node, ast.FunctionDef) and node.name in REFERENCE_FUNCTIONS],
+                        type_ignores=[])
+    namespace = {'np': np, 'math': math, 'print': lambda *args: None,
+                 'CONCEPT_KEYWORDS': batch_scoring.CONCEPT_KEYWORDS,
+                 'CONCEPTUAL_MARKERS': batch_scoring.CONCEPTUAL_MARKERS}
+    exec(compile(module, path, 'exec'), namespace)
+    return namespace['calculate_semantic_similarity']
+
+
+def assert_matches_reference(reference, question, contents, question_embedding, doc_embeddings):
+    scores, _ = score_candidates(question, contents, question_embedding, doc_embeddings)
+    expected = [reference(question, content, None, question_embedding, embedding)
+                for content, embedding in zip(contents, doc_embeddings)]
+    np.testing.assert_allclose(scores, expected, rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('question', ['什么是爱', 'how does python work', '编程语言 的 语法', '为什么 天空 是 蓝色'])
+def test_random_vectors_match_reference(calculate_semantic_similarity, question):
+    rng = np.random.default_rng(42)
+    words = ['爱', '爱情', '定义', '编程', '语言', 'python', 'code', 'the', 'sky', '概念']
+    random.seed(7)
+    contents = [' '.join(random.choices(words, k=random.randint(1, 60))) for _ in range(30)]
+    question_embedding = rng.normal(size=64).tolist()
+    doc_embeddings = rng.normal(size=(30, 64)).tolist()
+    assert_matches_reference(calculate_semantic_similarity, question, contents, question_embedding, doc_embeddings)
+
+
+def test_zero_vectors_match_reference(calculate_semantic_similarity):
+    contents = ['爱 是 什么', '', 'a b c']
+    doc_embeddings = [[0.0, 0.0, 0.0], [1.0, 2.0, 3.0], [0.0, 0.0, 0.0]]
+    assert_matches_reference(calculate_semantic_similarity, '什么是爱', contents, [1.0, 0.0, -1.0], doc_embeddings)
+    assert_matches_reference(calculate_semantic_similarity, '什么是爱', contents, [0.0, 0.0, 0.0], doc_embeddings)
+
+
+def test_uneven_text_lengths_match_reference(calculate_semantic_similarity):
+    contents = ['', 'x', 'word ' * 200, '编程语言' * 50, '  ']
+    rng = np.random.default_rng(1)
+    doc_embeddings = rng.normal(size=(len(contents), 8)).tolist()
+    for question in ['', 'x', '什么叫编程语言']:
+        assert_matches_reference(calculate_semantic_similarity, question, contents, rng.normal(size=8).tolist(),
+                                 doc_embeddings)
+
+
+def test_empty_candidates():
+    scores, components = score_candidates('q', [], [1.0], [])
+    assert len(scores) == 0 and components == {}
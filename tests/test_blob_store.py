@@ -0,0 +1,39 @@
+import os
+import threading
+
+from blob_store import BlobStore
+
+
+def test_put_get_roundtrip(tmp_path):
+    store = BlobStore(str(tmp_path))
+    content_hash, size = store.put('正文内容')
+    assert size == len('正文内容'.encode('utf-8'))
+    assert store.get(content_hash) == '正文内容'
+    assert store.put('正文内容') == (content_hash, size)
+    assert store.get('0' * 64) is None
+
+
+def test_concurrent_puts_of_same_content(tmp_path):
+    store = BlobStore(str(tmp_path))
+    text = 'x' * 200000
+    errors = []
+    barrier = threading.Barrier(8)
+
+    def put():
+        barrier.wait()
+        try:
+            store.put(text)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    content_hash = store.hash_text(text)
+    assert store.get(content_hash) == text
+    leftovers = [name for _, _, files in os.walk(str(tmp_path)) for name in files if name.endswith('.tmp')]
+    assert leftovers == []
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import community_stats
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE files (id TEXT PRIMARY KEY, user_id TEXT, reference_count INTEGER, total_reward REAL)')
+    community_stats.create_table(conn.cursor())
+    conn.commit()
+    return conn
+
+
+def upload(conn, file_id, user_id):
+    conn.execute('INSERT INTO files (id, user_id) VALUES (?, ?)', (file_id, user_id))
+    community_stats.record_upload(conn, file_id, user_id)
+    conn.commit()
+
+
+def test_record_upload_counts_files_and_new_authors(conn):
+    upload(conn, 'f1', 'alice')
+    upload(conn, 'f2', 'alice')
+    upload(conn, 'f3', 'bob')
+    stats = community_stats.get(conn)
+    assert stats['total_files'] == 3 and stats['active_authors'] == 2
+
+
+def test_record_rewards_accumulates(conn):
+    community_stats.record_rewards(conn, 2, 1.5)
+    community_stats.record_rewards(conn, 1, 0.25)
+    conn.commit()
+    stats = community_stats.get(conn)
+    assert stats['total_references'] == 3 and stats['total_rewards'] == 1.75
+
+
+def test_reconcile_reports_and_fixes_drift(conn):
+    upload(conn, 'f1', 'alice')
+    upload(conn, 'f2', 'bob')
+    conn.execute("UPDATE files SET reference_count = 4, total_reward = 2.0 WHERE id = 'f1'")
+    conn.execute("DELETE FROM files WHERE id = 'f2'")  # 绕过计数的修改
+    conn.commit()
+
+    drift = community_stats.reconcile(conn)
+    assert drift == {'total_files': (2, 1), 'total_references': (0, 4),
+                     'total_rewards': (0.0, 2.0), 'active_authors': (2, 1)}
+    assert community_stats.get(conn) == {'total_files': 1, 'total_references': 4,
+                                         'total_rewards': 2.0, 'active_authors': 1}
+    assert community_stats.reconcile(conn) == {}
+
+
+def test_get_without_row_returns_zeros():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE community_stats (id INTEGER PRIMARY KEY, total_files INTEGER, '
+                 'total_references INTEGER, total_rewards REAL, active_authors INTEGER)')
+    assert community_stats.get(conn) == dict.fromkeys(community_stats.STAT_FIELDS, 0)
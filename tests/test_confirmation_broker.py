@@ -0,0 +1,60 @@
+import threading
+
+from confirmation_broker import ConfirmationBroker
+
+
+def wait_in_thread(broker, confirmation_id, timeout=5):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', broker.wait(confirmation_id, timeout)))
+    thread.start()
+    return thread, result
+
+
+def test_resolve_by_id_wakes_only_that_waiter():
+    broker = ConfirmationBroker()
+    first = broker.open('u1')
+    second = broker.open('u1')
+    thread, result = wait_in_thread(broker, second)
+
+    assert broker.resolve('u1', True, 'tx2', '0xhash', confirmation_id=second) == second
+    thread.join(5)
+    assert result['value'] == (True, 'tx2', '0xhash')
+    assert broker.pending_count() == 1
+    assert broker.resolve('u1', False, confirmation_id=first) == first
+    assert broker.wait(first, 0) == (False, None, None)
+    assert broker.pending_count() == 0
+
+
+def test_resolve_without_id_goes_to_oldest_waiter_of_that_user():
+    broker = ConfirmationBroker()
+    other = broker.open('u2')
+    oldest = broker.open('u1')
+    newest = broker.open('u1')
+    assert broker.resolve('u1', True, 'tx') == oldest
+    assert broker.resolve('u1', True, 'tx') == newest
+    assert broker.resolve('u1', True, 'tx') is None
+    assert broker.wait(oldest, 1) == (True, 'tx', None)
+    broker.discard(other)
+    broker.discard(newest)
+    assert broker.pending_count() == 0
+
+
+def test_resolve_rejects_other_user_and_unknown_id():
+    broker = ConfirmationBroker()
+    confirmation_id = broker.open('u1')
+    assert broker.resolve('u2', True, confirmation_id=confirmation_id) is None
+    assert broker.resolve('u1', True, confirmation_id='missing') is None
+    assert broker.pending_count() == 1
+
+
+def test_timeout_and_discard_clean_up():
+    broker = ConfirmationBroker()
+    confirmation_id = broker.open('u1')
+    assert broker.wait(confirmation_id, 0.01) == (False, None, None)
+    assert broker.resolve('u1', True, confirmation_id=confirmation_id) is None
+    assert broker.wait('missing', 0.01) == (False, None, None)
+
+    discarded = broker.open('u1')
+    broker.discard(discarded)
+    broker.discard(discarded)
+    assert broker.pending_count() == 0
@@ -0,0 +1,126 @@
+from db_pool import ConnectionPool
+
+
+def make_pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'))
+    conn = pool.connection()
+    conn.execute('CREATE TABLE t (v INTEGER)')
+    conn.commit()
+    conn.close()
+    return pool
+
+
+def count_rows(pool):
+    with pool.borrow() as conn:
+        return conn.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+
+def test_nested_commit_does_not_commit_outer_transaction(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    outer.execute('INSERT INTO t VALUES (1)')
+
+    inner = pool.connection()
+    inner.execute('INSERT INTO t VALUES (2)')
+    inner.commit()
+    inner.close()
+
+    outer.rollback()
+    outer.close()
+    assert count_rows(pool) == 0
+
+
+def test_nested_commit_is_kept_when_outer_commits(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    outer.execute('SELECT COUNT(*) FROM t').fetchone()
+
+    inner = pool.connection()
+    inner.execute('INSERT INTO t VALUES (1)')
+    inner.commit()
+    inner.execute('INSERT INTO t VALUES (2)')  # 未提交，close 时回滚
+    inner.close()
+
+    outer.close()
+    assert count_rows(pool) == 1
+
+
+def test_borrow_releases_on_early_exit(tmp_path):
+    pool = make_pool(tmp_path)
+
+    def lookup():
+        with pool.borrow() as conn:
+            conn.execute('INSERT INTO t VALUES (1)')
+            return conn.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+    assert lookup() == 1
+    assert pool._local.conn.depth == 0
+    assert not pool._local.conn.conn.in_transaction
+    assert count_rows(pool) == 0
+
+
+def test_close_is_idempotent(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    inner = pool.connection()
+    inner.close()
+    inner.close()
+    assert pool._local.conn.depth == 1
+    outer.close()
+    assert pool._local.conn.depth == 0
+
+
+def test_with_statement_commits_nested_savepoint_only(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    outer.execute('INSERT INTO t VALUES (1)')
+    inner = pool.connection()
+    with inner:
+        inner.execute('INSERT INTO t VALUES (2)')
+    inner.close()
+    assert outer.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2
+    outer.rollback()
+    outer.close()
+    assert count_rows(pool) == 0
+
+
+def test_outer_close_ends_leaked_inner_handle(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    inner = pool.connection()
+    inner.execute('INSERT INTO t VALUES (1)')  # 漏掉 inner.close()
+    outer.close()
+    assert pool._local.conn.depth == 0
+
+    conn = pool.connection()
+    conn.execute('INSERT INTO t VALUES (2)')
+    conn.commit()
+    conn.close()
+    inner.close()
+    assert count_rows(pool) == 1
+
+
+def test_leaked_handle_rolled_back_when_thread_reused(tmp_path):
+    pool = make_pool(tmp_path)
+
+    def leaky_request():
+        conn = pool.connection()
+        conn.execute('INSERT INTO t VALUES (1)')
+
+    leaky_request()
+    conn = pool.connection()
+    assert pool._local.conn.depth == 1
+    conn.execute('INSERT INTO t VALUES (2)')
+    conn.commit()
+    conn.close()
+    assert count_rows(pool) == 1
+
+
+def test_release_ends_open_handles(tmp_path):
+    pool = make_pool(tmp_path)
+    outer = pool.connection()
+    outer.execute('INSERT INTO t VALUES (1)')
+    pool.release()
+    outer.close()
+    assert pool._local.conn.depth == 0
+    assert count_rows(pool) == 0
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from deadline_pool import DeadlinePool
+
+
+def test_slow_tasks_time_out_without_blocking_caller():
+    pool = DeadlinePool(max_workers=4)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'late'
+
+    started = time.monotonic()
+    results, timed_out = pool.run({'fast': lambda: 'ok', 'slow': slow}, deadline=0.2)
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert results == {'fast': 'ok'}
+    assert timed_out == ['slow']
+    assert elapsed < 1.0
+
+    # 调用方对超时的任务采用降级结果
+    verdicts = {key: results.get(key, 'fallback') for key in ('fast', 'slow')}
+    assert verdicts == {'fast': 'ok', 'slow': 'fallback'}
+
+
+def test_late_results_are_dropped():
+    pool = DeadlinePool(max_workers=2)
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.3)
+        finished.set()
+        return 'late'
+
+    results, timed_out = pool.run({'slow': slow}, deadline=0.05)
+    assert finished.wait(2)
+    assert results == {} and timed_out == ['slow']
+
+
+def test_queued_tasks_past_deadline_are_cancelled():
+    pool = DeadlinePool(max_workers=1)
+    release = threading.Event()
+    ran = []
+
+    def blocker():
+        release.wait(5)
+
+    results, timed_out = pool.run({'blocker': blocker, 'queued': lambda: ran.append('queued')}, deadline=0.1)
+    release.set()
+    pool._executor.shutdown(wait=True)
+    assert sorted(timed_out) == ['blocker', 'queued']
+    assert ran == []
+
+
+def test_failed_tasks_are_left_out():
+    def boom():
+        raise ValueError('boom')
+
+    results, timed_out = DeadlinePool(max_workers=2).run({'ok': lambda: 1, 'bad': boom}, deadline=1.0)
+    assert results == {'ok': 1} and timed_out == []
+    assert DeadlinePool().run({}, deadline=1.0) == ({}, [])
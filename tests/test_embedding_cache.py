@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip('langchain_core')
+from embedding_cache import CachedEmbeddings  # noqa: E402
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.document_calls = []
+        self.query_calls = []
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return [[float(len(text)), 0.1] for text in texts]
+
+    def embed_query(self, text):
+        self.query_calls.append(text)
+        return [0.1, float(len(text))]
+
+
+def test_repeated_texts_in_batch_embedded_once(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, 'm', path=str(tmp_path / 'cache.db'))
+
+    vectors = cache.embed_documents(['a', 'bb', 'a', 'bb', 'ccc'])
+    assert base.document_calls == [['a', 'bb', 'ccc']]
+    assert vectors[0] == vectors[2] and vectors[1] == vectors[3]
+    assert len(vectors) == 5
+
+    again = cache.embed_documents(['ccc', 'dddd', 'a'])
+    assert again[0] == vectors[4] and again[2] == vectors[0]
+    assert base.document_calls[1:] == [['dddd']]
+
+
+def test_vectors_persist_across_instances_as_float32(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    base = CountingEmbeddings()
+    first = CachedEmbeddings(base, 'm', path=path)
+    document = first.embed_documents(['hello'])[0]
+    query = first.embed_query('hello')
+    assert document == [5.0, pytest.approx(0.1, abs=1e-7)]
+    assert document[1] != 0.1  # float32 精度
+
+    second = CachedEmbeddings(CountingEmbeddings(), 'm', path=path)
+    assert second.embed_documents(['hello']) == [document]
+    assert second.embed_query('hello') == query
+    assert second.base.document_calls == [] and second.base.query_calls == []
+    assert second.stats()['disk_hits'] == 2
+
+    # 模型名称是缓存键的一部分
+    other_model = CachedEmbeddings(CountingEmbeddings(), 'other', path=path)
+    other_model.embed_documents(['hello'])
+    assert other_model.base.document_calls == [['hello']]
+
+
+def test_memory_layer_evicts_least_recently_used(tmp_path):
+    cache = CachedEmbeddings(CountingEmbeddings(), 'm', path=str(tmp_path / 'cache.db'), memory_size=2)
+    cache.embed_documents(['a', 'b'])
+    cache.embed_documents(['a'])  # a 变为最近使用
+    cache.embed_documents(['c'])  # 淘汰 b
+    assert [key[1] for key in cache._memory] == [cache.text_hash('a'), cache.text_hash('c')]
+
+    before = cache.stats()
+    cache.embed_documents(['b'])
+    after = cache.stats()
+    assert after['disk_hits'] == before['disk_hits'] + 1
+    assert after['memory_entries'] == 2
@@ -0,0 +1,131 @@
+import json
+import sqlite3
+
+import pytest
+
+import community_stats
+import file_store
+from blob_store import BlobStore
+from file_store import FileStore, FILE_COLUMNS, create_indexes
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'files.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE files (id TEXT PRIMARY KEY, content TEXT, {})'.format(', '.join(FILE_COLUMNS)))
+    create_indexes(conn.cursor())
+    community_stats.create_table(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return connect
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'))
+
+
+def add_file(store, blobs, file_id, text, user_id='u1', upload_time='2024-01-01T00:00:00'):
+    content_hash, content_size = blobs.put(text)
+    store.add(file_id, {'filename': f'{file_id}.txt', 'user_id': user_id, 'content_hash': content_hash,
+                        'content_size': content_size, 'upload_time': upload_time, 'authorize_rag': True})
+
+
+def test_writes_refresh_cache(db, blobs):
+    store = FileStore(db, blobs)
+    assert store.count() == 0
+
+    add_file(store, blobs, 'a', '正文A')
+    assert store.exists('a') and store.get('a')['total_staked'] == 0.0
+
+    store.add_stake('a', 2.5)
+    assert store.get('a')['total_staked'] == 2.5
+
+    # 绕过 FileStore 的写入在 refresh 之前不可见，refresh 后与表一致
+    conn = db()
+    conn.execute("UPDATE files SET reference_count = 3 WHERE id = 'a'")
+    conn.execute("DELETE FROM files WHERE id = 'a'")
+    conn.commit()
+    conn.close()
+    assert store.exists('a')
+    store.refresh('a')
+    assert not store.exists('a')
+
+
+def test_invalidate_reloads_from_table(db, blobs):
+    store = FileStore(db, blobs)
+    add_file(store, blobs, 'a', 'x')
+    assert store.count() == 1
+    conn = db()
+    conn.execute("INSERT INTO files (id, filename, user_id) VALUES ('b', 'b.txt', 'u2')")
+    conn.commit()
+    conn.close()
+    assert store.count() == 1
+    store.invalidate()
+    assert store.count() == 2 and list(store.by_user('u2')) == ['b']
+
+
+def test_add_counts_upload_in_community_stats(db, blobs):
+    store = FileStore(db, blobs)
+    add_file(store, blobs, 'a', 'x', user_id='u1')
+    add_file(store, blobs, 'b', 'y', user_id='u1')
+    add_file(store, blobs, 'c', 'z', user_id='u2')
+    conn = db()
+    stats = community_stats.get(conn)
+    conn.close()
+    assert stats['total_files'] == 3 and stats['active_authors'] == 2
+
+
+def test_page_cursors_walk_in_upload_order(db, blobs):
+    store = FileStore(db, blobs)
+    for i in range(7):
+        add_file(store, blobs, f'f{i}', str(i), upload_time=f'2024-01-0{i + 1}T00:00:00')
+
+    items, cursor = store.page(3)
+    assert [item['file_id'] for item in items] == ['f6', 'f5', 'f4']
+    items, cursor = store.page(3, cursor)
+    assert [item['file_id'] for item in items] == ['f3', 'f2', 'f1']
+    items, cursor = store.page(3, cursor)
+    assert [item['file_id'] for item in items] == ['f0'] and cursor is None
+
+
+def test_page_batches_file_ids_past_max_in_params(db, blobs):
+    store = FileStore(db, blobs)
+    conn = db()
+    conn.executemany('INSERT INTO files (id, filename, user_id, upload_time) VALUES (?, ?, ?, ?)',
+                     [(f'f{i:04d}', 'n', 'u1', f'2024-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}')
+                      for i in range(1300)])
+    conn.commit()
+    conn.close()
+
+    wanted = [f'f{i:04d}' for i in range(0, 1300)] + ['missing']
+    assert len(wanted) > 2 * file_store.MAX_IN_PARAMS
+    ids, cursor = [], None
+    while True:
+        items, cursor = store.page(200, cursor, file_ids=wanted)
+        ids.extend(item['file_id'] for item in items)
+        if cursor is None:
+            break
+    assert ids == [f'f{i:04d}' for i in range(1299, -1, -1)]
+
+
+def test_export_json_includes_content(db, blobs, tmp_path):
+    store = FileStore(db, blobs)
+    add_file(store, blobs, 'a', '正文A')
+    conn = db()
+    conn.execute("INSERT INTO files (id, filename, user_id, content) VALUES ('legacy', 'l.txt', 'u1', '旧正文')")
+    conn.commit()
+    conn.close()
+    store.invalidate()
+
+    path = tmp_path / 'files.json'
+    assert store.export_json(str(path)) == 2
+    exported = json.loads(path.read_text(encoding='utf-8'))
+    assert exported['a']['content'] == '正文A' and exported['a']['filename'] == 'a.txt'
+    assert exported['legacy']['content'] == '旧正文'
@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('langchain_core')
+from langchain_core.documents import Document  # noqa: E402
+
+import hybrid_retrieval  # noqa: E402
+from hybrid_retrieval import HybridRetriever, doc_key, reciprocal_rank_fusion  # noqa: E402
+
+
+def doc(file_id, text):
+    return Document(page_content=text, metadata={'file_id': file_id})
+
+
+class FakeCollection:
+    def __init__(self, hits):
+        self.hits = hits  # [(Document, 向量), ...]
+
+    def query(self, query_embeddings, n_results, include):
+        hits = self.hits[:n_results]
+        return {
+            'documents': [[d.page_content for d, _ in hits]],
+            'metadatas': [[dict(d.metadata) for d, _ in hits]],
+            'embeddings': [[vector for _, vector in hits]],
+            'distances': [[0.1 * i for i in range(len(hits))]],
+        }
+
+
+class FakeStore:
+    def __init__(self, hits):
+        self._collection = FakeCollection(hits)
+
+
+class FakeEmbeddings:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.embedded = []
+
+    def embed_query(self, text):
+        if self.fail:
+            raise RuntimeError('embedding API down')
+        return [1.0, 0.0]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[0.0, 1.0] for _ in texts]
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / 'chunks.db')
+    conn = sqlite3.connect(path)
+    hybrid_retrieval.create_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+    return lambda: sqlite3.connect(path)
+
+
+def index(connect, docs):
+    conn = connect()
+    hybrid_retrieval.index_chunks(conn, docs)
+    conn.commit()
+    conn.close()
+
+
+def test_rrf_orders_by_summed_reciprocal_rank():
+    a, b, c = doc('f1', 'alpha'), doc('f2', 'beta'), doc('f3', 'gamma')
+    fused = reciprocal_rank_fusion([('vector', [a, b]), ('lexical', [c, doc('f2', 'beta')])], rrf_k=60)
+    assert [d.page_content for d in fused] == ['beta', 'alpha', 'gamma']
+    assert fused[0].metadata['rrf_score'] == pytest.approx(1 / 62 + 1 / 62)
+    assert fused[0].metadata['retrieval_sources'] == 'vector,lexical'
+    assert fused[1].metadata['retrieval_sources'] == 'vector'
+    assert len(reciprocal_rank_fusion([('vector', [a, b, c])], top_k=2)) == 2
+
+
+def test_chunk_found_by_both_is_returned_once_with_stored_vector(connect):
+    shared = doc('f1', 'python programming guide')
+    index(connect, [shared, doc('f2', 'python snakes')])
+    embeddings = FakeEmbeddings()
+    retriever = HybridRetriever(lambda: FakeStore([(shared, [0.5, 0.5])]), connect, embeddings)
+
+    docs, query_embedding, vectors = retriever.retrieve('python')
+    keys = [doc_key(d) for d in docs]
+    assert len(keys) == len(set(keys)) == 2
+    assert docs[0].page_content == 'python programming guide'
+    assert docs[0].metadata['retrieval_sources'] == 'vector,lexical'
+    assert query_embedding == [1.0, 0.0]
+    assert vectors == [[0.5, 0.5], [0.0, 1.0]]
+    assert embeddings.embedded == ['python snakes']
+
+
+def test_lexical_only_when_vector_search_fails(connect):
+    index(connect, [doc('f1', 'python programming guide')])
+    retriever = HybridRetriever(lambda: FakeStore([]), connect, FakeEmbeddings(fail=True))
+
+    docs, query_embedding, vectors = retriever.retrieve('python')
+    assert [d.page_content for d in docs] == ['python programming guide']
+    assert docs[0].metadata['retrieval_sources'] == 'lexical'
+    assert query_embedding is None and vectors == [[0.0, 1.0]]
+
+
+def test_vector_only_when_lexical_search_fails(tmp_path):
+    hit = doc('f1', 'alpha')
+
+    def broken_connect():
+        return sqlite3.connect(str(tmp_path / 'missing-tables.db'))
+
+    retriever = HybridRetriever(lambda: FakeStore([(hit, [0.3, 0.4])]), broken_connect, FakeEmbeddings())
+    docs, _, vectors = retriever.retrieve('alpha')
+    assert [d.page_content for d in docs] == ['alpha'] and vectors == [[0.3, 0.4]]
+
+
+def test_both_paths_failing_raises_vector_error(tmp_path):
+    def broken_connect():
+        return sqlite3.connect(str(tmp_path / 'missing-tables.db'))
+
+    retriever = HybridRetriever(lambda: FakeStore([]), broken_connect, FakeEmbeddings(fail=True))
+    with pytest.raises(RuntimeError, match='embedding API down'):
+        retriever.retrieve('alpha')
@@ -0,0 +1,48 @@
+import pytest
+
+from listwise_rerank import build_prompt, parse_label, parse_verdicts
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('相关', True),
+    ('不相关', False),
+    ('相关。', True),
+    ('相关，内容直接回答了问题', True),
+    ('Yes', True),
+    ('not relevant', False),
+    ('no', False),
+    ('0.8', True),
+    ('3/10', False),
+    (7, True),
+    (False, False),
+    ('相关性较低', None),
+    ('是否相关无法判断', None),
+    ('nothing', None),
+    ('', None),
+])
+def test_parse_label(value, expected):
+    assert parse_label(value) is expected
+
+
+def test_bracket_markers_are_not_json():
+    assert parse_verdicts('[1] 不相关', 1) == {0: False}
+    assert parse_verdicts('[2] 不相关', 3) == {1: False}
+    assert parse_verdicts('[1] 相关\n[2] 不相关\n[3] 相关', 3) == {0: True, 1: False, 2: True}
+
+
+def test_json_formats():
+    text = '结果如下：[{"id": 2, "relevant": false}, {"id": 1, "relevant": true}] 以上'
+    assert parse_verdicts(text, 2) == {0: True, 1: False}
+    assert parse_verdicts('{"1": "相关", "2": "不相关"}', 2) == {0: True, 1: False}
+    assert parse_verdicts('["不相关", "相关"]', 2) == {0: False, 1: True}
+    assert parse_verdicts('[{"id": 1, "score": 0.9}] 注：[2] 未评估', 2) == {0: True}
+
+
+def test_line_formats_and_out_of_range():
+    text = '1: 相关\n2. 0.2\n文档3：是\n4、相关性较低\n9: 相关'
+    assert parse_verdicts(text, 4) == {0: True, 1: False, 2: True}
+
+
+def test_build_prompt_numbers_and_truncates():
+    prompt = build_prompt('问题', ['a' * 10, 'b'], max_chars=4)
+    assert '[1] aaaa...' in prompt and '[2] b' in prompt and '共 2 行' in prompt
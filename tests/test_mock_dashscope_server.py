@@ -0,0 +1,80 @@
+import json
+import threading
+import http.client
+
+import pytest
+
+from batch_embedder import BatchEmbedder
+from mock_dashscope_server import EMBEDDING_PATH, GENERATION_PATH, hash_embedding, make_server, parse_args
+
+
+@pytest.fixture
+def server():
+    def start(*argv):
+        instance = make_server(parse_args(['--port', '0', '--quiet', '--chunk-delay', '0', *argv]))
+        threading.Thread(target=instance.serve_forever, args=(0.05,), daemon=True).start()
+        started.append(instance)
+        return instance
+    started = []
+    yield start
+    for instance in started:
+        instance.shutdown()
+        instance.server_close()
+
+
+def post(server, path, payload, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=5)
+    conn.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json', **(headers or {})})
+    response = conn.getresponse()
+    body = response.read().decode('utf-8')
+    conn.close()
+    return response.status, body
+
+
+class MockEmbeddings:
+    """直接调用替身服务嵌入接口的最小客户端，出错时按 DashScope SDK 的方式带上状态码抛出"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def embed_documents(self, texts):
+        status, body = post(self.server, EMBEDDING_PATH, {'model': 'text-embedding-v2', 'input': {'texts': texts}})
+        if status != 200:
+            raise RuntimeError(f"status_code: {status}, body: {body[:60]}")
+        return [item['embedding'] for item in json.loads(body)['output']['embeddings']]
+
+
+def test_embeddings_are_deterministic_and_batch_capped(server):
+    instance = server('--max-batch', '3')
+    status, body = post(instance, EMBEDDING_PATH, {'model': 'text-embedding-v2', 'input': {'texts': ['区块链', '区块链']}})
+    assert status == 200
+    first, second = json.loads(body)['output']['embeddings']
+    assert first['embedding'] == second['embedding'] and len(first['embedding']) > 0
+    status, _ = post(instance, EMBEDDING_PATH, {'input': {'texts': ['a', 'b', 'c', 'd']}})
+    assert status == 400
+
+
+def test_generation_plain_and_stream(server):
+    instance = server('--reply', '答：{question}', '--chunk-size', '2')
+    payload = {'model': 'qwen-plus', 'input': {'messages': [{'role': 'user', 'content': '你好'}]},
+               'parameters': {'result_format': 'message', 'incremental_output': True}}
+    status, body = post(instance, GENERATION_PATH, payload)
+    assert status == 200
+    assert json.loads(body)['output']['choices'][0]['message']['content'] == '答：你好'
+
+    status, body = post(instance, GENERATION_PATH, payload, {'X-DashScope-SSE': 'enable'})
+    events = [json.loads(line[5:]) for line in body.splitlines() if line.startswith('data:')]
+    assert status == 200 and len(events) == 2
+    assert ''.join(e['output']['choices'][0]['message']['content'] for e in events) == '答：你好'
+    assert events[-1]['output']['choices'][0]['finish_reason'] == 'stop'
+
+
+def test_batch_embedder_recovers_from_injected_throttling(server):
+    instance = server('--throttle-rate', '0.3', '--seed', '7')
+    embedder = BatchEmbedder(MockEmbeddings(instance), batch_size=5, max_concurrency=2, max_retries=8,
+                             base_delay=0.001)
+    texts = [f'文档块{i}' for i in range(40)]
+    vectors, stats = embedder.embed(texts)
+    assert len(vectors) == 40 and stats['batches'] == 8
+    assert vectors[7] == hash_embedding(texts[7], len(vectors[7]))
+    assert instance.state.stats['injected_errors'] > 0
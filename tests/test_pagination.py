@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+import file_store
+from file_store import FileStore, FILE_COLUMNS, create_indexes
+from pagination import InvalidPageRequest, parse_limit, parse_fields, encode_cursor, decode_cursor, keyset_clause
+
+
+def test_parse_limit_and_fields():
+    assert parse_limit(None) == 50
+    assert parse_limit('500') == 200
+    with pytest.raises(InvalidPageRequest):
+        parse_limit('0')
+    with pytest.raises(InvalidPageRequest):
+        parse_limit('abc')
+    assert parse_fields('file_id, filename', ('file_id', 'filename')) == ('file_id', 'filename')
+    with pytest.raises(InvalidPageRequest):
+        parse_fields('content', ('file_id',))
+
+
+def test_cursor_roundtrip_and_clause():
+    cursor = encode_cursor('2024-01-01T00:00:00', '文件1')
+    assert decode_cursor(cursor) == ('2024-01-01T00:00:00', '文件1')
+    assert keyset_clause('t', 'id', None) == ('', [])
+    assert keyset_clause('t', 'id', cursor) == ('(t, id) < (?, ?)', ['2024-01-01T00:00:00', '文件1'])
+    with pytest.raises(InvalidPageRequest):
+        decode_cursor('not-a-cursor')
+
+
+@pytest.fixture
+def store(tmp_path):
+    db = str(tmp_path / 'files.db')
+    conn = sqlite3.connect(db)
+    conn.execute('CREATE TABLE files (id TEXT PRIMARY KEY, content TEXT, {})'.format(', '.join(FILE_COLUMNS)))
+    create_indexes(conn.cursor())
+    rows = [(f'f{i:03d}', f'name{i}', 'u1', f'2024-01-01T00:{i // 60:02d}:{i % 60:02d}') for i in range(120)]
+    rows += [('legacy1', 'legacy', 'u1', None), ('legacy2', 'legacy', 'u2', None)]
+    conn.executemany('INSERT INTO files (id, filename, user_id, upload_time) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    def connect():
+        c = sqlite3.connect(db)
+        c.row_factory = sqlite3.Row
+        return c
+    return FileStore(connect, blob_store=None)
+
+
+def walk(store, limit, **kwargs):
+    ids, cursor = [], None
+    while True:
+        items, cursor = store.page(limit, cursor, **kwargs)
+        ids.extend(item['file_id'] for item in items)
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_every_file_including_null_upload_time(store):
+    ids = walk(store, 7)
+    assert len(ids) == len(set(ids)) == 122
+    assert ids[0] == 'f119'
+    assert ids[-2:] == ['legacy2', 'legacy1']
+
+
+def test_file_ids_filter_is_batched(store, monkeypatch):
+    monkeypatch.setattr(file_store, 'MAX_IN_PARAMS', 10)
+    wanted = [f'f{i:03d}' for i in range(0, 120, 3)] + ['legacy1', 'missing']
+    ids = walk(store, 9, file_ids=wanted)
+    assert ids == sorted(set(wanted) - {'missing', 'legacy1'}, reverse=True) + ['legacy1']
+    assert walk(store, 5, file_ids=wanted, user_id='u2') == []
+    assert store.page(5, file_ids=[]) == ([], None)
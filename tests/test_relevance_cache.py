@@ -0,0 +1,31 @@
+import relevance_cache
+from relevance_cache import RelevanceVerdictCache, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question('  什么是 区块链？ ') == '什么是区块链'
+    assert normalize_question('What IS Web3?!') == 'whatisweb3'
+
+
+def test_hits_across_phrasing_and_invalidate_by_file():
+    cache = RelevanceVerdictCache()
+    cache.put_many('什么是区块链？', {('k1', 'f1'): True, ('k2', 'f2'): False})
+    assert cache.get_many('什么是区块链', ['k1', 'k2', 'k3']) == {'k1': True, 'k2': False}
+    assert cache.invalidate_files(['f1']) == 1
+    assert cache.get_many('什么是区块链', ['k1', 'k2']) == {'k2': False}
+    stats = cache.stats()
+    assert stats['hits'] == 3 and stats['misses'] == 2 and stats['entries'] == 1
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(relevance_cache.time, 'monotonic', lambda: now[0])
+    cache = RelevanceVerdictCache(ttl=10, max_entries=2)
+    cache.put_many('q', {('k1', 'f'): True, ('k2', 'f'): True})
+    cache.get_many('q', ['k1'])  # k1 变为最近使用
+    cache.put_many('q', {('k3', 'f'): False})
+    assert set(cache.get_many('q', ['k1', 'k2', 'k3'])) == {'k1', 'k3'}
+    now[0] += 11
+    assert cache.get_many('q', ['k1', 'k3']) == {}
+    assert cache.stats()['expired'] == 2 and cache.stats()['entries'] == 0
+    assert cache._keys_by_file == {}
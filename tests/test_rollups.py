@@ -0,0 +1,33 @@
+import sqlite3
+
+import rollups
+
+
+def make_tx(tx_type, timestamp, amount=1.0, **users):
+    tx = {'type': tx_type, 'timestamp': timestamp, 'amount': amount, 'file_id': 'f1'}
+    tx.update(users)
+    return tx
+
+
+def test_apply_and_read_user_rollup():
+    conn = sqlite3.connect(':memory:')
+    rollups.create_tables(conn.cursor())
+    rollups.apply_transactions(conn, [
+        make_tx('reward', '2024-01-02T10:00:00', 2.0, to_user='u1'),
+        make_tx('reference', '2024-01-02T11:00:00', 0.5, file_owner='u1'),
+        make_tx('spend', '2024-01-03T09:00:00', 1.5, from_user='u1'),
+    ])
+    day = rollups.get_user_rollup(conn, 'u1', 'day', '2024-01-02')
+    assert day == {'earned': 2.0, 'spent': 0.0, 'reward_count': 1, 'reference_count': 1, 'spend_count': 0}
+    month = rollups.get_user_rollup(conn, 'u1', 'month', '2024-01')
+    assert month['spent'] == 1.5 and month['spend_count'] == 1
+    assert rollups.get_user_rollup(conn, 'u2', 'day', '2024-01-02')['earned'] == 0.0
+
+
+def test_backfill_replaces_existing_rows():
+    conn = sqlite3.connect(':memory:')
+    rollups.create_tables(conn.cursor())
+    history = [make_tx('reward', '2024-01-02T10:00:00', 1.0, to_user='u1')] * 3
+    rollups.apply_transactions(conn, history)
+    assert rollups.backfill(conn, iter(history), batch_size=2) == 3
+    assert rollups.get_user_rollup(conn, 'u1', 'day', '2024-01-02')['earned'] == 3.0
@@ -0,0 +1,72 @@
+import sqlite3
+
+import search_index
+
+
+def make_index(files):
+    conn = sqlite3.connect(':memory:')
+    search_index.create_table(conn.cursor())
+    search_index.rebuild(conn, files)
+    return conn
+
+
+def test_tokenize_and_match():
+    assert search_index.tokenize('区块链 Web3') == '区块 块链 链 web3'
+    assert search_index.build_match('区块链 eth') == '"区块 块链" AND "eth"*'
+    assert search_index.build_match('  ') is None
+
+
+def test_search_ranks_and_pages():
+    conn = make_index([
+        ('20240101_0xabc', '区块链入门', '0xabc', '介绍区块链的基本概念'),
+        ('20240102_0xdef', '烹饪', '0xdef', '这篇文章顺带提到区块链'),
+        ('20240103_0xdef', '园艺', '0xdef', '与主题无关'),
+    ])
+    hits, cursor = search_index.search(conn, '区块链', limit=1)
+    assert [fid for fid, _ in hits] == ['20240101_0xabc']
+    more, cursor = search_index.search(conn, '区块链', limit=1, cursor=cursor)
+    assert [fid for fid, _ in more] == ['20240102_0xdef'] and cursor is None
+    assert search_index.count(conn, '区块链') == 2
+
+
+def test_file_id_substring_match():
+    conn = make_index([('20240101120000_0xabcdef', 'a', 'u', 'x'), ('20240102_0x99', 'b', 'u', 'y')])
+    hits, _ = search_index.search(conn, 'cde')
+    assert [fid for fid, _ in hits] == ['20240101120000_0xabcdef']
+    assert search_index.count(conn, '0101120000') == 1
+
+
+def test_snippet_escapes_html():
+    text = '<script>alert(1)</script> 区块链 & <b>'
+    snippet = search_index.snippet(text, '区块链')
+    assert '<script>' not in snippet and '&lt;script&gt;' in snippet
+    assert '<mark>区块链</mark>' in snippet and '&amp; &lt;b&gt;' in snippet
+    assert search_index.snippet('<i>无关</i>', 'zzz') == '&lt;i&gt;无关&lt;/i&gt;'
+
+
+def test_file_id_prefix_match_uses_key_index():
+    conn = make_index([('20240101_0xABC', 'a', 'u', 'x'), ('20240101_0xdef', 'b', 'u', 'y'),
+                       ('20240202_0x99', 'c', 'u', 'z')])
+    hits, _ = search_index.search(conn, '20240101')
+    assert sorted(fid for fid, _ in hits) == ['20240101_0xABC', '20240101_0xdef']
+    hits, _ = search_index.search(conn, '20240101_0xabc')
+    assert [fid for fid, _ in hits] == ['20240101_0xABC']
+
+    sql, params = search_index._file_id_hits(conn, '20240101')
+    plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    assert 'SEARCH' in plan and 'instr' not in sql
+    sql, _ = search_index._file_id_hits(conn, '0xdef')
+    assert 'instr' in sql
+
+
+def test_existing_index_gets_key_table_on_upgrade():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE VIRTUAL TABLE files_fts USING fts5(file_id UNINDEXED, filename, file_key, user_id, content)")
+    conn.execute("INSERT INTO files_fts (file_id) VALUES ('20240101_0xAbC')")
+    search_index.create_table(conn.cursor())
+    assert conn.execute('SELECT key, file_id FROM files_fts_keys').fetchall() == [('20240101_0xabc', '20240101_0xAbC')]
+
+    search_index.index_file(conn, '20240101_0xAbC', 'a', 'u', 'x')
+    assert conn.execute('SELECT COUNT(*) FROM files_fts_keys').fetchone()[0] == 1
+    search_index.rebuild(conn, [])
+    assert conn.execute('SELECT COUNT(*) FROM files_fts_keys').fetchone()[0] == 0
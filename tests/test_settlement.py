@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import community_stats
+import rollups
+from settlement import settle_rewards
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE users (user_id TEXT PRIMARY KEY, wallet_account TEXT,
+                        coin_balance REAL DEFAULT 0.0, total_earned REAL DEFAULT 0.0)
+    ''')
+    cursor.execute('''
+    CREATE TABLE files (id TEXT PRIMARY KEY, user_id TEXT, reference_count INTEGER, total_reward REAL)
+    ''')
+    cursor.execute('''
+    CREATE TABLE referenced_files (user_id TEXT, file_id TEXT, question TEXT, reward REAL,
+                                   timestamp TEXT, similarity REAL, weight REAL)
+    ''')
+    rollups.create_tables(cursor)
+    community_stats.create_table(cursor)
+    cursor.executemany('INSERT INTO users (user_id, wallet_account) VALUES (?, ?)',
+                       [('alice', '0xa'), ('bob', '0xb')])
+    cursor.executemany('INSERT INTO files (id, user_id) VALUES (?, ?)',
+                       [('f1', 'alice'), ('f2', 'alice'), ('f3', 'bob'), ('f4', 'ghost')])
+    conn.commit()
+    return conn
+
+
+def reward(file_id, owner, amount):
+    return {'file_id': file_id, 'file_owner': owner, 'reward': amount, 'weight': 0.5, 'similarity': 0.9}
+
+
+def balances(conn):
+    return {row['user_id']: (row['coin_balance'], row['total_earned'])
+            for row in conn.execute('SELECT * FROM users')}
+
+
+def test_balances_summed_per_owner_and_missing_owner_skipped(conn):
+    settled, transactions = settle_rewards(conn, 'payer', 'q?', [
+        reward('f1', 'alice', 1.0),
+        reward('f2', 'alice', 2.5),
+        reward('f3', 'bob', 0.5),
+        reward('f4', 'ghost', 9.0),
+        reward('f3', 'bob', 0.0),
+    ])
+
+    assert [(s['file_id'], s['wallet_account']) for s in settled] == [('f1', '0xa'), ('f2', '0xa'), ('f3', '0xb')]
+    assert balances(conn) == {'alice': (3.5, 3.5), 'bob': (0.5, 0.5)}
+    assert len(transactions) == 6
+    assert conn.execute('SELECT COUNT(*) FROM referenced_files').fetchone()[0] == 3
+    f1 = conn.execute("SELECT reference_count, total_reward FROM files WHERE id = 'f1'").fetchone()
+    assert tuple(f1) == (1, 1.0)
+    assert conn.execute("SELECT reference_count FROM files WHERE id = 'f4'").fetchone()[0] is None
+
+
+def test_rollups_and_community_stats_updated(conn):
+    settled, transactions = settle_rewards(conn, 'payer', 'q?', [reward('f1', 'alice', 1.0),
+                                                                  reward('f3', 'bob', 2.0)])
+    bucket = transactions[0]['timestamp'][:10]
+    assert rollups.get_user_rollup(conn, 'alice', 'day', bucket)['earned'] == 1.0
+    assert rollups.get_user_rollup(conn, 'bob', 'day', bucket)['reward_count'] == 1
+    stats = community_stats.get(conn)
+    assert stats['total_references'] == 2 and stats['total_rewards'] == 3.0
+
+
+def test_nothing_to_settle_writes_nothing(conn):
+    assert settle_rewards(conn, 'payer', 'q?', [reward('f4', 'ghost', 1.0)]) == ([], [])
+    assert community_stats.get(conn)['total_references'] == 0
+
+
+def test_failure_partway_rolls_back_everything(conn, monkeypatch):
+    def fail(*args):
+        raise sqlite3.OperationalError('disk I/O error')
+    monkeypatch.setattr(community_stats, 'record_rewards', fail)
+
+    with pytest.raises(sqlite3.OperationalError):
+        settle_rewards(conn, 'payer', 'q?', [reward('f1', 'alice', 1.0)])
+
+    assert balances(conn) == {'alice': (0.0, 0.0), 'bob': (0.0, 0.0)}
+    assert conn.execute('SELECT COUNT(*) FROM referenced_files').fetchone()[0] == 0
+    assert conn.execute("SELECT reference_count FROM files WHERE id = 'f1'").fetchone()[0] is None
+    assert conn.execute('SELECT COUNT(*) FROM user_earnings_rollup').fetchone()[0] == 0
@@ -0,0 +1,101 @@
+import time
+import threading
+
+from speculative_generation import SpeculativeAnswer
+
+
+class FakeStream:
+    """逐块产出文本的流；gates[i] 不为 None 时，第 i 块要等该事件触发后才返回"""
+
+    def __init__(self, chunks, gates=None, error=None):
+        self.chunks = list(chunks)
+        self.gates = gates or {}
+        self.error = error
+        self.position = 0
+        self.closed = False
+        self.returned = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        gate = self.gates.get(self.position)
+        if gate is not None:
+            gate.wait(5)
+        if self.position >= len(self.chunks):
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        text = self.chunks[self.position]
+        self.position += 1
+        self.returned += 1
+        return text
+
+    def close(self):
+        self.closed = True
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.005)
+
+
+def test_release_yields_everything_in_order():
+    stream = FakeStream(['你', '好', '！'])
+    speculation = SpeculativeAnswer(lambda prompt: stream, 'p')
+    assert ''.join(speculation.release()) == '你好！'
+    speculation._thread.join(5)
+    assert stream.closed
+    assert speculation.discard() is None
+    assert speculation.cost()['finished'] is True
+
+
+def test_release_reraises_generation_error_after_text():
+    stream = FakeStream(['部分'], error=RuntimeError('boom'))
+    speculation = SpeculativeAnswer(lambda prompt: stream, 'p')
+    received = []
+    try:
+        for text in speculation.release():
+            received.append(text)
+    except RuntimeError as e:
+        assert str(e) == 'boom'
+    else:
+        raise AssertionError('应抛出生成错误')
+    assert ''.join(received) == '部分'
+
+
+def test_discard_between_chunks_closes_stream_immediately():
+    gate = threading.Event()
+    stream = FakeStream(['a', 'b'], gates={0: gate})
+    speculation = SpeculativeAnswer(lambda prompt: stream, 'p')
+    with speculation._condition:
+        gate.set()
+        # 后台线程已取到第一块、正等待写入缓存，此时不在 next() 中
+        wait_until(lambda: stream.returned == 1 and not speculation._stream_lock.locked())
+        cost = speculation.discard()
+        assert stream.closed
+    speculation._thread.join(5)
+    assert stream.returned == 1
+    assert cost['finished'] is False
+
+
+def test_discard_while_waiting_stops_at_next_chunk_and_measures_to_cancel():
+    gate = threading.Event()
+    stream = FakeStream(['a', 'b', 'c'], gates={1: gate})
+    speculation = SpeculativeAnswer(lambda prompt: stream, 'p')
+    wait_until(lambda: len(speculation._parts) == 1)
+
+    cost = speculation.discard()
+    assert cost['chunks'] == 1 and cost['chars'] == 1
+    time.sleep(0.05)
+    gate.set()
+    speculation._thread.join(5)
+
+    assert stream.closed
+    assert stream.returned == 2  # 等待中的那一块返回后不再继续读取
+    assert speculation._parts == ['a']
+    later = speculation.cost()
+    assert later['seconds'] == speculation.cancelled_at - speculation.started_at
+    assert later['seconds'] <= cost['seconds'] + 0.001
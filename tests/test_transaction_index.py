@@ -0,0 +1,26 @@
+from transaction_index import TransactionIndex
+
+
+def make_tx(i, tx_type, from_user, to_user, file_id, amount):
+    return {'id': f'tx{i}', 'type': tx_type, 'from_user': from_user, 'to_user': to_user,
+            'file_id': file_id, 'amount': amount, 'timestamp': f'2024-01-01T00:00:{i:02d}'}
+
+
+def test_recent_merges_fields_newest_first():
+    index = TransactionIndex()
+    index.add(make_tx(0, 'reward', 'system', 'u1', 'f1', 1.0))
+    index.add(make_tx(1, 'spend', 'u1', 'u2', 'f2', 2.0))
+    index.add(make_tx(2, 'reference', 'u2', 'u1', 'f1', 0.5))
+    assert [tx['id'] for tx in index.recent('u1', 2)] == ['tx2', 'tx1']
+    assert [tx['id'] for tx in index.recent('u1', 10, fields=('to_user',))] == ['tx2', 'tx0']
+
+
+def test_counts_and_user_totals():
+    index = TransactionIndex()
+    index.add(make_tx(0, 'reward', 'system', 'u1', 'f1', 1.0))
+    index.add(make_tx(1, 'reference', 'u2', 'u1', 'f1', 0.5))
+    index.add(make_tx(2, 'reference', 'u3', 'u1', 'f1', 0.5))
+    index.add(make_tx(3, 'spend', 'u1', 'u2', 'f2', 2.0))
+    assert index.count('file_id', 'f1', 'reference') == 2
+    assert index.count('file_id', 'missing', 'reference') == 0
+    assert index.user_totals('u1') == (2.0, 2.0, 2)
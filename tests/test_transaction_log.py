@@ -0,0 +1,80 @@
+import threading
+
+from transaction_log import TransactionLog
+
+
+def make_tx(i, ts, user='u1', file_id=None):
+    return {'id': f'tx{i}', 'type': 'reward', 'from_user': 'system', 'to_user': user,
+            'file_id': file_id or f'f{i % 3}', 'amount': 1.0, 'timestamp': ts}
+
+
+def test_lookup_and_reopen(tmp_path):
+    log = TransactionLog(str(tmp_path / 'log'))
+    log.append_many([make_tx(i, f'2024-01-01T00:00:{i:02d}') for i in range(10)])
+    assert len(log.by_user('u1')) == 10
+    assert [tx['id'] for tx in log.by_file('f0')] == ['tx0', 'tx3', 'tx6', 'tx9']
+    log.close()
+
+    reopened = TransactionLog(str(tmp_path / 'log'))
+    assert reopened.count() == 10
+    assert len(reopened.by_time_range('2024-01-01T00:00:03', '2024-01-01T00:00:06')) == 3
+    reopened.close()
+
+
+def test_rotation_keeps_indexes(tmp_path):
+    log = TransactionLog(str(tmp_path / 'log'), segment_max_bytes=400)
+    log.append_many([make_tx(i, f'2024-01-01T00:00:{i:02d}') for i in range(20)])
+    assert len(log._segments) > 1
+    assert len(log.by_user('u1')) == 20
+    assert len(log.by_time_range('2024-01-01T00:00:05', '2024-01-01T00:00:15')) == 10
+    log.close()
+
+
+def test_out_of_order_timestamps_stay_in_range(tmp_path):
+    log = TransactionLog(str(tmp_path / 'log'))
+    # 并发写入方在拿锁之前生成时间戳，落盘顺序可能与时间戳顺序不同
+    for i, second in enumerate([1, 3, 2, 5, 4, 0]):
+        log.append(make_tx(i, f'2024-01-01T00:00:{second:02d}'))
+    in_range = log.by_time_range('2024-01-01T00:00:01', '2024-01-01T00:00:04')
+    assert sorted(tx['timestamp'][-2:] for tx in in_range) == ['01', '02', '03']
+    assert len(log.by_time_range('2024-01-01T00:00:00')) == 6
+    log.close()
+
+    reopened = TransactionLog(str(tmp_path / 'log'))
+    assert len(reopened.by_time_range(end='2024-01-01T00:00:02')) == 2
+    reopened.close()
+
+
+def test_concurrent_readers_never_see_unflushed_offsets(tmp_path):
+    log = TransactionLog(str(tmp_path / 'log'), fsync_batch=10 ** 6)
+    errors = []
+    stop = threading.Event()
+
+    def writer(worker):
+        try:
+            for i in range(300):
+                log.append(make_tx(f'{worker}-{i}', f'2024-01-01T00:{i // 60:02d}:{i % 60:02d}', file_id='f'))
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                log.by_user('u1')
+                log.by_time_range('2024-01-01T00:00:00')
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=writer, args=(w,)) for w in range(3)]
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert len(log.by_user('u1')) == 900
+    log.close()
@@ -0,0 +1,84 @@
+# transaction_index.py - 交易记录的内存索引视图
+"""
+启动时从交易日志构建一次，之后随每条新交易增量更新。
+
+个人主页和仪表盘通过这里取用户最近的交易，以及按 to_user / from_user / file_id 累计的笔数和金额，
+不再遍历全部交易。
+"""
+import threading
+from collections import defaultdict
+from heapq import nlargest
+
+from transaction_log import INDEXED_FIELDS
+
+
+class TransactionIndex:
+    """按字段值索引的交易视图
+
+    - 每个 (字段, 值) 保存按写入顺序排列的交易列表（recent 使用）
+    - 每个 (字段, 值, 交易类型) 维护 [笔数, 金额合计]
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(list)
+        self._aggregates = defaultdict(lambda: [0, 0.0])
+
+    @classmethod
+    def from_log(cls, transaction_log):
+        """从交易日志构建索引，并订阅后续追加"""
+        index = cls()
+        count = 0
+        for tx in transaction_log.iter_all():
+            index.add(tx)
+            count += 1
+        transaction_log.subscribe(index.add)
+        print(f"✅ 交易索引构建完成，共 {count} 条交易")
+        return index
+
+    def add(self, tx):
+        tx_type = tx.get('type')
+        amount = tx.get('amount') or 0.0
+        with self._lock:
+            for field in INDEXED_FIELDS:
+                value = tx.get(field)
+                if not value:
+                    continue
+                self._by_key[(field, value)].append(tx)
+                agg = self._aggregates[(field, value, tx_type)]
+                agg[0] += 1
+                agg[1] += amount
+
+    # ---------- 查询 ----------
+
+    def _aggregate(self, field, value, tx_type):
+        with self._lock:
+            return tuple(self._aggregates.get((field, value, tx_type), (0, 0.0)))
+
+    def count(self, field, value, tx_type):
+        """(字段, 值) 下某类型交易的笔数"""
+        return self._aggregate(field, value, tx_type)[0]
+
+    def total(self, field, value, tx_type):
+        """(字段, 值) 下某类型交易的金额合计"""
+        return self._aggregate(field, value, tx_type)[1]
+
+    def recent(self, user_id, limit, fields=('from_user', 'to_user')):
+        """用户在给定字段上出现过的最近 limit 条交易，按时间倒序
+
+        每个列表按写入顺序（即时间顺序）排列，只需取各列表尾部合并。
+        """
+        candidates = {}
+        with self._lock:
+            for field in fields:
+                for tx in self._by_key.get((field, user_id), ())[-limit:]:
+                    candidates[tx['id']] = tx
+        return nlargest(limit, candidates.values(), key=lambda tx: tx['timestamp'])
+
+    def user_totals(self, user_id):
+        """用户的 (总收益, 总支出, 被引用次数)，与 calculate_user_earnings 的口径一致"""
+        total_earned = (self.total('to_user', user_id, 'reward')
+                        + self.total('to_user', user_id, 'reference'))
+        total_spent = self.total('from_user', user_id, 'spend')
+        reference_count = self.count('to_user', user_id, 'reference')
+        return total_earned, total_spent, reference_count
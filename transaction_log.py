@@ -0,0 +1,390 @@
+# transaction_log.py - 追加写入的分段交易日志
+"""
+交易记录以 JSONL 分段文件追加写入，替代每次全量重写 transactions.json。
+
+目录结构:
+    transaction_log/
+        manifest.json            分段清单（仅在轮转/关闭时重写）
+        segment_000001.jsonl     交易记录，每行一条
+        segment_000001.idx       已关闭分段的偏移索引
+        segment_000002.jsonl     当前写入分段
+
+写入为 O(1)：追加一行并按批次 fsync；分段超过大小上限时轮转。
+按用户、文件或时间范围读取时通过偏移索引直接 seek，不解析全部历史。
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left, bisect_right
+
+# 建立偏移索引的字段
+INDEXED_FIELDS = ('to_user', 'from_user', 'file_owner', 'file_id')
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _segment_name(segment_id):
+    return f"segment_{segment_id:06d}.jsonl"
+
+
+def _index_name(segment_id):
+    return f"segment_{segment_id:06d}.idx"
+
+
+class _SegmentIndex:
+    """单个分段的偏移索引：字段值 -> 行偏移列表，以及 (时间戳, 偏移) 列表"""
+
+    def __init__(self):
+        self.keys = {field: {} for field in INDEXED_FIELDS}
+        self.times = []
+        self.offsets = []
+
+    def add(self, tx, offset):
+        for field in INDEXED_FIELDS:
+            value = tx.get(field)
+            if value:
+                self.keys[field].setdefault(value, []).append(offset)
+        ts = tx.get('timestamp') or ''
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.offsets.append(offset)
+        else:
+            # 调用方在拿到写锁之前生成时间戳，并发写入时个别记录会晚于更新的记录落盘，按时间插入保持有序
+            position = bisect_right(self.times, ts)
+            self.times.insert(position, ts)
+            self.offsets.insert(position, offset)
+
+    def lookup(self, field, value):
+        return self.keys[field].get(value, [])
+
+    def range(self, start=None, end=None):
+        """返回时间戳落在 [start, end) 内的偏移（times 始终按时间戳排序）"""
+        lo = bisect_left(self.times, start) if start else 0
+        hi = bisect_left(self.times, end) if end else len(self.times)
+        return self.offsets[lo:hi]
+
+    def to_json(self):
+        return {'keys': self.keys, 'times': self.times, 'offsets': self.offsets}
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        for field in INDEXED_FIELDS:
+            index.keys[field] = data.get('keys', {}).get(field, {})
+        index.times = data.get('times', [])
+        index.offsets = data.get('offsets', [])
+        return index
+
+
+class TransactionLog:
+    """追加写入的分段交易日志
+
+    Args:
+        directory: 日志目录
+        segment_max_bytes: 单个分段的大小上限，超过后轮转
+        fsync_batch: 累计多少条未落盘记录后执行一次 fsync
+        fsync_interval: 未落盘记录最长等待时间（秒），由后台线程兜底 fsync
+        legacy_json: 旧版 transactions.json 路径，首次创建日志时导入
+    """
+
+    def __init__(self, directory='transaction_log', segment_max_bytes=4 * 1024 * 1024,
+                 fsync_batch=32, fsync_interval=0.2, legacy_json=None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.RLock()
+        self._segments = []          # manifest 中的分段信息
+        self._indexes = {}           # segment_id -> _SegmentIndex
+        self._active_file = None
+        self._pending_sync = 0
+        self._last_sync = time.time()
+        self._closed = False
+        self._listeners = []
+
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            self._load_manifest()
+        else:
+            self._segments = [self._new_segment_info(1)]
+            self._indexes[1] = _SegmentIndex()
+            # 没有 manifest 说明日志尚未完整建立（包括导入中途崩溃），清空残留分段重新开始
+            self._open_active(truncate=True)
+            if legacy_json and os.path.exists(legacy_json):
+                self._import_legacy(legacy_json)
+            self._write_manifest()
+
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._sync_thread.start()
+
+    # ---------- manifest ----------
+
+    @staticmethod
+    def _new_segment_info(segment_id):
+        return {
+            'id': segment_id,
+            'file': _segment_name(segment_id),
+            'records': 0,
+            'bytes': 0,
+            'first_ts': None,
+            'last_ts': None,
+            'closed': False
+        }
+
+    def _write_manifest(self):
+        manifest = {'version': MANIFEST_VERSION, 'segments': self._segments}
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_manifest(self):
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self._segments = manifest.get('segments') or [self._new_segment_info(1)]
+
+        for info in self._segments[:-1]:
+            index_path = os.path.join(self.directory, _index_name(info['id']))
+            if os.path.exists(index_path):
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self._indexes[info['id']] = _SegmentIndex.from_json(json.load(f))
+            else:
+                # 索引文件丢失时从分段重建
+                self._indexes[info['id']] = self._scan_segment(info)
+                self._write_index(info['id'])
+
+        # 当前写入分段的索引不落盘，启动时扫描重建（大小受 segment_max_bytes 限制）
+        active = self._segments[-1]
+        self._indexes[active['id']] = self._scan_segment(active)
+        self._open_active()
+
+    def _scan_segment(self, info):
+        """扫描分段文件重建索引，同时修正 manifest 中的统计信息并截断不完整的尾行"""
+        index = _SegmentIndex()
+        path = os.path.join(self.directory, info['file'])
+        records = 0
+        valid_bytes = 0
+        first_ts = last_ts = None
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        tx = json.loads(line)
+                    except ValueError:
+                        break
+                    index.add(tx, offset)
+                    records += 1
+                    offset += len(line)
+                    valid_bytes = offset
+                    ts = tx.get('timestamp') or ''
+                    first_ts = ts if first_ts is None else min(first_ts, ts)
+                    last_ts = ts if last_ts is None else max(last_ts, ts)
+            if valid_bytes < os.path.getsize(path):
+                print(f"⚠️ 交易日志分段 {info['file']} 尾部不完整，截断到 {valid_bytes} 字节")
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+        info.update(records=records, bytes=valid_bytes, first_ts=first_ts, last_ts=last_ts)
+        return index
+
+    def _write_index(self, segment_id):
+        path = os.path.join(self.directory, _index_name(segment_id))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._indexes[segment_id].to_json(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _import_legacy(self, legacy_json):
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                transactions = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 无法导入旧交易记录 {legacy_json}: {e}")
+            return
+        # 时间范围索引依赖时间戳单调，导入前按时间排序
+        transactions.sort(key=lambda tx: tx.get('timestamp', ''))
+        self.append_many(transactions)
+        self.sync()
+        print(f"✅ 已从 {legacy_json} 导入 {len(transactions)} 条交易记录到追加日志")
+
+    # ---------- 写入 ----------
+
+    def _open_active(self, truncate=False):
+        active = self._segments[-1]
+        mode = 'wb' if truncate else 'ab'
+        self._active_file = open(os.path.join(self.directory, active['file']), mode)
+
+    def _rotate(self):
+        """关闭当前分段，写入其索引并开启新分段"""
+        self._fsync_active()
+        self._active_file.close()
+
+        active = self._segments[-1]
+        active['closed'] = True
+        self._write_index(active['id'])
+
+        new_id = active['id'] + 1
+        self._segments.append(self._new_segment_info(new_id))
+        self._indexes[new_id] = _SegmentIndex()
+        self._open_active()
+        self._write_manifest()
+        print(f"🔄 交易日志轮转: {active['file']} -> {_segment_name(new_id)}")
+
+    def _append_locked(self, tx):
+        line = (json.dumps(tx, ensure_ascii=False) + '\n').encode('utf-8')
+        active = self._segments[-1]
+        if active['bytes'] and active['bytes'] + len(line) > self.segment_max_bytes:
+            self._rotate()
+            active = self._segments[-1]
+
+        offset = active['bytes']
+        self._active_file.write(line)
+        self._indexes[active['id']].add(tx, offset)
+
+        active['bytes'] += len(line)
+        active['records'] += 1
+        ts = tx.get('timestamp') or ''
+        active['first_ts'] = ts if active['first_ts'] is None else min(active['first_ts'], ts)
+        active['last_ts'] = ts if active['last_ts'] is None else max(active['last_ts'], ts)
+        self._pending_sync += 1
+
+    def append(self, tx):
+        """追加一条交易记录"""
+        self.append_many([tx])
+
+    def append_many(self, transactions):
+        """追加多条交易记录，一次写入、一次 flush"""
+        if not transactions:
+            return
+        with self._lock:
+            for tx in transactions:
+                self._append_locked(tx)
+            self._active_file.flush()
+            if self._pending_sync >= self.fsync_batch:
+                self._fsync_active()
+        for listener in self._listeners:
+            for tx in transactions:
+                try:
+                    listener(tx)
+                except Exception as e:
+                    print(f"❌ 交易日志监听器出错: {e}")
+
+    def subscribe(self, listener):
+        """注册追加回调，每条新交易写入后调用 listener(tx)"""
+        self._listeners.append(listener)
+
+    def _fsync_active(self):
+        if self._pending_sync and self._active_file:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._pending_sync = 0
+        self._last_sync = time.time()
+
+    def sync(self):
+        """立即将未落盘的记录 fsync 到磁盘"""
+        with self._lock:
+            self._fsync_active()
+
+    def _sync_loop(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            if self._pending_sync and time.time() - self._last_sync >= self.fsync_interval:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"❌ 交易日志 fsync 失败: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._fsync_active()
+            self._active_file.close()
+            self._write_manifest()
+
+    # ---------- 读取 ----------
+
+    def _read_offsets(self, segment_id, offsets):
+        if not offsets:
+            return []
+        path = os.path.join(self.directory, _segment_name(segment_id))
+        results = []
+        with open(path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                results.append(json.loads(f.readline()))
+        return results
+
+    def _snapshot(self, select):
+        """在锁内 flush 写入分段，并对每个分段调用 select(info, index) 复制出要读取的偏移
+
+        偏移必须在锁内复制：写入方先写缓冲区、再更新索引，锁外读到的偏移可能指向尚未 flush 的数据。
+        """
+        with self._lock:
+            self._active_file.flush()
+            return [(info['id'], list(select(info, self._indexes[info['id']]))) for info in self._segments]
+
+    def _lookup(self, fields, value):
+        def select(info, index):
+            offsets = set()
+            for field in fields:
+                offsets.update(index.lookup(field, value))
+            return sorted(offsets)
+
+        results = []
+        for segment_id, offsets in self._snapshot(select):
+            results.extend(self._read_offsets(segment_id, offsets))
+        return results
+
+    def by_user(self, user_id):
+        """该用户作为付款方或收款方的全部交易"""
+        return self._lookup(('from_user', 'to_user'), user_id)
+
+    def by_file_owner(self, user_id):
+        """该用户作为文件所有者的全部交易"""
+        return self._lookup(('file_owner',), user_id)
+
+    def by_file(self, file_id):
+        """与该文件相关的全部交易"""
+        return self._lookup(('file_id',), file_id)
+
+    def by_time_range(self, start=None, end=None):
+        """时间戳在 [start, end) 内的交易，start/end 为 ISO 格式字符串"""
+        def select(info, index):
+            if info['first_ts'] is None:
+                return []
+            if start and info['last_ts'] < start:
+                return []
+            if end and info['first_ts'] >= end:
+                return []
+            return index.range(start, end)
+
+        results = []
+        for segment_id, offsets in self._snapshot(select):
+            results.extend(self._read_offsets(segment_id, offsets))
+        return results
+
+    def iter_all(self):
+        """按写入顺序遍历全部交易（仅用于导出、回填等离线场景）"""
+        for segment_id, _ in self._snapshot(lambda info, index: ()):
+            path = os.path.join(self.directory, _segment_name(segment_id))
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        yield json.loads(line)
+
+    def count(self):
+        with self._lock:
+            return sum(info['records'] for info in self._segments)
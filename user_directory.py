@@ -0,0 +1,126 @@
+# user_directory.py - 基于SQLite users表的用户目录
+"""
+钱包地址 -> 用户ID 的解析与注册统一走SQLite users表（user_id 主键、wallet_account 唯一索引），
+热点钱包缓存在进程内LRU中，查询和注册不随用户规模增长。
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+def sync_from_json(conn, users_json_path):
+    """把 users.json 中存在但users表中缺失的用户补录到users表
+
+    旧版 connect_wallet 会分别写入 users.json 和users表，两边可能不一致。
+    """
+    with open(users_json_path, 'r', encoding='utf-8') as f:
+        users = json.load(f)
+    rows = []
+    for user_id, user_data in users.items():
+        rows.append((
+            user_id,
+            user_data['password_hash'],
+            user_data.get('coin_balance', 1.0),
+            user_data.get('total_earned', 0.0),
+            user_data.get('total_spent', 0.0),
+            user_data.get('registration_time') or datetime.now().isoformat(),
+            user_data.get('wallet_account')
+        ))
+    before = conn.total_changes
+    conn.executemany('''
+    INSERT OR IGNORE INTO users (user_id, password_hash, coin_balance, total_earned, total_spent, registration_time, wallet_account)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return conn.total_changes - before
+
+
+class UserDirectory:
+    """用户目录
+
+    Args:
+        connect: 返回 sqlite3 连接（row_factory 为 sqlite3.Row）的函数
+        cache_size: LRU缓存的钱包数量上限
+    """
+
+    def __init__(self, connect, cache_size=10000):
+        self._connect = connect
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # 钱包地址或用户ID -> 用户ID
+        self._lock = threading.Lock()
+
+    def _cache_get(self, key):
+        with self._lock:
+            user_id = self._cache.get(key)
+            if user_id is not None:
+                self._cache.move_to_end(key)
+            return user_id
+
+    def _cache_put(self, key, user_id):
+        with self._lock:
+            self._cache[key] = user_id
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def resolve(self, wallet_address):
+        """把钱包地址解析为用户ID：先按 user_id 主键查找，再按 wallet_account 唯一索引查找
+
+        Returns:
+            用户ID，未注册时返回 None
+        """
+        if not wallet_address:
+            return None
+        user_id = self._cache_get(wallet_address)
+        if user_id is not None:
+            return user_id
+
+        conn = self._connect()
+        row = conn.execute('SELECT user_id FROM users WHERE user_id = ?', (wallet_address,)).fetchone()
+        if not row:
+            row = conn.execute('SELECT user_id FROM users WHERE wallet_account = ?', (wallet_address,)).fetchone()
+        conn.close()
+
+        if not row:
+            return None
+        self._cache_put(wallet_address, row['user_id'])
+        return row['user_id']
+
+    def exists(self, wallet_address):
+        return self.resolve(wallet_address) is not None
+
+    def find_by_wallet(self, wallet_address):
+        """只按 wallet_account 查找，返回用户行或 None"""
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM users WHERE wallet_account = ?', (wallet_address,)).fetchone()
+        conn.close()
+        return row
+
+    def register(self, user_id, password_hash, wallet_account=None, coin_balance=1.0):
+        """注册新用户，用户ID或钱包地址已存在时返回 False"""
+        conn = self._connect()
+        cursor = conn.execute('''
+        INSERT OR IGNORE INTO users (user_id, password_hash, coin_balance, total_earned, total_spent, registration_time, wallet_account)
+        VALUES (?, ?, ?, 0.0, 0.0, ?, ?)
+        ''', (user_id, password_hash, coin_balance, datetime.now().isoformat(), wallet_account))
+        created = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+
+        if created:
+            self._cache_put(user_id, user_id)
+            if wallet_account:
+                self._cache_put(wallet_account, user_id)
+        return created
+
+    def bind_wallet(self, user_id, wallet_account):
+        conn = self._connect()
+        conn.execute('UPDATE users SET wallet_account = ? WHERE user_id = ?', (wallet_account, user_id))
+        conn.commit()
+        conn.close()
+        self._cache_put(wallet_account, user_id)